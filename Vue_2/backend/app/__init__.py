@@ -2,28 +2,151 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
-from flask import Flask
+from flask import Flask, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from .boya_database import BoyaDatabase
+from .maintenance import MaintenanceScheduler, register_default_jobs
+from .executor import BlockingExecutor
+from .group_commit import GroupCommitter
+from .jobs import JobQueue, register_default_handlers
+from .tag_cache import TagCache
+from .llm_client import LLMClient
+from .tag_suggest import TagSuggester
+from .token_cache import TokenCache
+from .entity_cache import EntityCache
+from .presence import PresenceRegistry
+from .socketio_queue import message_queue_options
+from .typing_indicator import TypingCoalescer
+from .uploads import UploadRequest
+from .exceptions import UploadRejected
 
 db = BoyaDatabase()
 socketio = SocketIO()
+scheduler = MaintenanceScheduler()
+executor = BlockingExecutor()
+group_commit = GroupCommitter()
+jobs = JobQueue()
+tag_cache = TagCache()
+llm_client = LLMClient()
+tag_suggester = TagSuggester()
+token_cache = TokenCache()
+entity_cache = EntityCache()
+presence = PresenceRegistry()
+typing_coalescer = TypingCoalescer()
 
-def create_app(test_config=None):
-    
+def create_app(test_config=None, config_overrides=None):
+    """
+    test_config: 测试用配置，传入时不再读取 instance/config.py
+    config_overrides: 运行时覆盖项（run.py 从 Hydra 配置转换而来），最后生效
+    """
     app = Flask(__name__, instance_relative_config=True)
+    # 上传文件流式写入图片目录，边收边检查大小和类型（见 uploads.py）
+    app.request_class = UploadRequest
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'market.db'),
         UPLOAD_FOLDER=os.path.join(app.root_path, 'static/images'),
-        MAX_CONTENT_LENGTH=16 * 1024 * 1024
+        MAX_CONTENT_LENGTH=16 * 1024 * 1024,
+        TOKEN_CACHE_SIZE=4096,                  # 已验证 JWT 的缓存条数（LRU，到 exp 失效），0 表示每次完整验证
+        # User / Item 按 id 查询的进程内缓存（见 entity_cache.py），条数或 TTL 为 0 时只保留请求内的 identity map
+        ENTITY_CACHE_SIZE=2048,
+        ENTITY_CACHE_TTL=30,                    # 秒，其他进程的修改最多这么久之后可见
+        MAINTENANCE_CACHE_STATS_INTERVAL=600,   # 秒，把缓存命中率等统计写入日志的间隔，<= 0 表示不注册
+        UPLOAD_MAX_FILE_SIZE=10 * 1024 * 1024,  # 单个上传文件的上限，接收过程中超过即中止
+        UPLOAD_MAX_FORM_MEMORY=512 * 1024,      # multipart 解析缓冲区上限
+        ITEM_LOCK_EXPIRY_HOURS=24,
+        MAINTENANCE_LOCK_SWEEP_INTERVAL=60,     # 秒，<= 0 表示不注册该任务
+        # SQLite 连接与 PRAGMA，见 conf/ 中的 database 配置
+        DB_POOL_SIZE=8,                         # 每个进程保留的长连接数，0 表示每个请求新建连接
+        DB_JOURNAL_MODE='WAL',
+        DB_SYNCHRONOUS='NORMAL',
+        DB_FOREIGN_KEYS=True,
+        DB_BUSY_TIMEOUT_MS=5000,
+        DB_CACHE_SIZE_KB=16384,
+        DB_MMAP_SIZE_MB=256,
+        # 把 sqlite3 / pbkdf2 等阻塞调用放到真实线程池执行，避免卡住 eventlet hub（默认开启，False 时直接在当前线程调用）
+        OFFLOAD_BLOCKING=True,
+        OFFLOAD_THREADS=8,
+        # 消息组提交：窗口内的并发消息合并为一次事务提交，0 表示不启用（每条消息单独提交）
+        MESSAGE_GROUP_COMMIT_WINDOW_MS=0,
+        MESSAGE_GROUP_COMMIT_MAX_BATCH=64,
+        # 在线状态（见 presence.py）：memory 只看本进程的连接；sqlite 通过 presence 表在多个服务进程间共享
+        PRESENCE_BACKEND='memory',
+        PRESENCE_HEARTBEAT_INTERVAL=30,         # 秒，sqlite 模式下刷新心跳、清理失联进程连接的间隔
+        PRESENCE_STALE_AFTER=120,               # 秒，心跳超过该时间未刷新的进程视为已退出
+        # Socket.IO 跨进程消息队列（见 socketio_queue.py）：None 只推送本进程的连接，
+        # 'sqlite' 使用数据库中的 socketio_queue 表，其他 URL（redis:// 等）交给 Flask-SocketIO
+        SOCKETIO_MESSAGE_QUEUE=None,
+        SOCKETIO_CHANNEL='boya-market',         # 同一个队列上的多套部署使用不同的 channel
+        SOCKETIO_QUEUE_POLL_MS=50,              # sqlite 队列的轮询间隔
+        SOCKETIO_QUEUE_RETENTION_S=60,          # sqlite 队列中消息的保留时间
+        # "正在输入"的转发（见 typing_indicator.py）：每个会话每个间隔最多转发一次状态变化，超时自动停止
+        TYPING_INTERVAL_MS=500,
+        TYPING_TIMEOUT_S=5,
+        # 断线重连同步（sync_batch 事件）：每批最多 SYNC_BATCH_SIZE 条消息，一次同步最多推送 SYNC_MAX_BATCHES 批，
+        # 剩下的由客户端带着 next_after_id 再发 sync 事件继续
+        SYNC_BATCH_SIZE=100,
+        SYNC_MAX_BATCHES=10,
+        # 后台任务队列（jobs 表），JOB_WORKERS 为服务进程内的 worker 数，0 表示只由 flask jobs-run 执行
+        JOB_WORKERS=2,
+        JOB_POLL_INTERVAL=1.0,                  # 秒，队列为空时 worker 的轮询间隔
+        JOB_MAX_ATTEMPTS=3,
+        JOB_RETRY_BACKOFF=30,                   # 秒，第 n 次失败后等待 backoff * 2^(n-1) 再重试
+        JOB_STALE_AFTER=600,                    # 秒，running 超过该时间视为 worker 已丢失，重新入队
+        JOB_RETENTION_DAYS=7,                   # 已完成任务保留天数
+        MAINTENANCE_JOB_SWEEP_INTERVAL=60,      # 秒，回收/清理任务的维护间隔，<= 0 表示不注册
+        # 发布商品后的 AI 标签生成：gemini（需要 GEMINI_API_KEY）、local（本地推荐，见 tag_suggest.py）、
+        # fake（本地假后端，测试用）、off
+        AI_TAG_BACKEND='gemini',
+        AI_LOCAL_FALLBACK=True,                 # gemini 失败/未配置时用本地推荐兜底
+        AI_FAKE_LATENCY_MS=0,
+        # LLM 客户端（见 llm_client.py），AI_API_KEY 为空时读取环境变量 GEMINI_API_KEY；
+        # AI_BASE_URL 可以指向本地桩服务做测试
+        AI_MODEL_NAME='gemini-2.5-flash',
+        AI_API_KEY=None,
+        AI_BASE_URL=None,
+        AI_TIMEOUT_S=20,                        # 单次请求超时
+        AI_DEADLINE_S=60,                       # 一次生成（含重试）的总截止时间
+        AI_MAX_RETRIES=3,
+        AI_BACKOFF_BASE_S=0.5,                  # 第 n 次重试前随机等待 [0, min(max, base * 2^n)] 秒
+        AI_BACKOFF_MAX_S=8,
+        AI_MAX_CONCURRENCY=4,                   # 同时进行的模型调用数
+        AI_BREAKER_FAILURES=5,                  # 连续失败多少次后熔断
+        AI_BREAKER_RESET_S=60,                  # 熔断多久后放行一个试探请求
+        # AI 标签缓存：内存 LRU 条数（0 表示只用磁盘层）和过期时间（秒，<= 0 表示不缓存）
+        AI_TAG_CACHE_SIZE=1024,
+        AI_TAG_CACHE_TTL=7 * 24 * 3600,
+        MAINTENANCE_CACHE_SWEEP_INTERVAL=3600,  # 秒，清理过期缓存的间隔
+        # 本地标签推荐
+        TAG_SUGGEST_LIMIT=8,                    # 每次最多推荐的标签数
+        TAG_SUGGEST_NEIGHBOURS=20,              # 参与投票的相似商品数
+        TAG_SUGGEST_COOC_WEIGHT=0.5,            # 标签共现分数的权重，其余为相似商品投票
+        MAINTENANCE_TAG_MODEL_REBUILD_INTERVAL=3600,  # 秒，整体重建推荐模型的间隔（使修改/删除生效）
+        # 上传图片的缩略图/中图（后台任务生成，见 images.py）
+        IMAGE_VARIANTS_ENABLED=True,
+        IMAGE_THUMB_SIZE=320,                   # 像素，最长边
+        IMAGE_MEDIUM_SIZE=1024,
+        IMAGE_VARIANT_FORMAT='WEBP',
+        IMAGE_VARIANT_QUALITY=80,
+        # /images/<path> 的 HTTP 缓存：max-age 秒 + immutable，0 表示使用 Flask 默认的响应头
+        IMAGE_CACHE_MAX_AGE=365 * 24 * 3600,
+        IMAGE_SEND_BLOCK_SIZE=256 * 1024,       # 读取/写出图片的块大小（字节）
+        IMAGE_SENDFILE=None,                    # None / 'x-sendfile'（Apache、lighttpd）/ 'x-accel-redirect'（nginx）
+        IMAGE_ACCEL_REDIRECT_PREFIX='/internal-images/',  # nginx 中指向 static/images 的 internal location
+        # 按内容寻址的图片存储：没有引用的图片在宽限期后由维护任务分批删除
+        IMAGE_GC_GRACE_S=3600,
+        IMAGE_GC_BATCH=100,                     # 每次运行最多删除/登记的文件数
+        MAINTENANCE_IMAGE_GC_INTERVAL=300,      # 秒，<= 0 表示不注册该任务
     )
 
     if test_config is None:
         app.config.from_pyfile('config.py', silent=True)
     else:
         app.config.from_mapping(test_config)
+    if config_overrides:
+        app.config.from_mapping(config_overrides)
 
     # 确保必要的文件夹存在
     try:
@@ -41,12 +164,23 @@ def create_app(test_config=None):
     # 启用CORS
     CORS(app, supports_credentials=True, origins="*")
 
-    # Init SocketIO（支持跨域）
-    socketio.init_app(app, cors_allowed_origins="*", async_mode='eventlet')
+    # Init SocketIO（支持跨域）；配置了消息队列时，多个后端进程之间互相转发 emit
+    socketio.init_app(app, cors_allowed_origins="*", async_mode='eventlet',
+                      **message_queue_options(app, db, executor))
     logger.info("SocketIO初始化完成")
 
-    # 初始化数据库
-    db.init_app(app)
+    # 阻塞调用执行层 + 初始化数据库
+    executor.init_app(app)
+    db.init_app(app, executor)
+    group_commit.init_app(app, db, executor)
+    jobs.init_app(app, db)
+    tag_cache.init_app(app, db)
+    llm_client.init_app(app)
+    tag_suggester.init_app(app, db, executor)
+    token_cache.init_app(app)
+    entity_cache.init_app(app)
+    presence.init_app(app, db)
+    typing_coalescer.init_app(app, socketio)
     logger.info("数据库管理器初始化完成")
 
     # 注册蓝图
@@ -58,5 +192,28 @@ def create_app(test_config=None):
     app.register_blueprint(main_bp)
     app.register_blueprint(chat_bp)
     logger.info("Flask应用创建完成（已注册 auth, main, chat 蓝图）")
+
+    # 上传被拒绝（过大 / 不是图片）时返回统一的错误格式
+    @app.errorhandler(UploadRejected)
+    def handle_upload_rejected(e):
+        return jsonify({"ok": False, "error": {"code": e.code, "message": e.message}}), e.status
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def handle_request_too_large(e):
+        return jsonify({
+            "ok": False,
+            "error": {"code": "FILE_TOO_LARGE", "message": "请求体过大"}
+        }), 413
+
+    # 维护任务调度器（需要在 run.py 中 scheduler.start(socketio) 才会周期运行）
+    scheduler.init_app(app)
+    register_default_jobs(scheduler, app)
+
+    # 后台任务处理函数（需要在 run.py 中 jobs.start(socketio) 才会在服务进程内执行）
+    register_default_handlers(jobs, app)
+
+    # 注册运维命令（flask search-rebuild 等）
+    from .commands import register_commands
+    register_commands(app)
     
     return app
\ No newline at end of file
@@ -10,8 +10,10 @@ import datetime
 from flask import current_app
 # 在 auth.py 开头的导入部分添加
 from .models import User  # 从当前目录的 models.py 中导入 User 类
-from .exceptions import UsernameTakenError, InvalidPasswordError  # 从exceptions.py导入异常  <-- 修改这里
+from .exceptions import UsernameTakenError, InvalidPasswordError, UploadRejected  # 从exceptions.py导入异常  <-- 修改这里
 from flask import g  # 导入Flask的全局上下文对象g
+from app import executor  # pbkdf2 哈希放到线程池中执行，不阻塞 eventlet hub
+from app import token_cache
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -48,13 +50,9 @@ def token_required(f):
             }), 401
             
         try:
-            payload = jwt.decode(
-                token,
-                current_app.config["SECRET_KEY"],
-                algorithms=['HS256']
-            )
-            current_user_id = payload['sub']
-            session['user_id'] = current_user_id  # 兼容session逻辑
+            # 同一 token 验证过一次后走缓存（见 token_cache.py）；身份只放在本次请求的 g 中，
+            # 不写 cookie session，响应不会因此每次都重新签发 Set-Cookie
+            g.user_id = token_cache.verify(token)
         except jwt.ExpiredSignatureError:
             return jsonify({
                 "ok": False,
@@ -76,6 +74,16 @@ def token_required(f):
     
     return decorated
 
+def optional_user_id():
+    """不要求登录的接口使用：带了有效 token 时返回 user_id，否则返回 None"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    try:
+        return token_cache.verify(auth_header.split(' ')[1])
+    except jwt.InvalidTokenError:
+        return None
+
 # 注册接口
 @auth_bp.route("/api/auth/register", methods=["POST"])
 def register():
@@ -101,7 +109,7 @@ def register():
     logger.debug(f"Registering user: {username}, password:{password}, email: {email}, phone: {phone}")
 
     # 密码加密（自动加盐）
-    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+    hashed_password = executor.run(generate_password_hash, password, method='pbkdf2:sha256')
     
     try:
         # 调用User模型创建用户（假设create方法返回新用户完整信息，含created_at）
@@ -175,7 +183,7 @@ def login():
                 "message": "用户名不存在"
             }
         }), 401
-    elif not check_password_hash(user['password'], password):  # 验证密码
+    elif not executor.run(check_password_hash, user['password'], password):  # 验证密码
         logger.info(f"Invalid password for user: {username}")
         return jsonify({
             "ok": False,
@@ -241,7 +249,7 @@ def check_for_passwd():
     temp_password = ''.join(secrets.choice(alphabet) for _ in range(10))
 
     # 将临时密码写入数据库（以哈希形式保存）
-    hashed_temp = generate_password_hash(temp_password, method='pbkdf2:sha256')
+    hashed_temp = executor.run(generate_password_hash, temp_password, method='pbkdf2:sha256')
     try:
         User.reset_password(user['id'], hashed_temp)
     except Exception as e:
@@ -269,14 +277,15 @@ def check_for_passwd():
 @auth_bp.route("/api/auth/logout", methods=["POST"])
 @token_required
 def logout():
-    session.pop('user_id', None)  # 清除session
+    session.pop('user_id', None)  # 清除旧版本写入的 session
+    token_cache.discard(request.headers['Authorization'].split(' ')[1])
     return jsonify({"ok": True}), 200
 
 # 获取当前用户信息
 @auth_bp.route("/api/auth/me", methods=["GET"])
 @token_required
 def get_current_user():
-    user = User.find_by_id(session['user_id'])
+    user = User.find_by_id(g.user_id)
     if not user:
         return jsonify({
             "ok": False,
@@ -297,7 +306,8 @@ def get_current_user():
             "email": user['email'],
             "phone": user['phone'],
             "created_at": user['created_at'],
-            "avatar_url": user.get('avatar_url',)
+            "avatar_url": user.get('avatar_url',),
+            "avatar_thumb_url": user.get('avatar_thumb_url')
 
         }
     }), 200
@@ -321,7 +331,7 @@ def update_profile():
     email = data.get('email')
     
     try:
-        updated_user = User.update_profile(session['user_id'], username, email)
+        updated_user = User.update_profile(g.user_id, username, email)
         return jsonify({
             "ok": True,
         }), 201
@@ -364,7 +374,8 @@ def change_password():
     new = data.get('newPassword')
     
     try:
-        updated_user = User.change_password(session['user_id'], old, generate_password_hash(new, method='pbkdf2:sha256'))
+        hashed_new = executor.run(generate_password_hash, new, method='pbkdf2:sha256')
+        updated_user = User.change_password(g.user_id, old, hashed_new)
         return jsonify({
             "ok": True,
         }), 201
@@ -402,7 +413,7 @@ def upload_avatar():
                 }
             }), 400
         
-        avatar_url = User.upload_avatar(session["user_id"], avatar)
+        avatar_url = User.upload_avatar(g.user_id, avatar)
 
         return jsonify({
             "ok": True,
@@ -412,6 +423,9 @@ def upload_avatar():
             }
         }), 200
         
+    except UploadRejected:
+        # 过大 / 不是图片：交给 app 的错误处理返回 413 / 415
+        raise
     except Exception as e:
         logger.error(f"上传头像失败: {e}")
         return jsonify({
@@ -1,24 +1,151 @@
+import logging
+logger = logging.getLogger(__name__)
+
 import sqlite3
+import threading
+from collections import deque
 from flask import g, current_app
+from .executor import OffloadedConnection
+
+
+class ConnectionPool:
+    """
+    SQLite 连接池：每个 worker 进程持有最多 size 个长连接，按 app context 借出/归还。
+    借连接从不阻塞：空闲队列为空时直接新建一个临时连接，归还时超出 size 的部分会被关闭。
+    因此在 eventlet green thread（没有 monkey patch）下也不会卡住 hub；锁只保护队列本身，
+    持有期间不做任何 IO。
+    """
+    def __init__(self, db_path, size, configure):
+        self.db_path = db_path
+        self.size = size
+        self._configure = configure
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.overflow_closed = 0
+
+    def _connect(self):
+        # 连接会被不同的 green thread / 线程轮流使用（同一时刻只有一个使用者）
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._configure(conn)
+        self.created += 1
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                # 请求中途出错没有提交的事务，不能带给下一个使用者
+                conn.rollback()
+        except sqlite3.Error:
+            logger.exception("Failed to reset pooled connection, dropping it")
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        self.overflow_closed += 1
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
 
 class BoyaDatabase():
-    def __init__(self, app=None):
+    def __init__(self, app=None, executor=None):
         self.app = app
+        self.pool = None
+        self.executor = None
         if app is not None:
-            self.init_app(app)
+            self.init_app(app, executor)
 
-    def init_app(self, app):
+    def init_app(self, app, executor=None):
         self.app = app
+        # executor 开启时，get_db 返回的连接会把查询放到线程池中执行（见 executor.py）
+        self.executor = executor
         app.teardown_appcontext(self.close_db)
         self.db_path = app.config['DATABASE']
+        if self.pool is not None:
+            self.pool.close_all()
+            self.pool = None
+
+    def configure_connection(self, conn):
+        """新建连接时设置 row_factory 和 PRAGMA（配置见 app.config 中的 DB_* 项）"""
+        config = self.app.config
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(config['DB_BUSY_TIMEOUT_MS'])}")
+        if config['DB_JOURNAL_MODE']:
+            conn.execute(f"PRAGMA journal_mode = {config['DB_JOURNAL_MODE']}")
+        if config['DB_SYNCHRONOUS']:
+            conn.execute(f"PRAGMA synchronous = {config['DB_SYNCHRONOUS']}")
+        conn.execute(f"PRAGMA foreign_keys = {'ON' if config['DB_FOREIGN_KEYS'] else 'OFF'}")
+        # 负数表示以 KiB 为单位
+        conn.execute(f"PRAGMA cache_size = {-int(config['DB_CACHE_SIZE_KB'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(config['DB_MMAP_SIZE_MB']) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+    def connect(self):
+        """新建一个不经过连接池的连接（维护脚本、迁移等使用）"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.configure_connection(conn)
+        return conn
+
+    def get_pool(self):
+        # 延迟创建，保证 run.py 覆盖的配置在第一次使用前生效
+        if self.pool is None:
+            size = int(self.app.config['DB_POOL_SIZE'])
+            self.pool = ConnectionPool(self.db_path, size, self.configure_connection)
+            logger.info(f"SQLite connection pool created: size={size}, path={self.db_path}")
+        return self.pool
 
     def get_db(self):
         if 'db' not in g:
-            g.db = sqlite3.connect(self.db_path)
-            g.db.row_factory = sqlite3.Row
+            if current_app.config['DB_POOL_SIZE'] > 0:
+                conn = self.get_pool().acquire()
+            else:
+                conn = self.connect()
+            if self.executor is not None and self.executor.enabled:
+                conn = OffloadedConnection(conn, self.executor)
+            g.db = conn
         return g.db
 
+    def run_transaction(self, write, *args):
+        """
+        在当前请求的连接上执行 write(conn, *args) 并提交，返回 write 的返回值，出错时回滚。
+        开启 executor 时整个事务在线程池中一次执行完：如果逐条语句交给线程池，持有写锁的事务
+        可能在等空闲线程，而线程都卡在 busy_timeout 里等这把锁。
+        """
+        conn = self.get_db()
+        if isinstance(conn, OffloadedConnection):
+            return self.executor.run(self._transaction, conn.raw, write, args)
+        return self._transaction(conn, write, args)
+
+    @staticmethod
+    def _transaction(conn, write, args):
+        try:
+            value = write(conn, *args)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return value
+
     def close_db(self, e=None):
-        db:sqlite3.Connection = g.pop('db', None)
-        if db is not None:
-            db.close()
\ No newline at end of file
+        db = g.pop('db', None)
+        if db is None:
+            return
+        if isinstance(db, OffloadedConnection):
+            db = db.raw
+        if self.pool is not None and current_app.config['DB_POOL_SIZE'] > 0:
+            self.pool.release(db)
+        else:
+            db.close()
@@ -1,32 +1,108 @@
 import logging
 logger = logging.getLogger(__name__)
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, g
 from flask_socketio import emit, join_room, leave_room
 from .auth import token_required
 from .models import Message, Conversation, User, Item
 from datetime import datetime
 import jwt
 from flask import current_app
+from app import token_cache, presence, typing_coalescer
 
 chat_bp = Blueprint("chat", __name__)
 
-# 存储用户socket连接映射 {user_id: sid}
-user_sockets = {}
+# 聊天记录分页大小
+HISTORY_DEFAULT_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+# who_is_online 一次最多查询的用户数
+ONLINE_QUERY_MAX_IDS = 500
 
 def verify_socket_token(token):
-    """验证Socket连接的JWT token并返回user_id"""
+    """验证Socket连接的JWT token并返回user_id（与 token_required 共用已验证 token 的缓存）"""
     try:
-        payload = jwt.decode(
-            token,
-            current_app.config["SECRET_KEY"],
-            algorithms=['HS256']
-        )
-        return payload['sub']
-    except:
+        return token_cache.verify(token)
+    except jwt.InvalidTokenError:
         return None
 
 
+def with_online_flags(conversations):
+    """给会话列表加上 other_user_online（对方是否在线，整个列表一次查询）"""
+    online = presence.online(c['other_user_id'] for c in conversations)
+    for conversation in conversations:
+        conversation['other_user_online'] = conversation['other_user_id'] in online
+    return conversations
+
+
+def parse_sync_cursor(value):
+    """同步游标（客户端已收到的最大消息 id），非法时返回 None"""
+    try:
+        after_id = int(value)
+    except (ValueError, TypeError):
+        return None
+    return after_id if after_id >= 0 else None
+
+
+def sync_messages(user_id, after_id, sid):
+    """
+    断线重连同步：把 id > after_id 的消息按 id 顺序分批推送给连接 sid（sync_batch 事件），
+    每批附带这些消息所在会话的最新状态（与会话列表的字段相同）。
+    每批最多 SYNC_BATCH_SIZE 条，本次最多推送 SYNC_MAX_BATCHES 批；has_more 为真时客户端
+    带着 next_after_id 发 sync 事件继续。没有新消息时也推送一批空结果，表示已经同步完。
+    返回 {batches, messages, next_after_id, has_more}。
+    """
+    from app import socketio
+
+    batch_size = max(1, int(current_app.config['SYNC_BATCH_SIZE']))
+    max_batches = max(1, int(current_app.config['SYNC_MAX_BATCHES']))
+    batches = total = 0
+    has_more = True
+    while has_more and batches < max_batches:
+        messages, has_more = Message.since(user_id, after_id, batch_size)
+        conversations = []
+        if messages:
+            after_id = messages[-1]['id']
+            conversations = with_online_flags(Conversation.get_user_conversations(
+                user_id, {m['conversation_id'] for m in messages}
+            ))
+        socketio.emit('sync_batch', {
+            'messages': messages,
+            'conversations': conversations,
+            'next_after_id': after_id,
+            'has_more': has_more
+        }, room=sid)
+        batches += 1
+        total += len(messages)
+        # 批与批之间让出，避免大量积压时长时间占住事件循环
+        socketio.sleep(0)
+    logger.info(f"Synced {total} messages to user {user_id} ({sid}) in {batches} batches, has_more={has_more}")
+    return {'batches': batches, 'messages': total, 'next_after_id': after_id, 'has_more': has_more}
+
+
+def _sync_in_background(app, user_id, after_id, sid):
+    with app.app_context():
+        try:
+            sync_messages(user_id, after_id, sid)
+        except Exception:
+            logger.exception(f"Sync for user {user_id} failed")
+
+
+def mark_conversation_read(user_id, conversation_id, up_to_message_id=None):
+    """标记已读并通知对方（HTTP 和 Socket.IO 共用），会话不存在或无权限时返回 None"""
+    from app import socketio
+
+    receipt = Conversation.mark_read(conversation_id, user_id, up_to_message_id)
+    if receipt is None:
+        return None
+    if receipt['marked']:
+        socketio.emit('messages_read', {
+            'conversation_id': conversation_id,
+            'reader_id': user_id,
+            'up_to_message_id': up_to_message_id
+        }, room=f"user_{receipt['other_user_id']}")
+    return receipt
+
+
 # ============= SocketIO 事件处理 =============
 
 def register_socketio_events(socketio):
@@ -47,142 +123,191 @@ def register_socketio_events(socketio):
             logger.warning("Connection rejected: invalid token")
             return False
         
-        # 记录用户socket连接
-        user_sockets[user_id] = request.sid
+        # 记录用户socket连接（同一用户可以有多个连接）；身份保存在该连接的 socket session 中，后续事件直接使用
+        connections = presence.connect(user_id, request.sid)
+        session['user_id'] = user_id
         
         # 只加入用户专属房间
         join_room(f"user_{user_id}")
         
-        logger.info(f"User {user_id} connected with sid {request.sid}")
+        logger.info(f"User {user_id} connected with sid {request.sid} ({connections} connections)")
         emit('connected', {'user_id': user_id, 'message': '连接成功'})
+        
+        # 重连时 auth 里带 last_message_id，只补发之后的消息；在后台推送，不阻塞连接握手
+        after_id = parse_sync_cursor(auth.get('last_message_id'))
+        if after_id is not None:
+            socketio.start_background_task(
+                _sync_in_background, current_app._get_current_object(), user_id, after_id, request.sid
+            )
     
     
     @socketio.on('disconnect')
     def handle_disconnect():
         """客户端断开连接事件"""
-        user_id = None
-        for uid, sid in list(user_sockets.items()):
-            if sid == request.sid:
-                user_id = uid
-                del user_sockets[uid]
-                break
+        user_id, remaining = presence.disconnect(request.sid)
         
         if user_id:
             leave_room(f"user_{user_id}")
-            logger.info(f"User {user_id} disconnected")
+            if remaining == 0:
+                typing_coalescer.clear_sender(user_id)
+            logger.info(f"User {user_id} disconnected ({remaining} connections left)")
         else:
             logger.info(f"Unknown client disconnected: {request.sid}")
     
     
-    # 简化版：通过 user room 实现正在输入
+    @socketio.on('send_message')
+    def handle_send_message(data):
+        """
+        通过已认证的 socket 连接发送消息，省去每条消息一次 HTTP 请求和 JWT 校验。
+        data 与 POST /api/messages 的请求体相同，可额外带 client_msg_id，会原样放在 ack 中方便前端对应。
+        ack: {ok: true, data: {...消息, 含 id}} 或 {ok: false, error: {code, message}}
+        """
+        user_id = session.get('user_id')
+        if not user_id:
+            return {'ok': False, 'error': {'code': 'UNAUTHORIZED', 'message': 'Not authenticated'}}
+        client_msg_id = data.get('client_msg_id') if isinstance(data, dict) else None
+        try:
+            response_data, error = deliver_message(user_id, data if isinstance(data, dict) else None)
+        except Exception as e:
+            logger.exception("发送消息失败")
+            return {'ok': False, 'client_msg_id': client_msg_id,
+                    'error': {'code': 'SEND_FAILED', 'message': f"发送消息失败: {str(e)}"}}
+        if error:
+            code, message, _ = error
+            return {'ok': False, 'client_msg_id': client_msg_id, 'error': {'code': code, 'message': message}}
+        return {'ok': True, 'client_msg_id': client_msg_id, 'data': response_data}
+    
+    
+    @socketio.on('mark_read')
+    def handle_mark_read(data):
+        """已读回执（Socket.IO 版本）：{conversation_id, up_to_message_id?}，通过 ack 返回结果"""
+        user_id = session.get('user_id')
+        if not user_id:
+            return {'ok': False, 'error': {'code': 'UNAUTHORIZED', 'message': 'Not authenticated'}}
+        try:
+            conversation_id = int(data.get('conversation_id'))
+            up_to_message_id = data.get('up_to_message_id')
+            up_to_message_id = int(up_to_message_id) if up_to_message_id is not None else None
+        except (ValueError, TypeError, AttributeError):
+            return {'ok': False, 'error': {'code': 'INVALID_INPUT', 'message': 'Invalid conversation_id or up_to_message_id'}}
+
+        try:
+            receipt = mark_conversation_read(user_id, conversation_id, up_to_message_id)
+        except Exception:
+            logger.exception("Fail to set read status")
+            return {'ok': False, 'error': {'code': 'UPDATE_FAILED', 'message': 'Fail to set read status'}}
+        if receipt is None:
+            return {'ok': False, 'error': {'code': 'CONVERSATION_NOT_FOUND', 'message': 'Conversation not exists'}}
+        return {'ok': True, 'data': receipt}
+    
+    
+    @socketio.on('sync')
+    def handle_sync(data):
+        """
+        断线重连同步：{after_id}，消息通过 sync_batch 事件推送到当前连接，
+        ack 返回 {batches, messages, next_after_id, has_more}
+        """
+        user_id = session.get('user_id')
+        if not user_id:
+            return {'ok': False, 'error': {'code': 'UNAUTHORIZED', 'message': 'Not authenticated'}}
+        after_id = parse_sync_cursor(data.get('after_id') if isinstance(data, dict) else None)
+        if after_id is None:
+            return {'ok': False, 'error': {'code': 'INVALID_INPUT', 'message': 'after_id must be a non-negative integer'}}
+        return {'ok': True, 'data': sync_messages(user_id, after_id, request.sid)}
+    
+    
+    @socketio.on('who_is_online')
+    def handle_who_is_online(data):
+        """批量查询在线状态：{user_ids: [...]}，ack 返回其中在线的 user_id 列表"""
+        if not session.get('user_id'):
+            return {'ok': False, 'error': {'code': 'UNAUTHORIZED', 'message': 'Not authenticated'}}
+        try:
+            user_ids = [int(user_id) for user_id in data.get('user_ids')][:ONLINE_QUERY_MAX_IDS]
+        except (ValueError, TypeError, AttributeError):
+            return {'ok': False, 'error': {'code': 'INVALID_INPUT', 'message': 'user_ids must be a list of integers'}}
+        return {'ok': True, 'data': {'online': sorted(presence.online(user_ids))}}
+    
+    
+    # 通过 user room 实现正在输入；合并、限流和超时见 typing_indicator.py
     @socketio.on('typing')
     def handle_typing(data):
         """用户正在输入的状态通知"""
-        to_user_id = data.get('to_user_id')  # 改为接收 to_user_id
-        user_id = data.get('user_id')
-        item_id = data.get('item_id')  # 用于前端判断是哪个会话
-        is_typing = data.get('is_typing', True)
-        
-        if to_user_id:
-            # 直接推送给对方的 user room
-            emit('user_typing', {
-                'user_id': user_id,
-                'item_id': item_id,  # 前端用这个判断是否显示
-                'is_typing': is_typing
-            }, room=f"user_{to_user_id}")
+        # 发送方以连接认证的身份为准，不使用客户端传来的 user_id
+        user_id = session.get('user_id')
+        if not user_id or not isinstance(data, dict):
+            return
+        try:
+            to_user_id = int(data.get('to_user_id'))
+            item_id = data.get('item_id')  # 用于前端判断是哪个会话
+            item_id = int(item_id) if item_id is not None else None
+        except (ValueError, TypeError):
+            return
+        if to_user_id == user_id:
+            return
+        typing_coalescer.update(user_id, to_user_id, item_id, bool(data.get('is_typing', True)))
 
 
-# ----- HTTP API -----
-
-@chat_bp.route("/api/messages", methods=["POST"])
-@token_required
-def send_message():
-    """发送消息"""
+def deliver_message(from_user_id, data):
+    """
+    校验并发送一条消息，然后推送给接收方（HTTP 和 Socket.IO 共用）。
+    成功返回 (message_data, None)；失败返回 (None, (error_code, message, http_status))。
+    """
     from app import socketio
-    
-    data = request.get_json()
+
+    data = data or {}
     to_user_id = data.get('to_user_id')
     item_id = data.get('item_id')
     content = data.get('content')
     
     # 参数验证
     if not to_user_id or not item_id or not content:
-        return jsonify({
-            "ok": False,
-            "error": {
-                "code": "INVALID_INPUT",
-                "message": "接收用户ID、商品ID和消息内容不能为空"
-            }
-        }), 400
+        return None, ("INVALID_INPUT", "接收用户ID、商品ID和消息内容不能为空", 400)
     
     try:
         to_user_id = int(to_user_id)
         item_id = int(item_id)
     except (ValueError, TypeError):
-        return jsonify({
-            "ok": False,
-            "error": {
-                "code": "INVALID_INPUT",
-                "message": "用户ID或商品ID格式错误"
-            }
-        }), 400
+        return None, ("INVALID_INPUT", "用户ID或商品ID格式错误", 400)
     
     # 检查接收用户是否存在
-    user = User.find_by_id(to_user_id)
-    if not user:
-        return jsonify({
-            "ok": False,
-            "error": {
-                "code": "USER_NOT_FOUND",
-                "message": "接收用户不存在"
-            }
-        }), 404
+    if not User.find_by_id(to_user_id):
+        return None, ("USER_NOT_FOUND", "接收用户不存在", 404)
     
     # 检查商品是否存在
-    item = Item.find_by_id(item_id)
-    if not item:
-        return jsonify({
-            "ok": False,
-            "error": {
-                "code": "ITEM_NOT_FOUND",
-                "message": "商品不存在"
-            }
-        }), 404
+    if not Item.find_by_id(item_id):
+        return None, ("ITEM_NOT_FOUND", "商品不存在", 404)
     
     # 不能给自己发消息
-    if session['user_id'] == to_user_id:
-        return jsonify({
-            "ok": False,
-            "error": {
-                "code": "INVALID_OPERATION",
-                "message": "不能给自己发送消息"
-            }
-        }), 400
+    if from_user_id == to_user_id:
+        return None, ("INVALID_OPERATION", "不能给自己发送消息", 400)
     
+    message_data = Message.send(from_user_id, to_user_id, item_id, content)
+    
+    # 构造推送数据
+    response_data = {
+        "id": message_data['id'],
+        "conversation_id": message_data['conversation_id'],
+        "from_user_id": from_user_id,
+        "to_user_id": to_user_id,
+        "item_id": item_id,
+        "content": content,
+        "created_at": message_data['created_at']
+    }
+    
+    # 简化：只推送到接收方的 user room
+    socketio.emit('new_message', response_data, room=f"user_{to_user_id}")
+    logger.info(f"Message sent from {from_user_id} to {to_user_id}, pushed via SocketIO")
+    return response_data, None
+
+
+# ----- HTTP API -----
+
+@chat_bp.route("/api/messages", methods=["POST"])
+@token_required
+def send_message():
+    """发送消息"""
     try:
-        # 发送消息
-        message_data = Message.send(session['user_id'], to_user_id, item_id, content)
-        
-        # 构造返回数据
-        response_data = {
-            "id": message_data['id'],
-            "conversation_id": message_data['conversation_id'],
-            "from_user_id": session['user_id'],
-            "to_user_id": to_user_id,
-            "item_id": item_id,
-            "content": content,
-            "created_at": message_data['created_at']
-        }
-        
-        # 简化：只推送到接收方的 user room
-        socketio.emit('new_message', response_data, room=f"user_{to_user_id}")
-        
-        logger.info(f"Message sent from {session['user_id']} to {to_user_id}, pushed via SocketIO")
-        
-        return jsonify({
-            "ok": True,
-            "data": response_data
-        }), 201
+        response_data, error = deliver_message(g.user_id, request.get_json())
     except Exception as e:
         logger.exception("发送消息失败")
         return jsonify({
@@ -193,13 +318,28 @@ def send_message():
             }
         }), 500
 
+    if error:
+        code, message, status = error
+        return jsonify({
+            "ok": False,
+            "error": {
+                "code": code,
+                "message": message
+            }
+        }), status
+
+    return jsonify({
+        "ok": True,
+        "data": response_data
+    }), 201
+
 
 @chat_bp.route("/api/messages/conversations")
 @token_required
 def get_conversations():
     """获取当前用户的所有会话列表"""
     try:
-        conversations = Conversation.get_user_conversations(session['user_id'])
+        conversations = with_online_flags(Conversation.get_user_conversations(g.user_id))
         return jsonify({
             "ok": True,
             "data": conversations
@@ -219,8 +359,8 @@ def get_conversations():
 @token_required
 def get_chat_history(other_user_id, item_id):
     """获取与指定用户关于指定商品的聊天记录"""
-    # 检查商品是否存在
-    item = Item.find_by_id(item_id)
+    # 检查商品是否存在（已删除的商品仍可查看聊天记录）
+    item = Item.find_by_id(item_id, include_removed=True)
     if not item:
         return jsonify({
             "ok": False,
@@ -241,12 +381,31 @@ def get_chat_history(other_user_id, item_id):
             }
         }), 404
     
+    # 分页参数：?limit=50&before_id=<上一页返回的 next_before_id>；都不带时返回全部
+    limit = request.args.get('limit', type=int)
+    before_id = request.args.get('before_id', type=int)
+    if ('limit' in request.args and limit is None) or ('before_id' in request.args and before_id is None):
+        return jsonify({
+            "ok": False,
+            "error": {
+                "code": "INVALID_INPUT",
+                "message": "Invalid paging params"
+            }
+        }), 400
+    if before_id is not None and limit is None:
+        limit = HISTORY_DEFAULT_PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
     try:
-        messages = Message.get_conversation(session['user_id'], other_user_id, item_id)
-        print("get_chat_history messages:", messages)
+        messages, next_before_id = Message.get_conversation(
+            g.user_id, other_user_id, item_id, before_id=before_id, limit=limit
+        )
+        logger.debug(f"get_chat_history: {len(messages)} messages, next_before_id={next_before_id}")
         return jsonify({
             "ok": True,
-            "data": messages
+            "data": messages,
+            "next_before_id": next_before_id
         })
     except Exception as e:
         logger.exception("Fail to get chat history")
@@ -261,46 +420,48 @@ def get_chat_history(other_user_id, item_id):
 @chat_bp.route("/api/messages/conversations/<int:conversation_id>/read", methods=["POST"])
 @token_required
 def set_read_status(conversation_id):
-    data = request.get_json()
-    other_user_id = data.get('other_user_id')
-    item_id = data.get('item_id')
+    """
+    已读回执：请求体可带 up_to_message_id（已读到的最后一条消息 id），不带则标记全部已读。
+    旧版前端传的 other_user_id / item_id 不再需要，会被忽略。
+    """
+    data = request.get_json(silent=True) or {}
+    up_to_message_id = data.get('up_to_message_id')
+    if up_to_message_id is not None:
+        try:
+            up_to_message_id = int(up_to_message_id)
+        except (ValueError, TypeError):
+            return jsonify({
+                "ok": False,
+                "error": {
+                    "code": "INVALID_INPUT",
+                    "message": "up_to_message_id must be an integer"
+                }
+            }), 400
     
-    # 检查商品是否存在
-    item = Item.find_by_id(item_id)
-    if not item:
+    try:
+        receipt = mark_conversation_read(g.user_id, conversation_id, up_to_message_id)
+    except Exception as e:
+        logger.exception("Fail to set read status")
         return jsonify({
             "ok": False,
             "error": {
-                "code": "ITEM_NOT_FOUND",
-                "message": "Product not exists"
+                "code": "UPDATE_FAILED",
+                "message": "Fail to set read status"
             }
-        }), 404
-    
-    # 检查对方用户是否存在
-    other_user = User.find_by_id(other_user_id)
-    if not other_user:
+        }), 500
+
+    if receipt is None:
         return jsonify({
             "ok": False,
             "error": {
-                "code": "USER_NOT_FOUND",
-                "message": "User not exists"
+                "code": "CONVERSATION_NOT_FOUND",
+                "message": "Conversation not exists"
             }
         }), 404
-    
-    try:
-        messages = Message.get_conversation(session['user_id'], other_user_id, item_id)
-        print("read_status_set:", messages)
-        return jsonify({
-            "ok": True,
-            "conversation_id": conversation_id,
-            "read_all": True
-        }), 200
-    except Exception as e:
-        logger.exception("Fail to get chat history")
-        return jsonify({
-            "ok": False,
-            "error": {
-                "code": "FETCH_FAILED",
-                "message": "Fail to get chat history"
-            }
-        }), 500
\ No newline at end of file
+
+    return jsonify({
+        "ok": True,
+        "conversation_id": conversation_id,
+        "read_all": up_to_message_id is None,
+        "data": receipt
+    }), 200
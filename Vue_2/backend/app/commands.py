@@ -0,0 +1,117 @@
+# app/commands.py
+# 运维命令（Flask CLI），在 backend 目录下执行，例如：
+#   FLASK_APP=app flask search-rebuild
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db, scheduler, jobs, tag_suggester
+from .search import ItemSearchIndex
+from .images import ImageCollector, ImageStore
+from . import migrate
+
+
+@click.command('search-rebuild')
+@with_appcontext
+def search_rebuild_command():
+    """重建商品全文检索索引（items_fts），用于已有数据库或索引损坏时"""
+    conn = db.get_db()
+    if not ItemSearchIndex.ensure(conn):
+        ItemSearchIndex.rebuild(conn)
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM items_fts").fetchone()[0]
+    click.echo(f"Search index rebuilt: {total} items indexed.")
+
+
+@click.command('maintenance-run')
+@click.option('--once', is_flag=True, help='每个任务只执行一次后退出')
+def maintenance_run_command(once):
+    """以独立进程运行维护任务（过期锁定释放等）"""
+    if once:
+        scheduler.run_all()
+        for job in scheduler.jobs.values():
+            click.echo(f"{job.name}: {'failed' if job.failures else job.last_result}")
+        return
+    click.echo(f"Maintenance worker running jobs: {', '.join(scheduler.jobs)}")
+    scheduler.run_forever()
+
+
+@click.command('jobs-run')
+@click.option('--once', is_flag=True, help='执行完当前到期的任务后退出')
+def jobs_run_command(once):
+    """以独立进程运行后台任务 worker（AI 标签生成等）"""
+    if once:
+        count = jobs.run_pending()
+        click.echo(f"Ran {count} jobs ({jobs.processed} done, {jobs.failed} failed).")
+        return
+    click.echo(f"Job worker running kinds: {', '.join(jobs.handlers)}")
+    jobs.run_forever(time.sleep)
+
+
+@click.command('tag-suggest')
+@click.argument('title')
+@click.option('--tags', default='', help='已有标签（空格分隔）')
+@with_appcontext
+def tag_suggest_command(title, tags):
+    """用本地推荐引擎为给定的标题/标签推荐标签（调试用）"""
+    suggested = tag_suggester.suggest(title, tags)
+    stats = tag_suggester.stats()
+    click.echo(' '.join(suggested) or '(no suggestions)')
+    click.echo(f"model: {stats['items']} items, {stats['tags']} tags, {stats['memory_kb']} KiB; {stats['avg_ms']}ms")
+
+
+@click.command('images-gc')
+@click.option('--grace', type=int, default=None, help='宽限期（秒），默认使用 IMAGE_GC_GRACE_S')
+@with_appcontext
+def images_gc_command(grace):
+    """扫描全部图片目录，删除所有超过宽限期仍没有引用的图片"""
+    config = current_app.config
+    collector = ImageCollector(db, os.path.join(current_app.root_path, 'static'),
+                               config['IMAGE_GC_GRACE_S'], int(config['IMAGE_GC_BATCH']))
+    result = collector.run_all(grace)
+    stats = ImageStore.stats(db.get_db())
+    click.echo(f"Adopted {result['adopted']} untracked files, removed {result['collected']} orphaned images.")
+    click.echo(f"Store: {stats['files']} files, {stats['bytes'] / 2 ** 20:.1f} MiB, {stats['orphaned']} awaiting GC.")
+
+
+@click.command('db-upgrade')
+@click.option('--to', 'target', type=int, default=None, help='升级到指定版本（默认最新）')
+@with_appcontext
+def db_upgrade_command(target):
+    """执行尚未应用的数据库迁移（app/migrations）"""
+    conn = db.connect()
+    try:
+        applied = migrate.upgrade(conn, target)
+        for migration in applied:
+            click.echo(f"Applied {migration}")
+        click.echo(f"Database at version {migrate.current_version(conn)}.")
+    finally:
+        conn.close()
+
+
+@click.command('db-version')
+@with_appcontext
+def db_version_command():
+    """显示当前数据库版本和待执行的迁移"""
+    conn = db.connect()
+    try:
+        click.echo(f"Current version: {migrate.current_version(conn)}")
+        for migration in migrate.pending_migrations(conn):
+            click.echo(f"Pending: {migration}")
+    finally:
+        conn.close()
+
+
+def register_commands(app):
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_version_command)
+    app.cli.add_command(search_rebuild_command)
+    app.cli.add_command(maintenance_run_command)
+    app.cli.add_command(jobs_run_command)
+    app.cli.add_command(tag_suggest_command)
+    app.cli.add_command(images_gc_command)
@@ -0,0 +1,134 @@
+# app/entity_cache.py
+# User / Item 按 id 查询的缓存（User.find_by_id、Item.find_by_id），分两层：
+#   - 请求内的 identity map（保存在 g 中）：同一个请求/Socket.IO 事件/后台任务里重复查同一条记录只查一次库
+#   - 进程内 LRU（ENTITY_CACHE_SIZE 条，ENTITY_CACHE_TTL 秒过期），跨请求共享
+# 本进程内的写操作（update_profile、upload_avatar、update_all、update_status、delete 等）提交后调用
+# invalidate；其他进程（flask jobs-run 等）的修改无法通知到这里，最多在 TTL 之后生效，所以 TTL 不宜设得太长。
+# 缓存的是字典，取出时返回浅拷贝，调用方修改返回值不会影响缓存。
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+import threading
+from collections import OrderedDict
+
+from flask import g, has_app_context
+
+
+def _normalize(key):
+    """请求参数里的 id 可能是字符串，统一成 int，保证失效时能命中同一个键"""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return key
+
+
+class EntityCache:
+    def __init__(self, app=None):
+        self.size = 0
+        self.ttl = 0
+        self._entries = OrderedDict()   # (kind, id) -> (value, expires_at)
+        self._lock = threading.Lock()
+        # 每次失效加 1；加载期间发生过失效的结果不放入共享缓存，避免把提交前读到的旧值写回去
+        self._generation = 0
+        self.request_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.size = max(0, int(app.config['ENTITY_CACHE_SIZE']))
+        self.ttl = float(app.config['ENTITY_CACHE_TTL'])
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def shared(self):
+        return self.size > 0 and self.ttl > 0
+
+    @staticmethod
+    def _request_map():
+        if not has_app_context():
+            return None
+        return g.setdefault('entity_map', {})
+
+    def get(self, kind, key, loader):
+        """返回 loader(key) 的结果（字典或 None），优先使用请求内和进程内的缓存；None 不缓存"""
+        cache_key = (kind, _normalize(key))
+        request_map = self._request_map()
+        if request_map is not None and cache_key in request_map:
+            self.request_hits += 1
+            return dict(request_map[cache_key])
+
+        value = None
+        if self.shared:
+            with self._lock:
+                entry = self._entries.get(cache_key)
+                if entry is not None:
+                    if entry[1] > time.monotonic():
+                        self._entries.move_to_end(cache_key)
+                        value = entry[0]
+                    else:
+                        del self._entries[cache_key]
+        if value is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            generation = self._generation
+            value = loader(key)
+            if value is None:
+                return None
+            if self.shared:
+                with self._lock:
+                    if generation == self._generation:
+                        self._entries[cache_key] = (value, time.monotonic() + self.ttl)
+                        self._entries.move_to_end(cache_key)
+                        while len(self._entries) > self.size:
+                            self._entries.popitem(last=False)
+                            self.evictions += 1
+
+        if request_map is not None:
+            request_map[cache_key] = value
+        return dict(value)
+
+    def invalidate(self, kind, key):
+        """写操作提交后调用"""
+        cache_key = (kind, _normalize(key))
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(cache_key, None)
+        request_map = self._request_map()
+        if request_map is not None:
+            request_map.pop(cache_key, None)
+        self.invalidations += 1
+
+    def invalidate_if(self, predicate, kind=None):
+        """批量失效：移除 predicate(value) 为真的记录（kind 为 None 时检查所有类型），用于按条件批量更新之后"""
+        with self._lock:
+            self._generation += 1
+            stale = [k for k, (value, _) in self._entries.items()
+                     if (kind is None or k[0] == kind) and predicate(value)]
+            for cache_key in stale:
+                del self._entries[cache_key]
+        request_map = self._request_map()
+        if request_map is not None:
+            for cache_key in [k for k, value in request_map.items()
+                              if (kind is None or k[0] == kind) and predicate(value)]:
+                del request_map[cache_key]
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.request_hits + self.hits + self.misses
+        return {
+            'enabled': self.shared,
+            'entries': len(self._entries),
+            'request_hits': self.request_hits,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': round((self.request_hits + self.hits) / lookups, 3) if lookups else 0.0
+        }
@@ -5,4 +5,12 @@ class UsernameTakenError(Exception):
 
 class InvalidPasswordError(Exception):
     """原密码错误异常"""
-    pass
\ No newline at end of file
+    pass
+
+class UploadRejected(Exception):
+    """上传的文件在接收过程中被拒绝（过大或不是图片），code / status 用于返回错误响应"""
+    def __init__(self, code, message, status=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
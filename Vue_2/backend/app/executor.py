@@ -0,0 +1,106 @@
+# app/executor.py
+# 阻塞调用的执行层：服务以 eventlet 模式运行，而 sqlite3 查询和 pbkdf2 密码哈希都是 C 层面的阻塞调用，
+# 在 green thread 里直接执行会卡住整个 hub（所有 Socket.IO 连接都跟着停顿）。
+# 开启 OFFLOAD_BLOCKING 后，这些调用会被放到 eventlet.tpool 的真实线程池中执行，
+# 当前 green thread 挂起等待，hub 继续调度其他连接。sqlite3 和 hashlib 在执行期间会释放 GIL。
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BlockingExecutor:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.threads = 0
+        self._execute = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = bool(app.config['OFFLOAD_BLOCKING'])
+        self.threads = int(app.config['OFFLOAD_THREADS'])
+        if not self.enabled:
+            self._execute = None
+            return
+        from eventlet import tpool
+        tpool.set_num_threads(self.threads)
+        # 异常会重新抛给调用方处理（例如 IntegrityError），不需要 tpool 再打印一遍
+        tpool.QUIET = True
+        self._execute = tpool.execute
+        logger.info(f"Blocking calls offloaded to thread pool: threads={self.threads}")
+
+    def run(self, func, *args, **kwargs):
+        """在线程池中执行 func 并返回结果；未开启时直接在当前线程调用"""
+        if self._execute is None:
+            return func(*args, **kwargs)
+        return self._execute(func, *args, **kwargs)
+
+
+class OffloadedCursor:
+    """sqlite3.Cursor 的代理，会执行 SQL 或取结果的方法都交给 executor"""
+    def __init__(self, cursor, executor):
+        self._cursor = cursor
+        self._executor = executor
+
+    def execute(self, sql, parameters=()):
+        self._executor.run(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._executor.run(self._cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        return self._executor.run(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._executor.run(self._cursor.fetchmany)
+        return self._executor.run(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._executor.run(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        # lastrowid, rowcount, description 等属性直接读取
+        return getattr(self._cursor, name)
+
+
+class OffloadedConnection:
+    """sqlite3.Connection 的代理，models 中的调用方式不需要任何修改"""
+    def __init__(self, conn, executor):
+        self.raw = conn
+        self._executor = executor
+
+    def cursor(self):
+        return OffloadedCursor(self.raw.cursor(), self._executor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return OffloadedCursor(self._executor.run(self.raw.executescript, script), self._executor)
+
+    def commit(self):
+        self._executor.run(self.raw.commit)
+
+    def rollback(self):
+        self._executor.run(self.raw.rollback)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
@@ -0,0 +1,107 @@
+# app/group_commit.py
+# 消息组提交：高并发聊天时，很多 green thread 几乎同时调用 Message.send，每条消息单独提交就是一次
+# 事务（以及 synchronous=FULL 时的一次 fsync）。开启后，发送方把"写入操作"交给 GroupCommitter，
+# 它等待一个很短的时间窗口，把窗口内收到的写入放进同一个事务执行、只提交一次，再把各自的结果
+# 返回给对应的发送方。每条写入用 SAVEPOINT 隔离，一条失败只回滚它自己。
+# 依赖 eventlet（服务本身运行在 eventlet 模式下），窗口为 0 时不启用。
+import logging
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitter:
+    def __init__(self, app=None, db=None, executor=None):
+        self.enabled = False
+        self.window = 0.0
+        self.max_batch = 1
+        self._pending = []
+        self._flusher_running = False
+        self.batches = 0
+        self.writes = 0
+        if app is not None:
+            self.init_app(app, db, executor)
+
+    def init_app(self, app, db, executor):
+        self.app = app
+        self.db = db
+        self.executor = executor
+        self.window = app.config['MESSAGE_GROUP_COMMIT_WINDOW_MS'] / 1000.0
+        self.max_batch = max(1, int(app.config['MESSAGE_GROUP_COMMIT_MAX_BATCH']))
+        self.enabled = self.window > 0
+        if self.enabled:
+            logger.info(f"Message group commit enabled: window={self.window * 1000:.1f}ms, max_batch={self.max_batch}")
+
+    def submit(self, write, *args):
+        """
+        提交一个写操作 write(conn, *args)，阻塞当前 green thread 直到所在批次提交，
+        返回 write 的返回值；write 抛出的异常会原样抛给调用方。
+        """
+        import eventlet
+        from eventlet.event import Event
+
+        done = Event()
+        self._pending.append((write, args, done))
+        if not self._flusher_running:
+            self._flusher_running = True
+            eventlet.spawn(self._flusher)
+        return done.wait()
+
+    def _flusher(self):
+        import eventlet
+        try:
+            while self._pending:
+                if len(self._pending) < self.max_batch:
+                    # 等待窗口结束，收集同一时间段内其他 green thread 的写入
+                    eventlet.sleep(self.window)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                self._commit_batch(batch)
+        finally:
+            self._flusher_running = False
+
+    def _commit_batch(self, batch):
+        pool = self.db.get_pool()
+        conn = pool.acquire()
+        try:
+            # 整个批次在线程池中一次执行完，不在 hub 线程里做 IO
+            outcomes = self.executor.run(self._run_batch, conn, batch)
+        except Exception as e:
+            logger.exception(f"Group commit of {len(batch)} writes failed")
+            outcomes = [(False, e)] * len(batch)
+        finally:
+            pool.release(conn)
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, _, done), (ok, value) in zip(batch, outcomes):
+            if ok:
+                done.send(value)
+            else:
+                done.send_exception(value)
+
+    @staticmethod
+    def _run_batch(conn, batch):
+        outcomes = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for index, (write, args, _) in enumerate(batch):
+                conn.execute(f"SAVEPOINT write_{index}")
+                try:
+                    value = write(conn, *args)
+                    conn.execute(f"RELEASE write_{index}")
+                    outcomes.append((True, value))
+                except Exception as e:
+                    conn.execute(f"ROLLBACK TO write_{index}")
+                    conn.execute(f"RELEASE write_{index}")
+                    outcomes.append((False, e))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return outcomes
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'batches': self.batches,
+            'writes': self.writes,
+            'avg_batch': round(self.writes / self.batches, 2) if self.batches else 0.0
+        }
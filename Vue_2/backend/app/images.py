@@ -0,0 +1,408 @@
+# app/images.py
+# 上传图片的后处理：原图（最大 MAX_CONTENT_LENGTH = 16MB）只保存，不直接给列表和聊天预览使用。
+# 后台任务为每张原图生成两个限定尺寸的版本，写入 static/images/variants/，并记录到 image_variants 表：
+#   - thumb：IMAGE_THUMB_SIZE（列表、收藏、会话预览）
+#   - medium：IMAGE_MEDIUM_SIZE（详情页）
+# 先按 EXIF 方向旋转再丢弃全部元数据（位置、设备信息等），只缩小不放大，默认输出 WebP。
+# 原图按内容寻址保存（ImageStore），不再被引用的文件由维护任务分批回收（ImageCollector）。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import time
+import uuid
+import hashlib
+import datetime
+import mimetypes
+import functools
+
+from werkzeug.utils import secure_filename
+
+from .uploads import StreamedUpload, UPLOAD_TMP_PREFIX
+from .exceptions import UploadRejected
+
+VARIANTS_DIR = 'variants'
+IMAGE_JOB_KIND = 'generate_image_variants'
+
+
+class ImageVariants:
+    @staticmethod
+    def enqueue(conn, jobs, image_path):
+        """在 conn 当前事务中登记一个生成任务（不提交）；image_path 为空或已经生成过（重复上传的图片）时什么都不做"""
+        if not image_path:
+            return
+        if conn.execute("SELECT 1 FROM image_variants WHERE source_path = ?", (image_path,)).fetchone() is None:
+            jobs.enqueue(conn, IMAGE_JOB_KIND, {'path': image_path})
+
+    @staticmethod
+    def render(static_root, source_path, sizes, image_format, quality):
+        """
+        生成各尺寸版本，返回 {'thumb': 相对路径, 'medium': 相对路径, 'width': w, 'height': h}。
+        纯 CPU / 文件操作，不访问数据库，在线程池中执行（Pillow 缩放时会释放 GIL）。
+        """
+        from PIL import Image, ImageOps
+
+        source_file = os.path.join(static_root, source_path)
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        out_dir = os.path.join(os.path.dirname(source_file), VARIANTS_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        ext = image_format.lower()
+
+        result = {}
+        with Image.open(source_file) as original:
+            result['width'], result['height'] = original.size
+            # JPEG 可以在解码时直接按 1/2、1/4、1/8 缩小，避免把整张大图解码进内存
+            original.draft('RGB', (max(sizes.values()),) * 2)
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            if image.mode == 'RGBA' and image_format.upper() == 'JPEG':
+                image = image.convert('RGB')
+            # 从大到小依次缩放，小图从上一步的结果继续缩，省去重复处理原图
+            for name, size in sorted(sizes.items(), key=lambda kv: -kv[1]):
+                image.thumbnail((size, size), Image.LANCZOS)
+                filename = f"{stem}_{name}.{ext}"
+                # 不传 exif / icc_profile，输出文件不带任何元数据
+                image.save(os.path.join(out_dir, filename), format=image_format, quality=quality, method=4)
+                result[name] = '/'.join((os.path.dirname(source_path), VARIANTS_DIR, filename))
+        return result
+
+    @staticmethod
+    def save(conn, source_path, variants):
+        """记录生成结果（不提交）"""
+        conn.execute("""
+            INSERT OR REPLACE INTO image_variants (source_path, thumb_path, medium_path, width, height, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (source_path, variants.get('thumb'), variants.get('medium'), variants.get('width'),
+              variants.get('height'), datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    @staticmethod
+    def remove(conn, static_root, source_path):
+        """删除某张原图的所有版本文件和记录（不提交）"""
+        row = conn.execute(
+            "SELECT thumb_path, medium_path FROM image_variants WHERE source_path = ?", (source_path,)
+        ).fetchone()
+        if row is None:
+            return
+        for path in (row['thumb_path'], row['medium_path']):
+            if path:
+                try:
+                    os.remove(os.path.join(static_root, path))
+                except OSError:
+                    pass
+        conn.execute("DELETE FROM image_variants WHERE source_path = ?", (source_path,))
+
+    @staticmethod
+    def generate_job(payload):
+        """后台任务：为 payload['path'] 生成各尺寸版本并记录"""
+        from flask import current_app
+        from PIL import UnidentifiedImageError
+        from app import db, executor, entity_cache
+
+        config = current_app.config
+        static_root = os.path.join(current_app.root_path, 'static')
+        source_path = payload['path']
+        if not os.path.exists(os.path.join(static_root, source_path)):
+            # 原图已被替换或删除
+            return 'source missing'
+        sizes = {'thumb': int(config['IMAGE_THUMB_SIZE']), 'medium': int(config['IMAGE_MEDIUM_SIZE'])}
+        try:
+            variants = executor.run(ImageVariants.render, static_root, source_path, sizes,
+                                    config['IMAGE_VARIANT_FORMAT'], int(config['IMAGE_VARIANT_QUALITY']))
+        except UnidentifiedImageError:
+            # 不是图片，重试也没有用；接口继续返回原图地址
+            logger.warning(f"Cannot generate variants for {source_path}: not a recognized image")
+            return 'not an image'
+        db.run_transaction(ImageVariants.save, source_path, variants)
+        # 已缓存的商品/用户带着 NULL 的缩略图路径，让它们重新读取
+        entity_cache.invalidate_if(lambda entity: source_path in (entity.get('image_path'), entity.get('avatar_url')))
+        return variants
+
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ImageStore:
+    """
+    按内容寻址的原图存储：文件名是内容的 SHA-256，路径为 images/<前 2 位>/<sha256>.<ext>，
+    同一张图片不管上传多少次只存一份。images 表的引用数由触发器维护（见 0009_image_store.sql）。
+    """
+
+    @staticmethod
+    def content_path(digest, ext):
+        return '/'.join(('images', digest[:2], f"{digest}.{ext}"))
+
+    @staticmethod
+    def _spool(upload, images_dir):
+        """不是经 UploadRequest 流式接收的文件：边写临时文件边计算哈希，返回 (临时文件, sha256, 大小)"""
+        tmp_file = os.path.join(images_dir, f"{UPLOAD_TMP_PREFIX}{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_file, 'wb') as f:
+            for chunk in iter(lambda: upload.stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        return tmp_file, digest.hexdigest(), size
+
+    @staticmethod
+    def save(conn, static_root, upload):
+        """
+        保存上传的文件（werkzeug FileStorage），返回相对路径；在 conn 当前事务中登记，不提交。
+        调用方随后在同一事务里写入引用它的 items.image_path / users.avatar_url 再提交：
+        登记和文件落盘都在写锁内完成，GC 不会在两者之间删除这个文件。
+        """
+        images_dir = os.path.join(static_root, 'images')
+        os.makedirs(images_dir, exist_ok=True)
+        stream = upload.stream
+        if isinstance(stream, StreamedUpload):
+            # 接收时已经写入图片目录并算好哈希，只需要 rename，不再复制
+            digest, size, ext = stream.hexdigest(), stream.size, stream.ext
+            tmp_file = stream.claim()
+        else:
+            ext = secure_filename(upload.filename or '').split('.')[-1].lower()
+            if not ext:
+                raise UploadRejected('UNSUPPORTED_FILE_TYPE', "只支持 JPEG / PNG / GIF / WebP / BMP 图片", 415)
+            tmp_file, digest, size = ImageStore._spool(upload, images_dir)
+        try:
+            # 先执行写语句拿到写锁，再查找已有文件：与 GC 的删除互斥
+            conn.execute(
+                "UPDATE images SET orphaned_at = ? WHERE sha256 = ? AND refcount <= 0", (_now(), digest)
+            )
+            row = conn.execute("SELECT path FROM images WHERE sha256 = ?", (digest,)).fetchone()
+            if row is None:
+                path = ImageStore.content_path(digest, ext)
+                # 引用数为 0，调用方写入引用后由触发器加 1；事务回滚时文件由 GC 扫描目录回收
+                conn.execute(
+                    "INSERT OR IGNORE INTO images (path, sha256, size, refcount, orphaned_at, created_at) "
+                    "VALUES (?, ?, ?, 0, ?, ?)",
+                    (path, digest, size, _now(), _now())
+                )
+            else:
+                path = row['path']
+            target = os.path.join(static_root, path)
+            if os.path.exists(target):
+                logger.debug(f"Duplicate upload of {path}, reusing the stored file")
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_file, target)
+            return path
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    @staticmethod
+    def adopt(conn, paths):
+        """
+        登记目录里发现的、images 表中没有的文件（不提交），按 items / users 中的实际引用计算引用数；
+        没有引用的从现在起进入宽限期。返回登记的数量。
+        """
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        adopted = 0
+        for path in paths:
+            if conn.execute("SELECT 1 FROM images WHERE path = ?", (path,)).fetchone():
+                continue
+            # 早期的头像地址带 /static/ 前缀，两种写法都算引用
+            refcount = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM items WHERE image_path = ?) "
+                "+ (SELECT COUNT(*) FROM users WHERE avatar_url IN (?, ?))",
+                (path, path, '/static/' + path)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO images (path, refcount, orphaned_at, created_at) VALUES (?, ?, ?, ?)",
+                (path, refcount, None if refcount else _now(), _now())
+            )
+            adopted += 1
+        return adopted
+
+    @staticmethod
+    def collect(conn, static_root, grace_seconds, limit):
+        """
+        删除超过宽限期仍没有引用的图片：原图、缩略图和记录，每次最多 limit 个（不提交）。
+        BEGIN IMMEDIATE 持有写锁，与 save 互斥；返回删除的数量。
+        """
+        cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=grace_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT path FROM images WHERE refcount <= 0 AND orphaned_at <= ? ORDER BY orphaned_at LIMIT ?",
+            (cutoff, limit)
+        ).fetchall()
+        for row in rows:
+            ImageVariants.remove(conn, static_root, row['path'])
+            # 只删除 static/images 下的文件（早期带 /static/ 前缀的地址只删记录）
+            if row['path'].startswith('images/') and '..' not in row['path']:
+                try:
+                    os.remove(os.path.join(static_root, row['path']))
+                except FileNotFoundError:
+                    pass
+            conn.execute("DELETE FROM images WHERE path = ?", (row['path'],))
+        return len(rows)
+
+    @staticmethod
+    def stats(conn):
+        row = conn.execute("""
+            SELECT COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes,
+                   COALESCE(SUM(refcount <= 0), 0) AS orphaned, COALESCE(SUM(sha256 IS NULL), 0) AS legacy
+            FROM images
+        """).fetchone()
+        return dict(row)
+
+
+class ImageCollector:
+    """
+    孤儿图片回收（维护任务）。每次运行：
+      - 轮流扫描 images/ 或其中一个分片目录，把没有登记的文件（旧版本上传、事务回滚留下的）登记进 images 表
+      - 删除最多 IMAGE_GC_BATCH 个超过宽限期仍没有引用的图片
+    每次只处理一个目录、一小批文件，写锁只持有很短的时间。
+    """
+
+    def __init__(self, db, static_root, grace_seconds, batch):
+        self.db = db
+        self.static_root = static_root
+        self.grace_seconds = grace_seconds
+        self.batch = batch
+        self.cursor = 0         # 下一次扫描的目录
+
+    def _directories(self):
+        images_dir = os.path.join(self.static_root, 'images')
+        if not os.path.isdir(images_dir):
+            return []
+        shards = sorted(entry.name for entry in os.scandir(images_dir)
+                        if entry.is_dir() and entry.name != VARIANTS_DIR)
+        return [''] + shards
+
+    def _untracked_candidates(self, directory):
+        """目录中的原图文件（相对路径）；顺便删除超过宽限期的上传临时文件"""
+        images_dir = os.path.join(self.static_root, 'images', directory)
+        paths = []
+        for entry in os.scandir(images_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(UPLOAD_TMP_PREFIX):
+                if time.time() - entry.stat().st_mtime > self.grace_seconds:
+                    os.remove(entry.path)
+                continue
+            paths.append('/'.join(part for part in ('images', directory, entry.name) if part))
+        return paths
+
+    def scan(self, directory):
+        paths = self._untracked_candidates(directory)
+        adopted = 0
+        # 分批登记，每批一个短事务
+        for start in range(0, len(paths), self.batch):
+            adopted += self.db.run_transaction(ImageStore.adopt, paths[start:start + self.batch])
+        return adopted
+
+    def run(self):
+        directories = self._directories()
+        result = {'scanned': None, 'adopted': 0}
+        if directories:
+            directory = directories[self.cursor % len(directories)]
+            self.cursor += 1
+            result = {'scanned': f"images/{directory}".rstrip('/'), 'adopted': self.scan(directory)}
+        result['collected'] = self.db.run_transaction(
+            ImageStore.collect, self.static_root, self.grace_seconds, self.batch
+        )
+        return result
+
+    def run_all(self, grace_seconds=None):
+        """扫描全部目录并回收到没有可删除的为止（CLI 使用）"""
+        if grace_seconds is not None:
+            self.grace_seconds = grace_seconds
+        adopted = sum(self.scan(directory) for directory in self._directories())
+        collected = 0
+        while True:
+            count = self.db.run_transaction(ImageStore.collect, self.static_root, self.grace_seconds, self.batch)
+            collected += count
+            if count < self.batch:
+                break
+        return {'adopted': adopted, 'collected': collected}
+
+
+# ImageStore 保存的原图文件名就是内容的 SHA-256
+_CONTENT_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+
+@functools.lru_cache(maxsize=4096)
+def _content_digest(path, size, mtime_ns):
+    """文件内容的 SHA-256；以 (路径, 大小, mtime) 为键缓存，文件被重新生成后 mtime 变化，自动重新计算"""
+    from app import executor
+
+    def digest():
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    return executor.run(digest)
+
+
+def image_etag(path, stat):
+    """
+    强 ETag 取自文件内容：按内容寻址的原图直接用文件名中的哈希，
+    缩略图/中图（同一个文件名可能以新的参数重新生成）和旧的 UUID 文件名计算一次内容哈希并缓存
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _CONTENT_NAME.match(stem):
+        return stem
+    return _content_digest(path, stat.st_size, stat.st_mtime_ns)
+
+
+def send_image(directory, filename):
+    """
+    /images/<path> 的缓存模式：上传的文件名都是 UUID，内容不会变，所以
+      - Cache-Control: public, max-age=IMAGE_CACHE_MAX_AGE, immutable，浏览器在有效期内不再请求
+      - 强 ETag = 文件内容的 SHA-256（见 image_etag，多台机器、重新部署后保持一致），If-None-Match 命中返回 304
+      - 支持 Range（206），大图可以分段/断点续传
+      - 文件按 IMAGE_SEND_BLOCK_SIZE 大块读写：一般的图片/分段一次写完，eventlet 不会因为多次小块写入
+        碰上 Nagle + 延迟 ACK（每次请求多等约 40ms）
+      - WSGI 服务器提供 wsgi.file_wrapper（gunicorn、uWSGI）时由它用 sendfile 零拷贝发送；
+        IMAGE_SENDFILE 为 x-sendfile / x-accel-redirect 时交给前面的 Apache / nginx 发送文件
+    """
+    from flask import current_app, request, abort
+    from werkzeug.security import safe_join
+    from werkzeug.wsgi import wrap_file
+
+    config = current_app.config
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    stat = os.stat(path)
+    size = stat.st_size
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    sendfile = config['IMAGE_SENDFILE']
+
+    if sendfile == 'x-accel-redirect':
+        # nginx 从 internal location 直接发送文件，这里只返回头
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = config['IMAGE_ACCEL_REDIRECT_PREFIX'].rstrip('/') + '/' + filename
+    elif sendfile == 'x-sendfile':
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Sendfile'] = path
+        response.content_length = size
+    else:
+        body = wrap_file(request.environ, open(path, 'rb'), buffer_size=int(config['IMAGE_SEND_BLOCK_SIZE']))
+        response = current_app.response_class(body, mimetype=mimetype, direct_passthrough=True)
+        response.content_length = size
+
+    response.set_etag(image_etag(path, stat))
+    response.cache_control.public = True
+    response.cache_control.max_age = int(config['IMAGE_CACHE_MAX_AGE'])
+    response.cache_control.immutable = True
+    if sendfile:
+        # Range 由前面的服务器处理，这里只处理 If-None-Match
+        response = response.make_conditional(request.environ)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+        return response
+    response = response.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+    # werkzeug 只在 206 响应里带 Accept-Ranges，这里让客户端在第一次请求时就知道可以分段
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
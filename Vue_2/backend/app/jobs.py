@@ -0,0 +1,210 @@
+# app/jobs.py
+# 持久化的后台任务队列：请求里只把任务写入 jobs 表（和业务数据同一个事务），由 worker 异步执行。
+# 服务进程里以 SocketIO 后台任务（eventlet green thread）运行 JOB_WORKERS 个 worker；也可以用
+#   FLASK_APP=app flask jobs-run
+# 作为独立的 worker 进程运行。新的任务类型通过 jobs.register(kind, handler) 注册，
+# handler 在 app context 中以 payload（dict）调用，返回值记录到日志。
+# 失败的任务按指数退避重试，超过 max_attempts 后标记为 failed；worker 崩溃遗留的 running 任务
+# 由维护任务 requeue_stale_jobs 放回队列。
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import sqlite3
+import datetime
+
+# UPDATE ... RETURNING 需要 SQLite 3.35+
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _now(offset_seconds=0):
+    return (datetime.datetime.now() + datetime.timedelta(seconds=offset_seconds)).strftime(TIME_FORMAT)
+
+
+class Job:
+    def __init__(self, row):
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'])
+        self.attempts = row['attempts']
+        self.max_attempts = row['max_attempts']
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind}, attempt {self.attempts}/{self.max_attempts})"
+
+
+class JobQueue:
+    def __init__(self, app=None, db=None):
+        self.handlers = {}
+        self.workers = 0
+        self._running = False
+        self.processed = 0
+        self.failed = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.workers = int(app.config['JOB_WORKERS'])
+        self.poll_interval = float(app.config['JOB_POLL_INTERVAL'])
+        self.max_attempts = int(app.config['JOB_MAX_ATTEMPTS'])
+        self.retry_backoff = float(app.config['JOB_RETRY_BACKOFF'])
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+        logger.info(f"Job handler registered: {kind}")
+
+    def enqueue(self, conn, kind, payload, delay=0):
+        """在 conn 当前事务中写入一个任务，不提交（随调用方的业务数据一起提交），返回任务 id"""
+        now = _now()
+        return conn.execute("""
+            INSERT INTO jobs (kind, payload, status, attempts, max_attempts, run_after, created_at, updated_at)
+            VALUES (?, ?, 'pending', 0, ?, ?, ?, ?)
+        """, (kind, json.dumps(payload, ensure_ascii=False), self.max_attempts, _now(delay), now, now)).lastrowid
+
+    # ---------- worker 侧 ----------
+
+    @staticmethod
+    def _claim(conn, now):
+        select_next = "SELECT id FROM jobs WHERE status = 'pending' AND run_after <= ? ORDER BY run_after, id LIMIT 1"
+        if _SQLITE_HAS_RETURNING:
+            # 取任务和标记 running 是同一条语句，多个 worker / 进程不会取到同一个任务
+            return conn.execute(f"""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_at = ?, updated_at = ?
+                WHERE id = ({select_next}) AND status = 'pending'
+                RETURNING id, kind, payload, attempts, max_attempts
+            """, (now, now, now)).fetchone()
+        row = conn.execute(select_next, (now,)).fetchone()
+        if row is None:
+            return None
+        claimed = conn.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_at = ?, updated_at = ?
+            WHERE id = ? AND status = 'pending'
+        """, (now, now, row['id'])).rowcount
+        if not claimed:
+            return None
+        return conn.execute(
+            "SELECT id, kind, payload, attempts, max_attempts FROM jobs WHERE id = ?", (row['id'],)
+        ).fetchone()
+
+    def claim(self):
+        """取出一个到期的任务并标记为 running，没有任务时返回 None（需要 app context）"""
+        row = self.db.run_transaction(self._claim, _now())
+        return Job(row) if row is not None else None
+
+    @staticmethod
+    def _finish(conn, job_id, status, run_after, error):
+        conn.execute("""
+            UPDATE jobs SET status = ?, run_after = COALESCE(?, run_after), locked_at = NULL,
+                            last_error = ?, updated_at = ?
+            WHERE id = ?
+        """, (status, run_after, error, _now(), job_id))
+
+    def run_job(self, job):
+        """在 app context 中执行任务并记录结果，返回是否成功"""
+        with self.app.app_context():
+            handler = self.handlers.get(job.kind)
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler registered for job kind {job.kind}")
+                result = handler(job.payload)
+                self.db.run_transaction(self._finish, job.id, 'done', None, None)
+                self.processed += 1
+                logger.debug(f"{job} done: {result}")
+                return True
+            except Exception as e:
+                self.failed += 1
+                if handler is not None and job.attempts < job.max_attempts:
+                    delay = self.retry_backoff * (2 ** (job.attempts - 1))
+                    status, run_after = 'pending', _now(delay)
+                    logger.warning(f"{job} failed, retrying in {delay:.0f}s: {e}")
+                else:
+                    status, run_after = 'failed', None
+                    logger.exception(f"{job} failed permanently")
+                self.db.run_transaction(self._finish, job.id, status, run_after, str(e)[:500])
+                return False
+
+    def run_pending(self, limit=None):
+        """执行当前所有到期的任务（最多 limit 个），返回执行的任务数"""
+        count = 0
+        while limit is None or count < limit:
+            with self.app.app_context():
+                job = self.claim()
+            if job is None:
+                break
+            self.run_job(job)
+            count += 1
+        return count
+
+    def _worker(self, sleep):
+        while self._running:
+            try:
+                if not self.run_pending(limit=1):
+                    sleep(self.poll_interval)
+            except Exception:
+                logger.exception("Job worker iteration failed")
+                sleep(self.poll_interval)
+
+    def run_forever(self, sleep):
+        self._running = True
+        self._worker(sleep)
+
+    def start(self, socketio):
+        """在 SocketIO 的异步模型（eventlet）里启动 JOB_WORKERS 个 worker"""
+        if self._running or self.workers <= 0:
+            return
+        self._running = True
+        for _ in range(self.workers):
+            socketio.start_background_task(self._worker, socketio.sleep)
+        logger.info(f"Job queue started: {self.workers} workers, kinds={list(self.handlers)}")
+
+    def stop(self):
+        self._running = False
+
+    # ---------- 维护 ----------
+
+    @staticmethod
+    def requeue_stale(conn, stale_after_seconds):
+        """
+        把 locked_at 超过 stale_after_seconds 仍处于 running 的任务（worker 崩溃或进程重启遗留）
+        放回队列；已用完重试次数的标记为 failed。不提交，返回处理的任务数。
+        """
+        cutoff = _now(-stale_after_seconds)
+        now = _now()
+        requeued = conn.execute("""
+            UPDATE jobs SET status = 'pending', locked_at = NULL, run_after = ?, updated_at = ?,
+                            last_error = 'worker lost'
+            WHERE status = 'running' AND locked_at < ? AND attempts < max_attempts
+        """, (now, now, cutoff)).rowcount
+        failed = conn.execute("""
+            UPDATE jobs SET status = 'failed', locked_at = NULL, updated_at = ?, last_error = 'worker lost'
+            WHERE status = 'running' AND locked_at < ?
+        """, (now, cutoff)).rowcount
+        return requeued + failed
+
+    @staticmethod
+    def purge_finished(conn, retention_days):
+        """删除完成超过 retention_days 天的 done 任务（failed 保留以便排查），不提交"""
+        return conn.execute(
+            "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?", (_now(-retention_days * 86400),)
+        ).rowcount
+
+    def stats(self):
+        """worker 计数和各状态的任务数（需要 app context）"""
+        rows = self.db.get_db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'failed': self.failed,
+            'queue': {row['status']: row['n'] for row in rows}
+        }
+
+
+def register_default_handlers(queue, app):
+    """注册内置的任务处理函数"""
+    from .models import Item
+    from .images import ImageVariants, IMAGE_JOB_KIND
+    queue.register(Item.TAG_JOB_KIND, Item.generate_tags_job)
+    queue.register(IMAGE_JOB_KIND, ImageVariants.generate_job)
@@ -0,0 +1,244 @@
+# app/llm_client.py
+# 长期复用的 LLM 客户端（目前只有 Gemini），AI_interface 通过它调用模型：
+#   - genai.Client 每个进程只创建一次，之后所有调用复用（连接池、TLS 会话）
+#   - 每次调用有总截止时间 AI_DEADLINE_S，单次请求超时取 AI_TIMEOUT_S 和剩余时间的较小值
+#   - 429 / 5xx / 网络错误按指数退避 + 随机抖动重试，4xx 请求错误不重试
+#   - 同时进行的调用数不超过 AI_MAX_CONCURRENCY（在线程池中执行，用 threading 信号量限制）
+#   - 熔断：连续 AI_BREAKER_FAILURES 次失败后 AI_BREAKER_RESET_S 秒内直接失败，之后放一个试探请求
+# 调用失败时 generate 返回 None，由调用方回退到已有标签。
+# AI_BASE_URL 可以指向本地桩服务（benchmarks/stub_llm_server.py）做测试。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time
+import random
+import mimetypes
+import threading
+from collections import deque
+
+
+class LLMUnavailable(Exception):
+    """熔断打开、并发已满或超过截止时间，本次调用没有发出或没有完成"""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许发出请求；半开状态下只放行一个试探请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        """试探请求没有真正发出时归还名额"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"LLM circuit breaker opened after {self.consecutive_failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class LLMClient:
+    def __init__(self, app=None):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.breaker = None
+        self._reset_metrics()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.model = config['AI_MODEL_NAME']
+        self.api_key = config['AI_API_KEY'] or os.getenv('GEMINI_API_KEY')
+        self.base_url = config['AI_BASE_URL']
+        self.timeout = float(config['AI_TIMEOUT_S'])
+        self.deadline = float(config['AI_DEADLINE_S'])
+        self.max_retries = int(config['AI_MAX_RETRIES'])
+        self.backoff_base = float(config['AI_BACKOFF_BASE_S'])
+        self.backoff_max = float(config['AI_BACKOFF_MAX_S'])
+        self._slots = threading.BoundedSemaphore(max(1, int(config['AI_MAX_CONCURRENCY'])))
+        self.breaker = CircuitBreaker(int(config['AI_BREAKER_FAILURES']), float(config['AI_BREAKER_RESET_S']))
+        self._client = None
+        self._reset_metrics()
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def _reset_metrics(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+        self._latencies = deque(maxlen=256)     # 最近成功调用的耗时（秒）
+
+    def _get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google import genai
+                    from google.genai import types
+                    http_options = types.HttpOptions(base_url=self.base_url) if self.base_url else None
+                    self._client = genai.Client(api_key=self.api_key, http_options=http_options)
+                    logger.info(f"LLM client created: model={self.model}, base_url={self.base_url or 'default'}")
+        return self._client
+
+    @staticmethod
+    def _is_retryable(error):
+        code = getattr(error, 'code', None)
+        if isinstance(code, int):
+            return code in (408, 429) or code >= 500
+        # 超时、连接失败等没有状态码的错误
+        return True
+
+    @staticmethod
+    def _is_timeout(error):
+        return 'timeout' in type(error).__name__.lower() or isinstance(error, TimeoutError)
+
+    def _backoff(self, attempt, remaining):
+        # full jitter：在 [0, min(max, base * 2^attempt)] 中随机取，避免多个请求同时重试
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        return min(delay, max(0.0, remaining))
+
+    def _load_image(self, img_path):
+        from google.genai import types
+        mime_type = mimetypes.guess_type(img_path)[0] or 'image/jpeg'
+        with open(img_path, 'rb') as f:
+            return types.Part.from_bytes(data=f.read(), mime_type=mime_type)
+
+    def generate(self, prompt, img_path=None):
+        """
+        调用模型生成文本，返回 response.text；未配置、熔断打开、超过截止时间或重试用尽时返回 None。
+        阻塞调用，应在线程池中执行（见 executor）。
+        """
+        if not self.configured:
+            logger.error("LLMClient: no API key configured (AI_API_KEY / GEMINI_API_KEY), skipping generation")
+            return None
+        self.calls += 1
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            logger.warning("LLMClient: circuit breaker open, failing fast")
+            return None
+        try:
+            return self._generate(prompt, img_path)
+        except LLMUnavailable as e:
+            logger.warning(f"LLMClient: {e}")
+            return None
+        except ImportError:
+            self.breaker.release_trial()
+            logger.error("LLMClient: google-genai is not installed (pip install google-genai)")
+            return None
+
+    def _generate(self, prompt, img_path):
+        from google.genai import types
+
+        deadline = time.monotonic() + self.deadline
+        if not self._slots.acquire(timeout=self.deadline):
+            # 没有发出请求，不计入熔断
+            self.breaker.release_trial()
+            raise LLMUnavailable(f"no free slot within {self.deadline:.0f}s")
+        try:
+            # 图片只读取一次，重试时复用；读不到图片时只用文字生成
+            contents = [prompt]
+            if img_path:
+                try:
+                    contents.insert(0, self._load_image(img_path))
+                except OSError as e:
+                    logger.warning(f"LLMClient: cannot read image {img_path}, generating from text only: {e}")
+            client = self._get_client()
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise LLMUnavailable(f"deadline of {self.deadline:.0f}s exceeded after {attempt} attempts")
+                started = time.monotonic()
+                try:
+                    timeout_ms = int(min(self.timeout, remaining) * 1000)
+                    response = client.models.generate_content(
+                        model=self.model,
+                        contents=contents,
+                        config=types.GenerateContentConfig(http_options=types.HttpOptions(timeout=timeout_ms))
+                    )
+                except Exception as e:
+                    if self._is_timeout(e):
+                        self.timeouts += 1
+                    retryable = self._is_retryable(e)
+                    if not retryable or attempt >= self.max_retries:
+                        self.failures += 1
+                        # 请求本身有问题（4xx）不代表服务降级，不触发熔断
+                        if retryable:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                        logger.error(f"LLMClient: generation failed after {attempt + 1} attempts: {e}")
+                        return None
+                    delay = self._backoff(attempt, deadline - time.monotonic())
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning(f"LLMClient: attempt {attempt} failed ({e}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    continue
+                self._latencies.append(time.monotonic() - started)
+                self.successes += 1
+                self.breaker.record_success()
+                return response.text
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            'model': self.model,
+            'breaker': self.breaker.state if self.breaker else None,
+            'calls': self.calls,
+            'successes': self.successes,
+            'failures': self.failures,
+            'retries': self.retries,
+            'timeouts': self.timeouts,
+            'short_circuited': self.short_circuited,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0)}
+        }
@@ -2,14 +2,15 @@ import logging
 logger = logging.getLogger(__name__)
 import os
 
-from flask import Blueprint, request, jsonify, session, current_app, send_from_directory
-from .auth import token_required  # 修改为新的装饰器
+from flask import Blueprint, request, jsonify, g, current_app, send_from_directory
+from .auth import token_required, optional_user_id  # 修改为新的装饰器
 from .models import Item, Favorite, User
+from .images import send_image
 from werkzeug.utils import secure_filename
 import uuid
 from datetime import datetime
 
-from utils import make_response_ok, error_response, make_response_api
+from utils import make_response_ok, error_response, make_response_api, encode_cursor, decode_cursor
 main_bp = Blueprint("main", __name__)
 
 # 提供静态图片文件（商品图片和头像）
@@ -17,6 +18,9 @@ main_bp = Blueprint("main", __name__)
 def serve_images(filename):
     """统一提供商品图片和用户头像"""
     static_folder = os.path.join(current_app.root_path, 'static', 'images')
+    if current_app.config['IMAGE_CACHE_MAX_AGE'] > 0:
+        # 文件名是 UUID、内容不可变：长期缓存 + 强 ETag + Range（见 images.send_image）
+        return send_image(static_folder, filename)
     return send_from_directory(static_folder, filename)
 
 @main_bp.route("/")
@@ -25,15 +29,53 @@ def home():
     return make_response_ok({"message": "Welcome to the Marketplace API: Backend is running."})
 
 # 修改：首页商品列表API
+# 支持键集分页：?limit=20&cursor=<上一页返回的 next_cursor>；不带 limit/cursor 时返回全部
+ITEMS_DEFAULT_PAGE_SIZE = 20
+ITEMS_MAX_PAGE_SIZE = 100
+# POST /api/favorites/check 一次最多查询的商品数
+FAVORITES_CHECK_MAX_IDS = 500
+
+def with_favorite_flags(items, user_id):
+    """给商品列表加上 is_favorite（整页一次查询），user_id 为 None（未登录）时原样返回"""
+    if user_id is None:
+        return items
+    favorite_ids = Favorite.favorite_ids(user_id, [item['id'] for item in items])
+    for item in items:
+        item['is_favorite'] = item['id'] in favorite_ids
+    return items
+
 @main_bp.route("/api/items")
 def index():
     # q 
     q = request.args.get("search", "")
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+
+    user_id = optional_user_id()
+
+    if limit is None and not cursor:
+        items, _ = Item.search_available(q)
+        return jsonify({
+            "ok": True,
+            "data": with_favorite_flags(items, user_id)
+        })
 
-    items = Item.search_available(q)
+    try:
+        limit = int(limit) if limit is not None else ITEMS_DEFAULT_PAGE_SIZE
+        after = decode_cursor(cursor) if cursor else None
+        # 游标必须是 [created_at, id]，伪造的游标不能带着其他类型进入 SQL 参数
+        if after is not None and not (len(after) == 2 and isinstance(after[0], str)
+                                      and isinstance(after[1], int) and not isinstance(after[1], bool)):
+            raise ValueError(f"invalid cursor: {cursor}")
+    except ValueError:
+        return error_response("INVALID_INPUT", "分页参数错误", status_code=400)
+    limit = max(1, min(limit, ITEMS_MAX_PAGE_SIZE))
+
+    items, next_after = Item.search_available(q, limit=limit, after=after)
     return jsonify({
         "ok": True,
-        "data": items
+        "data": with_favorite_flags(items, user_id),
+        "next_cursor": encode_cursor(list(next_after)) if next_after else None
     })
 
 # 修改：发布商品API
@@ -62,12 +104,12 @@ def publish():
         price_val = 0.0
     auto_generate_tags = []  # add auto tags logic here that use AI model
     
-    item_id = Item.publish(session["user_id"], title, description, price_val, tags, image)
+    item_id = Item.publish(g.user_id, title, description, price_val, tags, image)
     return jsonify({
         "ok": True,
         "data": {
             "id": item_id,
-            "seller_id": session["user_id"],
+            "seller_id": g.user_id,
             "title": title
         }
     }), 201
@@ -89,8 +131,9 @@ def item_detail(item_id):
     # 检查是否已收藏
     is_favorite = False
 
-    if 'user_id' in session:
-        is_favorite = Favorite.is_favorite(session['user_id'], item_id)
+    user_id = optional_user_id()
+    if user_id is not None:
+        is_favorite = Favorite.is_favorite(user_id, item_id)
     
     return jsonify({
         "ok": True,
@@ -104,11 +147,11 @@ def item_detail(item_id):
 @main_bp.route("/api/items/my")
 @token_required
 def user_items():
-    logger.debug(f"Fetching items for user ID: {session['user_id']}")
-    items = Item.find_by_user(session['user_id'])
+    logger.debug(f"Fetching items for user ID: {g.user_id}")
+    items = Item.find_by_user(g.user_id)
     return jsonify({
         "ok": True,
-        "data": items
+        "data": with_favorite_flags(items, g.user_id)
     })
 
 # 新增：下架商品
@@ -126,7 +169,7 @@ def update_item_status(item_id):
         }), 404
     
     # 检查是否是商品的卖家
-    if item['seller_id'] != session['user_id']:
+    if item['seller_id'] != g.user_id:
         return jsonify({
             "ok": False,
             "error": {
@@ -197,7 +240,7 @@ def edit(item_id):
         "ok": True,
         "data": {
             "id": item_id,
-            "seller_id": session["user_id"],
+            "seller_id": g.user_id,
             "title": title
         }
     }), 201
@@ -211,7 +254,7 @@ def delete(item_id):
         "ok": True,
         "data": {
             "id": item_id,
-            "seller_id": session["user_id"],
+            "seller_id": g.user_id,
         }
     }), 201
 
@@ -245,7 +288,7 @@ def add_favorite():
             }
         }), 404
     logger.debug(f"Item found: {item_id}, proceeding to add favorite")
-    success = Favorite.add(session['user_id'], item_id)
+    success = Favorite.add(g.user_id, item_id)
     return jsonify({
         "ok": True,
         "data": {
@@ -258,7 +301,7 @@ def add_favorite():
 @main_bp.route("/api/favorites/<int:item_id>", methods=["DELETE"])
 @token_required
 def remove_favorite(item_id):
-    success = Favorite.remove(session['user_id'], item_id)
+    success = Favorite.remove(g.user_id, item_id)
     return jsonify({
         "ok": True,
         "data": {
@@ -271,7 +314,7 @@ def remove_favorite(item_id):
 @main_bp.route("/api/favorites")
 @token_required
 def get_favorites():
-    favorites = Favorite.get_user_favorites(session['user_id'])
+    favorites = Favorite.get_user_favorites(g.user_id)
     return jsonify({
         "ok": True,
         "data": favorites
@@ -303,7 +346,7 @@ def check_favorite_status():
             }
         }), 400
     
-    is_favorite = Favorite.is_favorite(session['user_id'], item_id)
+    is_favorite = Favorite.is_favorite(g.user_id, item_id)
     
     return jsonify({
         "ok": True,
@@ -313,6 +356,52 @@ def check_favorite_status():
         }
     })
 
+# 批量检查收藏状态：列表页一次请求查询整页商品
+@main_bp.route("/api/favorites/check", methods=["POST"])
+@token_required
+def check_favorite_status_bulk():
+    data = request.get_json(silent=True)
+    # 请求体必须是 JSON 对象；列表、数字等按缺少 item_ids 处理
+    item_ids = data.get('item_ids') if isinstance(data, dict) else None
+
+    if not isinstance(item_ids, list) or not item_ids:
+        return jsonify({
+            "ok": False,
+            "error": {
+                "code": "INVALID_INPUT",
+                "message": "商品ID列表不能为空"
+            }
+        }), 400
+
+    try:
+        item_ids = [int(item_id) for item_id in item_ids]
+    except (TypeError, ValueError):
+        return jsonify({
+            "ok": False,
+            "error": {
+                "code": "INVALID_INPUT",
+                "message": "商品ID格式错误"
+            }
+        }), 400
+
+    if len(item_ids) > FAVORITES_CHECK_MAX_IDS:
+        return jsonify({
+            "ok": False,
+            "error": {
+                "code": "INVALID_INPUT",
+                "message": f"一次最多查询{FAVORITES_CHECK_MAX_IDS}个商品"
+            }
+        }), 400
+
+    favorite_ids = Favorite.favorite_ids(g.user_id, item_ids)
+    return jsonify({
+        "ok": True,
+        "data": [
+            {"item_id": item_id, "is_favorite": item_id in favorite_ids}
+            for item_id in item_ids
+        ]
+    })
+
 # 注意：所有聊天相关的路由已移至 chat.py 蓝图---wzy(下一版本将删除此注释, )---
 # - POST /api/messages (发送消息)
 # - GET /api/messages/conversations (获取会话列表)
@@ -0,0 +1,169 @@
+# app/maintenance.py
+# 后台维护任务调度器：把过期锁定释放这类"顺手清理"的写操作从读路径中挪出来，按固定间隔执行。
+# 服务进程里以 SocketIO 后台任务（eventlet green thread）运行；也可以用
+#   FLASK_APP=app flask maintenance-run
+# 作为独立的 worker 进程运行。新的清理任务通过 scheduler.register() 注册即可。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time
+
+
+class MaintenanceJob:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval    # 秒
+        self.func = func
+        self.next_run = 0.0         # time.monotonic() 时间点，0 表示启动后立即执行一次
+        self.runs = 0
+        self.failures = 0
+        self.last_result = None
+
+
+class MaintenanceScheduler:
+    def __init__(self, app=None):
+        self.app = app
+        self.jobs = {}
+        self._running = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def register(self, name, interval, func):
+        """注册一个周期任务，func 在 app context 中无参调用，返回值会记录到日志"""
+        if interval <= 0:
+            logger.info(f"Maintenance job {name} disabled (interval={interval})")
+            return
+        self.jobs[name] = MaintenanceJob(name, interval, func)
+        logger.info(f"Maintenance job registered: {name}, every {interval}s")
+
+    def run_job(self, job):
+        with self.app.app_context():
+            try:
+                job.last_result = job.func()
+                job.runs += 1
+                logger.debug(f"Maintenance job {job.name} done: {job.last_result}")
+            except Exception:
+                job.failures += 1
+                logger.exception(f"Maintenance job {job.name} failed")
+        job.next_run = time.monotonic() + job.interval
+
+    def run_pending(self):
+        """执行所有到期的任务，返回距下一个任务到期的秒数"""
+        now = time.monotonic()
+        for job in list(self.jobs.values()):
+            if job.next_run <= now:
+                self.run_job(job)
+        if not self.jobs:
+            return None
+        return max(0.0, min(job.next_run for job in self.jobs.values()) - time.monotonic())
+
+    def run_all(self):
+        """忽略间隔，立即把所有任务各执行一次（CLI --once 使用）"""
+        for job in list(self.jobs.values()):
+            self.run_job(job)
+
+    def run_forever(self, sleep=time.sleep, max_tick=1.0):
+        self._running = True
+        while self._running:
+            wait = self.run_pending()
+            sleep(max_tick if wait is None else min(wait, max_tick))
+
+    def start(self, socketio):
+        """在 SocketIO 的异步模型（eventlet）里启动调度循环"""
+        if self._running:
+            return
+        # 在启动后台任务之前置位：调度循环要等到 green thread 真正运行时才开始，重复调用 start 不能再启动一个
+        self._running = True
+        logger.info(f"Maintenance scheduler started with jobs: {list(self.jobs)}")
+        socketio.start_background_task(self.run_forever, sleep=socketio.sleep)
+
+    def stop(self):
+        self._running = False
+
+
+def register_default_jobs(scheduler, app):
+    """注册内置的维护任务，间隔来自 app.config"""
+    from .models import Item
+    from .jobs import JobQueue
+    from .tag_cache import TagCache
+    from .images import ImageCollector
+    from app import db, tag_suggester, token_cache, entity_cache, presence, typing_coalescer
+
+    lock_hours = app.config['ITEM_LOCK_EXPIRY_HOURS']
+    scheduler.register(
+        'release_expired_item_locks',
+        app.config['MAINTENANCE_LOCK_SWEEP_INTERVAL'],
+        lambda: Item.release_expired_locks(lock_hours)
+    )
+
+    # 后台任务队列：回收崩溃 worker 遗留的任务，清理过期的已完成任务
+    stale_after = app.config['JOB_STALE_AFTER']
+    retention_days = app.config['JOB_RETENTION_DAYS']
+    scheduler.register(
+        'requeue_stale_jobs',
+        app.config['MAINTENANCE_JOB_SWEEP_INTERVAL'],
+        lambda: db.run_transaction(JobQueue.requeue_stale, stale_after)
+    )
+    scheduler.register(
+        'purge_finished_jobs',
+        app.config['MAINTENANCE_JOB_SWEEP_INTERVAL'],
+        lambda: db.run_transaction(JobQueue.purge_finished, retention_days)
+    )
+
+    # AI 标签缓存：删除过期的磁盘缓存
+    scheduler.register(
+        'purge_expired_tag_cache',
+        app.config['MAINTENANCE_CACHE_SWEEP_INTERVAL'],
+        lambda: db.run_transaction(TagCache.purge_expired)
+    )
+
+    # 本地标签推荐模型：定期整体重建，使商品的修改/删除生效
+    scheduler.register(
+        'rebuild_tag_suggester',
+        app.config['MAINTENANCE_TAG_MODEL_REBUILD_INTERVAL'],
+        tag_suggester.refresh
+    )
+
+    # 图片存储：分批删除不再被商品/头像引用的图片
+    collector = ImageCollector(db, os.path.join(app.root_path, 'static'),
+                               app.config['IMAGE_GC_GRACE_S'], int(app.config['IMAGE_GC_BATCH']))
+    scheduler.register(
+        'collect_orphan_images',
+        app.config['MAINTENANCE_IMAGE_GC_INTERVAL'],
+        collector.run
+    )
+
+    # 共享在线状态：刷新本进程心跳，清理已退出进程留下的连接（memory 模式不需要）
+    scheduler.register(
+        'presence_heartbeat',
+        app.config['PRESENCE_HEARTBEAT_INTERVAL'] if app.config['PRESENCE_BACKEND'] == 'sqlite' else 0,
+        presence.heartbeat
+    )
+
+    # 进程内缓存的命中率，用于调整 ENTITY_CACHE_SIZE / TOKEN_CACHE_SIZE
+    def report_cache_stats():
+        stats = {'entity_cache': entity_cache.stats(), 'token_cache': token_cache.stats()}
+        logger.info(f"Cache stats: {stats}")
+        return stats
+
+    scheduler.register(
+        'report_cache_stats',
+        app.config['MAINTENANCE_CACHE_STATS_INTERVAL'],
+        report_cache_stats
+    )
+
+    # "正在输入"转发的合并效果（收到多少事件、实际推送多少）
+    def report_typing_stats():
+        stats = typing_coalescer.stats()
+        logger.info(f"Typing indicator stats: {stats}")
+        return stats
+
+    scheduler.register(
+        'report_typing_stats',
+        app.config['MAINTENANCE_CACHE_STATS_INTERVAL'],
+        report_typing_stats
+    )
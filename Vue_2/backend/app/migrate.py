@@ -0,0 +1,129 @@
+# app/migrate.py
+# 带版本号的在线数据库迁移。
+# 迁移文件放在 app/migrations/ 下，文件名为 <4位版本号>_<说明>.sql 或 .py：
+#   - .sql：直接执行其中的语句
+#   - .py ：模块中定义 upgrade(conn)，用于需要 Python 参与的迁移（例如回填全文索引）
+# 已执行的版本记录在 schema_version 表中。每个迁移和它的版本记录在同一个事务里提交，
+# 失败时整体回滚，数据库停留在上一个版本，不会删库重建。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import sqlite3
+import datetime
+import importlib.util
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+_FILENAME_RE = re.compile(r'^(\d{4})_([A-Za-z0-9_]+)\.(sql|py)$')
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def apply(self, conn):
+        if self.path.endswith('.sql'):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                script = f.read()
+            # executescript 会先提交当前事务，所以把 SQL 拆成单条语句在同一个事务里执行
+            for statement in split_sql(script):
+                conn.execute(statement)
+        else:
+            spec = importlib.util.spec_from_file_location(f"migration_{self.version}", self.path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.upgrade(conn)
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def _is_blank(sql):
+    return all(not line.strip() or line.strip().startswith('--') for line in sql.splitlines())
+
+
+def split_sql(script):
+    """按 sqlite3.complete_statement 切分 SQL 脚本，正确处理字符串和触发器里的分号"""
+    statements = []
+    buffer = ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            if not _is_blank(buffer):
+                statements.append(buffer.strip())
+            buffer = ''
+    if not _is_blank(buffer):
+        raise ValueError(f"Incomplete SQL statement in migration: {buffer.strip()[:80]}")
+    return statements
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}: {versions}")
+    return migrations
+
+
+def ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+def current_version(conn):
+    ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def pending_migrations(conn, target=None):
+    version = current_version(conn)
+    return [m for m in discover_migrations()
+            if m.version > version and (target is None or m.version <= target)]
+
+
+def upgrade(conn, target=None):
+    """把数据库升级到 target 版本（默认最新），返回本次执行的迁移列表"""
+    applied = []
+    old_isolation = conn.isolation_level
+    # 手动控制事务，保证 DDL 也在事务内
+    conn.isolation_level = None
+    try:
+        for migration in pending_migrations(conn, target):
+            conn.execute("BEGIN IMMEDIATE")
+            # 拿到写锁后再确认一次，多个进程同时启动时只有一个会执行该迁移
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (migration.version,)).fetchone():
+                conn.execute("ROLLBACK")
+                continue
+            logger.info(f"Applying migration {migration}")
+            try:
+                migration.apply(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                    (migration.version, migration.name, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                logger.exception(f"Migration {migration} failed, rolled back")
+                raise
+            applied.append(migration)
+    finally:
+        conn.isolation_level = old_isolation
+    if applied:
+        logger.info(f"Database upgraded to version {applied[-1].version}")
+    return applied
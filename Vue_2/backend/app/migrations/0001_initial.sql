@@ -1,8 +1,5 @@
--- 清除现有表（如果存在）
-DROP TABLE IF EXISTS messages;
-DROP TABLE IF EXISTS favorites;
-DROP TABLE IF EXISTS items;
-DROP TABLE IF EXISTS users;
+-- 0001 初始表结构（对应原 schema.sql，去掉了 DROP TABLE）
+-- 全部使用 IF NOT EXISTS：迁移系统引入之前创建的旧数据库执行本文件不会有任何变化
 
 -- 用户表
 CREATE TABLE IF NOT EXISTS users (
@@ -44,7 +41,7 @@ CREATE TABLE IF NOT EXISTS favorites (
 );
 
 -- conversation table
-CREATE TABLE conversations (
+CREATE TABLE IF NOT EXISTS conversations (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user1_id INTEGER NOT NULL,
     user2_id INTEGER NOT NULL,
@@ -67,7 +64,7 @@ CREATE TABLE conversations (
 );
 
 -- 消息表
-CREATE TABLE messages (
+CREATE TABLE IF NOT EXISTS messages (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     conversation_id INTEGER NOT NULL,
     from_user_id INTEGER NOT NULL,
@@ -85,4 +82,4 @@ CREATE TABLE messages (
     FOREIGN KEY (from_user_id) REFERENCES users(id),
     FOREIGN KEY (to_user_id) REFERENCES users(id),
     FOREIGN KEY (item_id) REFERENCES items(id)
-);
\ No newline at end of file
+);
@@ -0,0 +1,5 @@
+-- 0002 商品列表相关索引
+-- 首页列表按 (created_at, id) 键集分页
+CREATE INDEX IF NOT EXISTS idx_items_status_created ON items (status, created_at, id);
+-- 维护任务按 (status, updated_at) 扫描过期的锁定商品
+CREATE INDEX IF NOT EXISTS idx_items_status_updated ON items (status, updated_at);
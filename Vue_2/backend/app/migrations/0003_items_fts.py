@@ -0,0 +1,7 @@
+# 0003 商品全文检索索引 items_fts（rowid = items.id），创建后从 items 表回填
+# 索引文本需要经过 app/search.py 的 bigram 切分，所以用 Python 迁移而不是 SQL
+from app.search import ItemSearchIndex
+
+
+def upgrade(conn):
+    ItemSearchIndex.ensure(conn)
@@ -0,0 +1,13 @@
+-- 0004 热点查询索引
+-- 我发布的商品：WHERE seller_id = ? ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS idx_items_seller_created ON items (seller_id, created_at);
+-- 收藏列表：WHERE user_id = ? ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS idx_favorites_user_created ON favorites (user_id, created_at);
+-- 删除商品时清理收藏
+CREATE INDEX IF NOT EXISTS idx_favorites_item ON favorites (item_id);
+-- 聊天记录：WHERE conversation_id = ? ORDER BY id
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id, id);
+-- 会话列表：WHERE user1_id = ? OR user2_id = ?（user1_id 已由 UNIQUE 约束覆盖）
+CREATE INDEX IF NOT EXISTS idx_conversations_user2 ON conversations (user2_id);
+-- 删除商品时清理会话
+CREATE INDEX IF NOT EXISTS idx_conversations_item ON conversations (item_id);
@@ -0,0 +1,3 @@
+-- 0005 未读消息部分索引：已读回执只需要定位某会话中发给某用户的未读消息，
+-- 已读的消息不进入索引，标记已读的开销只和未读条数有关，与历史长度无关
+CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages (conversation_id, to_user_id, id) WHERE is_read = 0;
@@ -0,0 +1,19 @@
+-- 0006 后台任务队列：耗时操作（AI 标签生成等）不在请求里同步执行，先写入 jobs 表，由 worker 取出执行。
+-- 任务状态保存在数据库里，服务重启后未完成的任务会继续执行
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,                         -- 任务类型，对应 JobQueue.register 注册的处理函数
+    payload TEXT NOT NULL DEFAULT '{}',         -- JSON 参数
+    status TEXT NOT NULL DEFAULT 'pending',     -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL,               -- 最早执行时间，失败重试时按退避时间推后
+    locked_at TIMESTAMP,                        -- 被 worker 取走的时间，用于回收崩溃 worker 的任务
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+-- worker 取任务只扫描待执行的部分
+CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (run_after, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_at) WHERE status = 'running';
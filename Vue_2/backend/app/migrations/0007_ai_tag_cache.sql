@@ -0,0 +1,11 @@
+-- 0007 AI 标签缓存的磁盘层：相同的标签输入 + 图片内容 + 模型直接复用上次的生成结果，不再调用模型。
+-- cache_key 为三者规范化后的 sha256，过期的记录由维护任务清理
+CREATE TABLE IF NOT EXISTS ai_tag_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_tag_cache_expires ON ai_tag_cache (expires_at);
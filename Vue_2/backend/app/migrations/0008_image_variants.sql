@@ -0,0 +1,10 @@
+-- 0008 图片缩略图/中图：上传的原图由后台任务生成限定尺寸的 WebP 版本（去掉 EXIF），
+-- 按原图路径记录，商品、头像共用；列表、收藏、会话接口 LEFT JOIN 该表返回缩略图地址
+CREATE TABLE IF NOT EXISTS image_variants (
+    source_path TEXT PRIMARY KEY,   -- 原图路径，与 items.image_path / users.avatar_url 相同，例如 images/<uuid>.jpg
+    thumb_path TEXT,                -- 列表、聊天预览使用
+    medium_path TEXT,               -- 详情页使用
+    width INTEGER,                  -- 原图尺寸
+    height INTEGER,
+    created_at TIMESTAMP NOT NULL
+);
@@ -0,0 +1,72 @@
+-- 0009 按内容寻址的图片存储：新上传的图片保存为 images/<sha256 前 2 位>/<sha256>.<ext>，内容相同的只存一份。
+-- images 表记录每个文件被 items.image_path / users.avatar_url 引用的次数（由下面的触发器维护），
+-- 引用数降为 0 时记下时间，维护任务 collect_orphan_images 在宽限期过后删除文件、缩略图和记录。
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,              -- 与 items.image_path / users.avatar_url 相同
+    sha256 TEXT UNIQUE,                 -- 内容哈希；本迁移之前上传的旧文件为 NULL
+    size INTEGER,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    orphaned_at TIMESTAMP,              -- 引用数降为 0 的时间，有引用时为 NULL
+    created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+-- GC 只扫描没有引用的图片
+CREATE INDEX IF NOT EXISTS idx_images_orphaned ON images (orphaned_at) WHERE refcount <= 0;
+
+-- 已有数据：登记所有被引用的旧文件（没有被引用的旧文件由 GC 扫描目录时发现）
+INSERT OR IGNORE INTO images (path, refcount)
+SELECT path, COUNT(*) FROM (
+    SELECT image_path AS path FROM items WHERE image_path IS NOT NULL
+    UNION ALL
+    SELECT avatar_url AS path FROM users WHERE avatar_url IS NOT NULL
+) GROUP BY path;
+
+CREATE TRIGGER IF NOT EXISTS items_image_insert AFTER INSERT ON items
+WHEN NEW.image_path IS NOT NULL
+BEGIN
+    INSERT OR IGNORE INTO images (path) VALUES (NEW.image_path);
+    UPDATE images SET refcount = refcount + 1, orphaned_at = NULL WHERE path = NEW.image_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_image_update AFTER UPDATE OF image_path ON items
+WHEN OLD.image_path IS NOT NEW.image_path
+BEGIN
+    UPDATE images SET refcount = refcount - 1,
+        orphaned_at = CASE WHEN refcount <= 1 THEN datetime('now', 'localtime') END
+    WHERE path = OLD.image_path;
+    INSERT OR IGNORE INTO images (path) SELECT NEW.image_path WHERE NEW.image_path IS NOT NULL;
+    UPDATE images SET refcount = refcount + 1, orphaned_at = NULL WHERE path = NEW.image_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_image_delete AFTER DELETE ON items
+WHEN OLD.image_path IS NOT NULL
+BEGIN
+    UPDATE images SET refcount = refcount - 1,
+        orphaned_at = CASE WHEN refcount <= 1 THEN datetime('now', 'localtime') END
+    WHERE path = OLD.image_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_avatar_insert AFTER INSERT ON users
+WHEN NEW.avatar_url IS NOT NULL
+BEGIN
+    INSERT OR IGNORE INTO images (path) VALUES (NEW.avatar_url);
+    UPDATE images SET refcount = refcount + 1, orphaned_at = NULL WHERE path = NEW.avatar_url;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_avatar_update AFTER UPDATE OF avatar_url ON users
+WHEN OLD.avatar_url IS NOT NEW.avatar_url
+BEGIN
+    UPDATE images SET refcount = refcount - 1,
+        orphaned_at = CASE WHEN refcount <= 1 THEN datetime('now', 'localtime') END
+    WHERE path = OLD.avatar_url;
+    INSERT OR IGNORE INTO images (path) SELECT NEW.avatar_url WHERE NEW.avatar_url IS NOT NULL;
+    UPDATE images SET refcount = refcount + 1, orphaned_at = NULL WHERE path = NEW.avatar_url;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_avatar_delete AFTER DELETE ON users
+WHEN OLD.avatar_url IS NOT NULL
+BEGIN
+    UPDATE images SET refcount = refcount - 1,
+        orphaned_at = CASE WHEN refcount <= 1 THEN datetime('now', 'localtime') END
+    WHERE path = OLD.avatar_url;
+END;
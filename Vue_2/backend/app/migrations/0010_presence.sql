@@ -0,0 +1,17 @@
+-- 0010 在线状态的共享存储（PRESENCE_BACKEND = 'sqlite'）：多个服务进程各自登记自己的 socket 连接，
+-- 互相能看到对方进程里在线的用户。每个进程有一个 server_id，定期刷新 presence_servers.heartbeat_at；
+-- 进程崩溃后心跳停止，超过 PRESENCE_STALE_AFTER 后它登记的连接由其他进程的维护任务清理。
+CREATE TABLE IF NOT EXISTS presence (
+    sid TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    server_id TEXT NOT NULL,
+    connected_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_presence_user ON presence (user_id);
+CREATE INDEX IF NOT EXISTS idx_presence_server ON presence (server_id);
+
+CREATE TABLE IF NOT EXISTS presence_servers (
+    server_id TEXT PRIMARY KEY,
+    heartbeat_at TIMESTAMP NOT NULL
+);
@@ -0,0 +1,11 @@
+-- 0011 Socket.IO 跨进程消息队列（SOCKETIO_MESSAGE_QUEUE = 'sqlite'，见 socketio_queue.py）：
+-- 任一进程 emit 时写入一行，所有服务进程按自增 id 轮询读取并推送给自己进程里的连接。
+-- AUTOINCREMENT 保证 id 不会因为删除旧记录而复用，读取游标不会漏掉或重复消息；超过保留时间的记录定期删除。
+CREATE TABLE IF NOT EXISTS socketio_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL            -- time.time()
+);
+
+CREATE INDEX IF NOT EXISTS idx_socketio_queue_created ON socketio_queue (created_at);
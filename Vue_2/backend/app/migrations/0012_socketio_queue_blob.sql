@@ -0,0 +1,13 @@
+-- 0012 socketio_queue.payload 改为 BLOB：队列改用 pickle 序列化（与 python-socketio 自带的 manager 一致），
+-- emit 的数据可以包含 bytes、datetime 等 JSON 无法表示的值。
+-- 队列里只有最近 SOCKETIO_QUEUE_RETENTION_S 秒的临时消息，直接重建表，不迁移旧数据。
+DROP TABLE IF EXISTS socketio_queue;
+
+CREATE TABLE socketio_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    payload BLOB NOT NULL,              -- pickle.dumps(data)
+    created_at REAL NOT NULL            -- time.time()
+);
+
+CREATE INDEX IF NOT EXISTS idx_socketio_queue_created ON socketio_queue (created_at);
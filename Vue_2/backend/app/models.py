@@ -6,16 +6,28 @@ import logging
 import hydra
 logger = logging.getLogger(__name__)
 
+import json
 import sqlite3
 import datetime
-import uuid
 from flask import g, current_app
-from werkzeug.utils import secure_filename
 from .exceptions import UsernameTakenError, InvalidPasswordError
-from app import db
+from .search import ItemSearchIndex, build_match_query, FTS_TABLE
+from .images import ImageVariants, ImageStore
+from app import db, executor, group_commit, jobs, tag_cache, llm_client, tag_suggester, entity_cache
 
 
 
+# 商品查询附带缩略图/中图路径（后台任务生成之前为 NULL，前端退回 image_path）
+_ITEM_VARIANTS_JOIN = "LEFT JOIN image_variants ON image_variants.source_path = items.image_path"
+_ITEM_VARIANTS_COLUMNS = "image_variants.thumb_path, image_variants.medium_path"
+
+# 卖家删除商品时只标记为下架（软删除）：买家与卖家关于该商品的会话和消息都引用这条记录，需要保留
+ITEM_STATUS_REMOVED = 'removed'
+
+# INSERT ... RETURNING 需要 SQLite 3.35+
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
 class User:
     @staticmethod
     def create(username, password, email, phone):
@@ -68,12 +80,17 @@ class User:
     
     @staticmethod
     def find_by_id(user_id):
+        # 请求内 / 进程内缓存（见 entity_cache.py），修改用户信息后需要 entity_cache.invalidate
+        return entity_cache.get('user', user_id, User._load)
+
+    @staticmethod
+    def _load(user_id):
         conn = db.get_db()
         user = conn.execute(
-            "SELECT * FROM users WHERE id = ?", (user_id,)
+            """SELECT users.*, image_variants.thumb_path AS avatar_thumb_url
+               FROM users LEFT JOIN image_variants ON image_variants.source_path = users.avatar_url
+               WHERE users.id = ?""", (user_id,)
         ).fetchone()
-        for k, v in dict(user).items():
-            logger.debug(f"User field: {k} = {v}")
         if user:
             return {
                 "id": user['id'],
@@ -81,7 +98,8 @@ class User:
                 "email": user['email'],
                 "phone": user['phone'],
                 "created_at": user['created_at'],
-                "avatar_url": user['avatar_url']
+                "avatar_url": user['avatar_url'],
+                "avatar_thumb_url": user['avatar_thumb_url']
             }
         return None
     
@@ -101,6 +119,7 @@ class User:
         """, (username, email, user_id))
 
         conn.commit()
+        entity_cache.invalidate('user', user_id)
     
         cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
         user = cursor.fetchone()
@@ -120,7 +139,7 @@ class User:
         cursor.execute("SELECT password FROM users WHERE id = ?", (user_id,))
         result = cursor.fetchone()
 
-        if not check_password_hash(result['password'], old):
+        if not executor.run(check_password_hash, result['password'], old):
             raise InvalidPasswordError()
 
         cursor.execute("""
@@ -159,30 +178,11 @@ class User:
     
     @staticmethod
     def upload_avatar(user_id, avatar):
-        avatar_path = None
-        upload_folder = os.path.join(current_app.root_path, 'static/images')
-        os.makedirs(upload_folder, exist_ok=True)
-            
-        ext = secure_filename(avatar.filename).split('.')[-1]
-        filename = f"avatar_{user_id}_{uuid.uuid4()}.{ext}"
-        avatar_path = os.path.join('images', filename)
-        avatar.save(os.path.join(upload_folder, filename))
-        
-        avatar_url = f"{avatar_path}"
-        
         conn = db.get_db()
         cursor = conn.cursor()
-        user = User.find_by_id(user_id)
-        
-        old_avatar_url = user['avatar_url'] if 'avatar_url' in user else None
-        if old_avatar_url:
-            old_path = old_avatar_url.replace('/static/', '')
-            old_full_path = os.path.join(current_app.root_path, 'static', old_path)
-            if os.path.exists(old_full_path):
-                try:
-                    os.remove(old_full_path)
-                except Exception as e:
-                    logger.warning(f"删除旧头像失败: {e}")
+        # 按内容保存；旧头像不在这里删除（可能和别的商品图片是同一个文件），
+        # 引用数降为 0 后由维护任务 collect_orphan_images 回收
+        avatar_url = ImageStore.save(conn, os.path.join(current_app.root_path, 'static'), avatar)
         
         cursor.execute(
             """UPDATE users 
@@ -190,8 +190,11 @@ class User:
                WHERE id = ?""",
             (avatar_url, user_id)
         )
+        if current_app.config['IMAGE_VARIANTS_ENABLED']:
+            ImageVariants.enqueue(conn, jobs, avatar_url)
         
         conn.commit()
+        entity_cache.invalidate('user', user_id)
 
         return avatar_url
 
@@ -203,21 +206,10 @@ class Item:
         conn = db.get_db()
         image_path = None
         if image:
-            # 保存图片
-            upload_folder = os.path.join(current_app.root_path, 'static/images')
-            os.makedirs(upload_folder, exist_ok=True)
-            # 生成唯一文件名
-            ext = secure_filename(image.filename).split('.')[-1]
-            filename = f"{uuid.uuid4()}.{ext}"
-            image_path = os.path.join('images', filename)
-            # 保存文件
-            image.save(os.path.join(upload_folder, filename))
-        # Version2: integrate AI tags auto generate function:
-        auto_tags = AI_interface.generate_tags(existing_tags=tags, img_path=os.path.join(upload_folder, filename) if image else None)
-
-        # >>>TODO>>>: **Notice: 当前逻辑是直接替换掉原有的tags从而最小程度的减小对其他部分code的改动，但是效果并不一定理想**
-        tags = auto_tags[:255] # ensure tags length limit to 255 characters
-        # <<<TODO<<<  后续确定了修改逻辑之后删除这些多余的Annotations
+            # 按内容保存图片，重复上传的图片复用已有文件（在本事务中登记，和商品一起提交）
+            image_path = ImageStore.save(conn, os.path.join(current_app.root_path, 'static'), image)
+        # AI 标签生成改为后台任务：先按用户填写的标签发布，生成结果稍后写回（见 generate_tags_job）
+        tags = (tags or '')[:255]
 
         cursor = conn.cursor()
         # using user_id to get seller_name:
@@ -233,30 +225,112 @@ class Item:
                image_path, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (user_id, seller_name, title, description, price, tags, image_path, 'available', curr_time, curr_time) 
         )
+        item_id = cursor.lastrowid
+        ItemSearchIndex.upsert(conn, item_id, title, description, tags)
+        if current_app.config['AI_TAG_BACKEND'] != 'off':
+            # 任务和商品在同一个事务里提交，不会出现有商品没任务（或反过来）的情况
+            jobs.enqueue(conn, Item.TAG_JOB_KIND, {'item_id': item_id, 'seller_id': user_id})
+        if current_app.config['IMAGE_VARIANTS_ENABLED']:
+            # 缩略图/中图在后台生成，不占用请求时间
+            ImageVariants.enqueue(conn, jobs, image_path)
         conn.commit()
-        return cursor.lastrowid
+        tag_suggester.add(item_id, title, tags)
+        return item_id
     
+    TAG_JOB_KIND = 'generate_item_tags'
+
     @staticmethod
-    def search_available(query=''):
+    def generate_tags_job(payload):
+        """
+        后台任务：为商品生成 AI 标签，写回 items 并刷新全文索引，然后通过 Socket.IO 通知卖家。
+        调用 AI 接口期间卖家可能已经修改了标签，写回时以生成前读到的标签为条件，不覆盖卖家的修改。
+        """
+        from app import socketio
+
+        item_id = payload['item_id']
         conn = db.get_db()
-        if query:
-            logger.debug(f'query is required: {query}')
-            items = conn.execute(
-                """SELECT items.*
-                   FROM items
-                   WHERE items.status = 'available' AND 
-                   (items.title LIKE ? OR items.description LIKE ? OR items.tags LIKE ?)
-                   ORDER BY items.created_at DESC""",
-                (f'%{query}%', f'%{query}%', f'%{query}%')
-            ).fetchall()
+        item = conn.execute(
+            "SELECT seller_id, title, description, tags, image_path FROM items WHERE id = ? AND status != ?",
+            (item_id, ITEM_STATUS_REMOVED)
+        ).fetchone()
+        if item is None:
+            return 'item deleted'
+        config = current_app.config
+        existing_tags = item['tags'] or ''
+        img_path = os.path.join(current_app.root_path, 'static', item['image_path']) if item['image_path'] else None
+        # 网络调用在线程池中执行，不阻塞 eventlet hub；线程里没有 app context，配置需要显式传入
+        backend = config['AI_TAG_BACKEND']
+        if backend == 'fake':
+            generated = executor.run(AI_interface.fake_generate_tags, existing_tags, img_path,
+                                     latency=config['AI_FAKE_LATENCY_MS'] / 1000.0)
+        elif backend == 'local':
+            generated = executor.run(AI_interface.local_generate_tags, existing_tags, item['title'])
+        else:
+            generated = executor.run(AI_interface.generate_tags, existing_tags, img_path, item['title'])
+        new_tags = (generated or existing_tags)[:255]
+        if new_tags == existing_tags:
+            return 'unchanged'
+
+        def write_back(conn):
+            updated = conn.execute(
+                "UPDATE items SET tags = ? WHERE id = ? AND tags IS ? AND status != ?",
+                (new_tags, item_id, item['tags'], ITEM_STATUS_REMOVED)
+            ).rowcount
+            if updated:
+                ItemSearchIndex.upsert(conn, item_id, item['title'], item['description'], new_tags)
+            return updated
+
+        if not db.run_transaction(write_back):
+            return 'tags edited meanwhile'
+        entity_cache.invalidate('item', item_id)
+        socketio.emit('item_tags_updated', {
+            'item_id': item_id,
+            'tags': new_tags
+        }, room=f"user_{item['seller_id']}")
+        return 'updated'
+
+    @staticmethod
+    def search_available(query='', limit=None, after=None):
+        """
+        查询在售商品，按 (created_at, id) 倒序。
+        limit 为 None 时返回全部（兼容旧前端）；否则按键集分页，after 为上一页最后一条的
+        (created_at, id)。返回 (items, next_after)，没有下一页时 next_after 为 None。
+        """
+        conn = db.get_db()
+        match = build_match_query(query) if query else None
+        conditions = ["items.status = 'available'"]
+        params = []
+        source = "items"
+        if match:
+            logger.debug(f'query is required: {query}, fts match: {match}')
+            source = f"{FTS_TABLE} JOIN items ON items.id = {FTS_TABLE}.rowid"
+            conditions.append(f"{FTS_TABLE} MATCH ?")
+            params.append(match)
+        elif query:
+            # 单个汉字等无法走全文索引的查询，退回 LIKE 扫描
+            logger.debug(f'query is required: {query}, fallback to LIKE scan')
+            conditions.append("(items.title LIKE ? OR items.description LIKE ? OR items.tags LIKE ?)")
+            params.extend([f'%{query}%', f'%{query}%', f'%{query}%'])
         else:
             logger.debug('no query provided')
-            items = conn.execute(
-                """SELECT items.*
-                   FROM items
-                   WHERE items.status = 'available'
-                   ORDER BY items.created_at DESC"""
-            ).fetchall()
+        if after is not None:
+            # 键集分页：利用 idx_items_status_created 直接定位到上一页末尾
+            conditions.append("(items.created_at, items.id) < (?, ?)")
+            params.extend(after)
+        sql = f"""SELECT items.*, {_ITEM_VARIANTS_COLUMNS}
+                  FROM {source} {_ITEM_VARIANTS_JOIN}
+                  WHERE {' AND '.join(conditions)}
+                  ORDER BY items.created_at DESC, items.id DESC"""
+        if limit is not None:
+            # 多取一条用来判断是否还有下一页
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        items = conn.execute(sql, params).fetchall()
+
+        next_after = None
+        if limit is not None and len(items) > limit:
+            items = items[:limit]
+            next_after = (items[-1]['created_at'], items[-1]['id'])
         
         # 转换为字典列表
         result = []
@@ -270,33 +344,30 @@ class Item:
                 'price': item['price'],
                 'tags': item['tags'],
                 'image_path': item['image_path'],
+                'thumb_path': item['thumb_path'],
+                'medium_path': item['medium_path'],
                 'status': item['status'],
                 'created_at': item['created_at'],
                 'updated_at': item['updated_at']
             })
         logger.debug(f"Search available items with query '{query}': found {len(result)} items")
-        return result
+        return result, next_after
     
     @staticmethod
-    def find_by_id(item_id):
+    def find_by_id(item_id, include_removed=False):
+        """已删除（下架）的商品默认视为不存在；查看历史会话时传 include_removed=True"""
+        item = entity_cache.get('item', item_id, Item._load)
+        if item is not None and item['status'] == ITEM_STATUS_REMOVED and not include_removed:
+            return None
+        return item
 
+    @staticmethod
+    def _load(item_id):
         conn = db.get_db()
-        # before find, logout all items in database first
-        # unlock items that were temporarily locked more than 24 hours ago
-        try:
-            cutoff = datetime.datetime.now() - datetime.timedelta(hours=24)
-            conn.execute(
-                "UPDATE items SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
-                ('available', datetime.datetime.now(), 'locked', cutoff)
-            )
-            conn.commit()
-        except Exception:
-            logger.exception("Failed to cleanup locked items before find_by_id")
-
         logger.debug(f"Finding item by ID: {item_id}")
         item = conn.execute(
-            """SELECT items.*
-               FROM items
+            f"""SELECT items.*, {_ITEM_VARIANTS_COLUMNS}
+               FROM items {_ITEM_VARIANTS_JOIN}
                WHERE items.id = ?""",
             (item_id,)
         ).fetchone()
@@ -314,6 +385,8 @@ class Item:
             'price': item['price'],
             'tags': item['tags'],
             'image_path': item['image_path'],
+            'thumb_path': item['thumb_path'],
+            'medium_path': item['medium_path'],
             'status': item['status'],
             'created_at': item['created_at'],
             'updated_at': item['updated_at']
@@ -324,11 +397,11 @@ class Item:
         logger.debug(f"Finding items for user ID: {user_id}")
         conn = db.get_db()
         items = conn.execute(
-            """SELECT items.*
-               FROM items
-               WHERE items.seller_id = ?
+            f"""SELECT items.*, {_ITEM_VARIANTS_COLUMNS}
+               FROM items {_ITEM_VARIANTS_JOIN}
+               WHERE items.seller_id = ? AND items.status != ?
                ORDER BY items.created_at DESC""",
-            (user_id,)
+            (user_id, ITEM_STATUS_REMOVED)
         ).fetchall()
         
         result = []
@@ -342,6 +415,8 @@ class Item:
                 'price': item['price'],
                 'tags': item['tags'],
                 'image_path': item['image_path'],
+                'thumb_path': item['thumb_path'],
+                'medium_path': item['medium_path'],
                 'status': item['status'],
                 'created_at': item['created_at'],
                 'updated_at': item['updated_at']
@@ -349,6 +424,21 @@ class Item:
         
         return result
     
+    @staticmethod
+    def release_expired_locks(max_age_hours=24):
+        """把锁定超过 max_age_hours 的商品恢复为 available（由维护调度器定期调用），返回释放的数量"""
+        conn = db.get_db()
+        cutoff = datetime.datetime.now() - datetime.timedelta(hours=max_age_hours)
+        cursor = conn.execute(
+            "UPDATE items SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+            ('available', datetime.datetime.now(), 'locked', cutoff)
+        )
+        conn.commit()
+        if cursor.rowcount:
+            entity_cache.invalidate_if(lambda item: item['status'] == 'locked', kind='item')
+            logger.info(f"Released {cursor.rowcount} expired locked items")
+        return cursor.rowcount
+
     @staticmethod
     def update_status(item_id, status):
         conn = db.get_db()
@@ -358,6 +448,7 @@ class Item:
                 (status, datetime.datetime.now(), item_id)
             )
             conn.commit()
+            entity_cache.invalidate('item', item_id)
             return True
         except:
             return False
@@ -367,15 +458,8 @@ class Item:
         conn = db.get_db()
         image_path = None
         if image:
-            # 保存图片
-            upload_folder = os.path.join(current_app.root_path, 'static/images')
-            os.makedirs(upload_folder, exist_ok=True)
-            # 生成唯一文件名
-            ext = secure_filename(image.filename).split('.')[-1]
-            filename = f"{uuid.uuid4()}.{ext}"
-            image_path = os.path.join('images', filename)
-            # 保存文件
-            image.save(os.path.join(upload_folder, filename))
+            # 按内容保存新图片；旧图片的引用数由触发器减 1，没有其他引用时由维护任务回收
+            image_path = ImageStore.save(conn, os.path.join(current_app.root_path, 'static'), image)
         # # Version2: integrate AI tags auto generate function:
         # auto_tags = AI_interface.generate_tags(existing_tags=tags, img_path=os.path.join(upload_folder, filename) if image else None)
 
@@ -390,20 +474,30 @@ class Item:
         curr_time = curr_time.strftime('%Y-%m-%d %H:%M:%S')
         conn.execute(
                 """UPDATE items 
-                   SET title = ?, description = ?, price = ?, status = ?, tags = ?, updated_at = ?, image_path = ?
+                   SET title = ?, description = ?, price = ?, status = ?, tags = ?, updated_at = ?,
+                       image_path = COALESCE(?, image_path)
                    WHERE id = ?""",
                 (title, description, price, status, tags, curr_time, image_path, item_id)
             )
+        ItemSearchIndex.upsert(conn, item_id, title, description, tags)
+        if current_app.config['IMAGE_VARIANTS_ENABLED']:
+            ImageVariants.enqueue(conn, jobs, image_path)
         conn.commit()
+        entity_cache.invalidate('item', item_id)
     
     @staticmethod
     def delete(item_id):
         conn = db.get_db()
+        # 软删除：商品标记为 removed，不再出现在列表和搜索中；会话和消息保留，买家仍能查看聊天记录。
+        # 只删除收藏和全文索引
         conn.execute(
-            "DELETE FROM items WHERE id = ?",
-            (item_id,)
+            "UPDATE items SET status = ?, updated_at = ? WHERE id = ?",
+            (ITEM_STATUS_REMOVED, datetime.datetime.now(), item_id)
         )
+        conn.execute("DELETE FROM favorites WHERE item_id = ?", (item_id,))
+        ItemSearchIndex.remove(conn, item_id)
         conn.commit()
+        entity_cache.invalidate('item', item_id)
         return True
 
 class Favorite:
@@ -436,10 +530,11 @@ class Favorite:
     def get_user_favorites(user_id):
         conn = db.get_db()
         favorites = conn.execute(
-            """SELECT items.*, users.username as seller_name 
+            f"""SELECT items.*, users.username as seller_name, {_ITEM_VARIANTS_COLUMNS}
                FROM favorites 
                JOIN items ON favorites.item_id = items.id 
                JOIN users ON items.seller_id = users.id 
+               {_ITEM_VARIANTS_JOIN}
                WHERE favorites.user_id = ?
                ORDER BY favorites.created_at DESC""",
             (user_id,)
@@ -456,6 +551,8 @@ class Favorite:
                 'price': item['price'],
                 'tags': item['tags'],
                 'image_path': item['image_path'],
+                'thumb_path': item['thumb_path'],
+                'medium_path': item['medium_path'],
                 'status': item['status'],
                 'created_at': item['created_at'],
                 'updated_at': item['updated_at']
@@ -467,113 +564,89 @@ class Favorite:
     def is_favorite(user_id, item_id):
         conn = db.get_db()
         favorite = conn.execute(
-            "SELECT * from favorites where user_id = ? and item_id = ?",
+            "SELECT 1 FROM favorites WHERE user_id = ? AND item_id = ?",
             (user_id, item_id)
         ).fetchone()
         return favorite is not None
 
+    @staticmethod
+    def favorite_ids(user_id, item_ids):
+        """item_ids 中被该用户收藏的商品 id 集合；一次查询，走 UNIQUE(user_id, item_id) 索引"""
+        item_ids = list(item_ids)
+        if not item_ids:
+            return set()
+        conn = db.get_db()
+        # id 列表以 JSON 数组传入，不受 SQLite 绑定参数个数上限的影响
+        rows = conn.execute(
+            """SELECT item_id FROM favorites
+               WHERE user_id = ? AND item_id IN (SELECT value FROM json_each(?))""",
+            (user_id, json.dumps(item_ids))
+        ).fetchall()
+        return {row['item_id'] for row in rows}
+
 
 class Conversation:
     """会话管理类 - 管理用户之间关于特定商品的对话"""
     
     @staticmethod
-    def get_or_create(user1_id, user2_id, item_id):
-        """获取或创建会话，确保 user1_id < user2_id 以保证唯一性"""
-        conn = db.get_db()
-        cursor = conn.cursor()
-        
-        # to ensure user1_id < user2_id
-        if user1_id > user2_id:
-            user1_id, user2_id = user2_id, user1_id
-        
-        # try to find a existing conversation
-        cursor.execute("""
-            SELECT id FROM conversations 
-            WHERE user1_id = ? AND user2_id = ? AND item_id = ?
-        """, (user1_id, user2_id, item_id))
-        
-        row = cursor.fetchone()
-        if row:
-            return row['id']
-        
-        # create a new conversation
-        curr_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute("""
-            INSERT INTO conversations 
-            (user1_id, user2_id, item_id, last_updated, unread_count_user1, unread_count_user2)
-            VALUES (?, ?, ?, ?, 0, 0)
-        """, (user1_id, user2_id, item_id, curr_time))
-        
-        conn.commit()
-        return cursor.lastrowid
-    
-    @staticmethod
-    def update_on_new_message(conversation_id, from_user_id, message_id):
-        """新消息发送时更新会话信息"""
+    def find_id(user_id, other_user_id, item_id):
+        """按参与者和商品查找会话 id（走 UNIQUE(user1_id, user2_id, item_id) 索引），不存在返回 None"""
         conn = db.get_db()
-        cursor = conn.cursor()
-        
-        # get conversation participants
-        cursor.execute("""
-            SELECT user1_id, user2_id FROM conversations WHERE id = ?
-        """, (conversation_id,))
-        
-        conv = cursor.fetchone()
-        if not conv:
-            return
-        
-        # ensure which user is sending the message and update unread counts
-        if from_user_id == conv['user1_id']:
-            # user1 发送，user2 未读+1
-            cursor.execute("""
-                UPDATE conversations 
-                SET last_message_id = ?, 
-                    last_updated = ?,
-                    unread_count_user2 = unread_count_user2 + 1
-                WHERE id = ?
-            """, (message_id, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), conversation_id))
-        else:
-            # user2 发送，user1 未读+1
-            cursor.execute("""
-                UPDATE conversations 
-                SET last_message_id = ?, 
-                    last_updated = ?,
-                    unread_count_user1 = unread_count_user1 + 1
-                WHERE id = ?
-            """, (message_id, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), conversation_id))
-        
-        conn.commit()
-    
+        user1_id, user2_id = (user_id, other_user_id) if user_id < other_user_id else (other_user_id, user_id)
+        row = conn.execute(
+            "SELECT id FROM conversations WHERE user1_id = ? AND user2_id = ? AND item_id = ?",
+            (user1_id, user2_id, item_id)
+        ).fetchone()
+        return row['id'] if row else None
+
     @staticmethod
-    def mark_as_read(user_id, other_user_id, item_id):
-        """标记会话为已读（清零当前用户的未读计数）"""
+    def mark_read(conversation_id, user_id, up_to_message_id=None):
+        """
+        已读回执：把会话中发给 user_id、id <= up_to_message_id（默认全部）的未读消息标记为已读，
+        并在同一个事务里扣减该用户的未读计数。只走主键和 idx_messages_unread 部分索引，
+        开销与历史消息数量无关。user_id 不是会话参与者时返回 None。
+        """
         conn = db.get_db()
-        
-        # ensure the order of user IDs
-        user1_id, user2_id = (user_id, other_user_id) if user_id < other_user_id else (other_user_id, user_id)
-        
-        # ensure which user's unread count to reset
-        if user_id == user1_id:
-            conn.execute("""
-                UPDATE conversations 
-                SET unread_count_user1 = 0
-                WHERE user1_id = ? AND user2_id = ? AND item_id = ?
-            """, (user1_id, user2_id, item_id))
+        conv = conn.execute(
+            "SELECT user1_id, user2_id FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if not conv or user_id not in (conv['user1_id'], conv['user2_id']):
+            return None
+        counter = 'unread_count_user1' if user_id == conv['user1_id'] else 'unread_count_user2'
+
+        sql = "UPDATE messages SET is_read = 1 WHERE conversation_id = ? AND to_user_id = ? AND is_read = 0"
+        params = [conversation_id, user_id]
+        if up_to_message_id is not None:
+            sql += " AND id <= ?"
+            params.append(up_to_message_id)
+        marked = conn.execute(sql, params).rowcount
+
+        if up_to_message_id is None:
+            conn.execute(f"UPDATE conversations SET {counter} = 0 WHERE id = ?", (conversation_id,))
         else:
-            conn.execute("""
-                UPDATE conversations 
-                SET unread_count_user2 = 0
-                WHERE user1_id = ? AND user2_id = ? AND item_id = ?
-            """, (user1_id, user2_id, item_id))
-        
+            conn.execute(
+                f"UPDATE conversations SET {counter} = MAX(0, {counter} - ?) WHERE id = ?",
+                (marked, conversation_id)
+            )
+        unread = conn.execute(
+            f"SELECT {counter} FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()[0]
         conn.commit()
+
+        return {
+            'conversation_id': conversation_id,
+            'other_user_id': conv['user2_id'] if user_id == conv['user1_id'] else conv['user1_id'],
+            'up_to_message_id': up_to_message_id,
+            'marked': marked,
+            'unread_count': unread
+        }
     
     @staticmethod
-    def get_user_conversations(user_id):
-        """获取用户的所有会话列表"""
+    def get_user_conversations(user_id, conversation_ids=None):
+        """获取用户的所有会话列表；传入 conversation_ids 时只返回其中的会话（断线重连同步时的增量）"""
         conn = db.get_db()
         
-        rows = conn.execute("""
+        sql = """
             SELECT 
                 c.id as conversation_id,
                 CASE WHEN c.user1_id = ? THEN c.user2_id ELSE c.user1_id END as other_user_id,
@@ -581,6 +654,7 @@ class Conversation:
                 u.username as other_username,
                 i.title as item_title,
                 i.image_path as item_image,
+                v.thumb_path as item_thumb,
                 i.status as item_status,
                 c.last_updated as last_message_time,
                 CASE WHEN c.user1_id = ? THEN c.unread_count_user1 ELSE c.unread_count_user2 END as unread_count,
@@ -588,10 +662,16 @@ class Conversation:
             FROM conversations c
             LEFT JOIN users u ON u.id = CASE WHEN c.user1_id = ? THEN c.user2_id ELSE c.user1_id END
             LEFT JOIN items i ON i.id = c.item_id
+            LEFT JOIN image_variants v ON v.source_path = i.image_path
             LEFT JOIN messages m ON m.id = c.last_message_id
-            WHERE c.user1_id = ? OR c.user2_id = ?
-            ORDER BY c.last_updated DESC
-        """, (user_id, user_id, user_id, user_id, user_id)).fetchall()
+            WHERE (c.user1_id = ? OR c.user2_id = ?)
+        """
+        params = [user_id, user_id, user_id, user_id, user_id]
+        if conversation_ids is not None:
+            sql += " AND c.id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(conversation_ids)))
+        sql += " ORDER BY c.last_updated DESC"
+        rows = conn.execute(sql, params).fetchall()
         
         result = []
         for row in rows:
@@ -602,6 +682,7 @@ class Conversation:
                 'item_id': row['item_id'],
                 'item_title': row['item_title'],
                 'item_image': row['item_image'],
+                'item_thumb': row['item_thumb'],
                 'item_status': row['item_status'],
                 'last_message_time': row['last_message_time'],
                 'last_message_content': row['last_message_content'],
@@ -615,27 +696,62 @@ class Message:
     """消息类 - 处理用户之间的消息发送与读取"""
     
     @staticmethod
-    def send(from_user_id, to_user_id, item_id, content):
-        """发送消息（会自动创建或更新会话）"""
-        conn = db.get_db()
-        cursor = conn.cursor()
-        
-        # 获取或创建会话
-        conversation_id = Conversation.get_or_create(from_user_id, to_user_id, item_id)
-        
-        # 插入消息
-        curr_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute("""
+    def write(conn, from_user_id, to_user_id, item_id, content, curr_time):
+        """
+        在 conn 当前事务中写入一条消息，不提交，返回 (message_id, conversation_id)。
+        会话用 UPSERT 一步完成"获取或创建"，未读计数根据 user1_id < user2_id 的约定直接确定要加哪一列，
+        不需要再回查会话参与者。
+        """
+        user1_id, user2_id = (from_user_id, to_user_id) if from_user_id < to_user_id else (to_user_id, from_user_id)
+        if _SQLITE_HAS_RETURNING:
+            conversation_id = conn.execute("""
+                INSERT INTO conversations 
+                (user1_id, user2_id, item_id, last_updated, unread_count_user1, unread_count_user2)
+                VALUES (?, ?, ?, ?, 0, 0)
+                ON CONFLICT (user1_id, user2_id, item_id) DO UPDATE SET last_updated = excluded.last_updated
+                RETURNING id
+            """, (user1_id, user2_id, item_id, curr_time)).fetchone()[0]
+        else:
+            conn.execute("""
+                INSERT OR IGNORE INTO conversations 
+                (user1_id, user2_id, item_id, last_updated, unread_count_user1, unread_count_user2)
+                VALUES (?, ?, ?, ?, 0, 0)
+            """, (user1_id, user2_id, item_id, curr_time))
+            conversation_id = conn.execute(
+                "SELECT id FROM conversations WHERE user1_id = ? AND user2_id = ? AND item_id = ?",
+                (user1_id, user2_id, item_id)
+            ).fetchone()[0]
+
+        message_id = conn.execute("""
             INSERT INTO messages 
             (conversation_id, from_user_id, to_user_id, item_id, content, is_read, created_at)
             VALUES (?, ?, ?, ?, ?, 0, ?)
-        """, (conversation_id, from_user_id, to_user_id, item_id, content, curr_time))
-        
-        message_id = cursor.lastrowid
-        conn.commit()
-        
-        # 更新会话信息
-        Conversation.update_on_new_message(conversation_id, from_user_id, message_id)
+        """, (conversation_id, from_user_id, to_user_id, item_id, content, curr_time)).lastrowid
+
+        # user1 发送则 user2 未读+1，反之亦然
+        counter = 'unread_count_user2' if from_user_id == user1_id else 'unread_count_user1'
+        conn.execute(f"""
+            UPDATE conversations 
+            SET last_message_id = ?, last_updated = ?, {counter} = {counter} + 1
+            WHERE id = ?
+        """, (message_id, curr_time, conversation_id))
+        return message_id, conversation_id
+
+    @staticmethod
+    def send(from_user_id, to_user_id, item_id, content):
+        """
+        发送消息（会自动创建或更新会话），会话、消息和未读计数在同一个事务中提交。
+        开启组提交（MESSAGE_GROUP_COMMIT_WINDOW_MS > 0）时，同一时间窗口内的多条消息合并为一次提交。
+        """
+        curr_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if group_commit.enabled:
+            message_id, conversation_id = group_commit.submit(
+                Message.write, from_user_id, to_user_id, item_id, content, curr_time
+            )
+        else:
+            message_id, conversation_id = db.run_transaction(
+                Message.write, from_user_id, to_user_id, item_id, content, curr_time
+            )
         
         logger.debug(f"Message sent: id={message_id}, conversation={conversation_id}")
         # return the message_data_package
@@ -651,35 +767,46 @@ class Message:
         }
     
     @staticmethod
-    def get_conversation(user_id, other_user_id, item_id):
-        """获取两个用户之间关于某商品的聊天记录"""
+    def get_conversation(user_id, other_user_id, item_id, before_id=None, limit=None):
+        """
+        获取两个用户之间关于某商品的聊天记录（按 id 升序返回）。
+        先通过 conversations 的唯一索引定位会话，再沿 messages(conversation_id, id) 索引倒序读取：
+        limit 为 None 时返回全部；否则返回 id < before_id 的最近 limit 条。
+        返回 (messages, next_before_id)，next_before_id 为 None 表示没有更早的消息。
+        """
         conn = db.get_db()
-        
-        messages = conn.execute("""
-            SELECT 
-                m.*,
-                u1.username as from_username,
-                u2.username as to_username
-            FROM messages m
-            JOIN users u1 ON m.from_user_id = u1.id
-            JOIN users u2 ON m.to_user_id = u2.id
-            WHERE 
-                ((m.from_user_id = ? AND m.to_user_id = ?) OR 
-                 (m.from_user_id = ? AND m.to_user_id = ?))
-                AND m.item_id = ?
-            ORDER BY m.created_at ASC
-        """, (user_id, other_user_id, other_user_id, user_id, item_id)).fetchall()
-        
-        # 标记消息为已读（只标记发给当前用户的消息）
-        conn.execute("""
-            UPDATE messages 
-            SET is_read = 1
-            WHERE to_user_id = ? AND from_user_id = ? AND item_id = ? AND is_read = 0
-        """, (user_id, other_user_id, item_id))
-        conn.commit()
-        
-        # 更新会话未读计数
-        Conversation.mark_as_read(user_id, other_user_id, item_id)
+        conversation_id = Conversation.find_id(user_id, other_user_id, item_id)
+        if conversation_id is None:
+            return [], None
+
+        sql = "SELECT * FROM messages WHERE conversation_id = ?"
+        params = [conversation_id]
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            # 多取一条用来判断是否还有更早的消息
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        messages = conn.execute(sql, params).fetchall()
+
+        next_before_id = None
+        if limit is not None and len(messages) > limit:
+            messages = messages[:limit]
+            next_before_id = messages[-1]['id']
+        messages.reverse()
+
+        # 一页里只有两个参与者，用户名查一次即可，不必每行 JOIN users
+        usernames = {
+            row['id']: row['username'] for row in conn.execute(
+                "SELECT id, username FROM users WHERE id IN (?, ?)", (user_id, other_user_id)
+            ).fetchall()
+        }
+
+        if before_id is None:
+            # 打开会话（第一页）时标记发给当前用户的消息为已读，并清零未读计数
+            Conversation.mark_read(conversation_id, user_id)
         
         result = []
         for msg in messages:
@@ -692,26 +819,57 @@ class Message:
                 'content': msg['content'],
                 'is_read': bool(msg['is_read']),
                 'created_at': msg['created_at'],
-                'from_username': msg['from_username'],
-                'to_username': msg['to_username']
+                'from_username': usernames.get(msg['from_user_id']),
+                'to_username': usernames.get(msg['to_user_id'])
             })
         
-        print(f"conversation ID : {messages[0]['conversation_id'] if messages else 'N/A'} between user {user_id} and user {other_user_id} about item {item_id} has {len(result)} messages.")
+        logger.debug(f"conversation ID : {conversation_id} between user {user_id} and user {other_user_id} about item {item_id}: returned {len(result)} messages.")
 
-        return result
+        return result, next_before_id
+
+    @staticmethod
+    def since(user_id, after_id, limit):
+        """
+        断线重连同步：返回用户参与的所有会话中 id > after_id 的消息（按 id 升序，最多 limit 条）。
+        messages 的自增主键就是同步游标；先取出用户的会话，再沿 messages(conversation_id, id) 索引
+        只读取游标之后的消息，不扫描历史记录。不修改已读状态。
+        返回 (messages, has_more)。
+        """
+        conn = db.get_db()
+        rows = conn.execute("""
+            SELECT m.*, fu.username AS from_username, tu.username AS to_username
+            FROM messages m
+            LEFT JOIN users fu ON fu.id = m.from_user_id
+            LEFT JOIN users tu ON tu.id = m.to_user_id
+            WHERE m.conversation_id IN (
+                SELECT id FROM conversations WHERE user1_id = ? OR user2_id = ?
+            ) AND m.id > ?
+            ORDER BY m.id
+            LIMIT ?
+        """, (user_id, user_id, after_id, limit + 1)).fetchall()
+
+        # 多取一条用来判断是否还有更新的消息
+        has_more = len(rows) > limit
+        return [{
+            'id': msg['id'],
+            'conversation_id': msg['conversation_id'],
+            'from_user_id': msg['from_user_id'],
+            'to_user_id': msg['to_user_id'],
+            'item_id': msg['item_id'],
+            'content': msg['content'],
+            'is_read': bool(msg['is_read']),
+            'created_at': msg['created_at'],
+            'from_username': msg['from_username'],
+            'to_username': msg['to_username']
+        } for msg in rows[:limit]], has_more
 
 
 class AI_interface:
     def __init__(self):
         logger.warning("AI_interface: is initialized, notice that AI_interface now is a static placeholder class, so ensure that it's neccessary to instantiate it!")
     @staticmethod
-    def generate_tags(existing_tags, img_path=None):
-        # TODO: implement the hyperparameters to self class private members if necessary, [API-KEY, model_name, tags_scale, etc.]
-        GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-        MODEL_NAME = 'gemini-2.5-flash'  # placeholder for future use
-        if GEMINI_API_KEY is None:
-            logger.error("AI_interface: generate_tags is called without GEMINI_API_KEY environment variable set, so it will not work as expected!")
-            return existing_tags
+    def generate_tags(existing_tags, img_path=None, title=''):
+        # API key、模型名、超时/重试/熔断等参数都在 llm_client 中配置（AI_* 配置项）
         '''
         generate_tags's Docs:
         this method generates additional tags based on existing tags and optional image input.
@@ -741,68 +899,57 @@ class AI_interface:
             Existing tags: {existing_tags}
         """.format(existing_tags=existing_tags)
 
-        def gemini2_generate(api_key: str, prompt: str, json_output=True, img_path: str= None):
-            model_name = MODEL_NAME
-            time_retry = 0
-            from google import genai
-            from google.genai import types
-            if img_path is None:
-                logger.info("gemini2_generate: Generating tags without image input.")
-                while time_retry <= 3:
-                    try:
-                        client = genai.Client(api_key=api_key)
-                        response = client.models.generate_content(
-                            model= model_name,
-                            contents=[
-                                prompt
-                            ]
-                        )
-                        curr_text = response.text
-                        print("Generation is already done!")
-                        print("The raw response text is: ", curr_text)
-                        # pre-deal to ensure the json format
-                        return curr_text
-                    except Exception as e:
-                        time_retry += 1
-                        logger.error(f"gemini2_generate: Encountered error during generation without image: {e}, retry times: {time_retry}")
-                        continue
-            else:
-                logger.info("gemini2_generate: Generating tags with image input.")
-                with open(img_path, 'rb') as f:
-                    image_bytes = f.read()
-                response = None
-                while time_retry <= 3:
-                    try:
-                        client = genai.Client(api_key=api_key)
-                        response = client.models.generate_content(
-                            model = model_name,
-                            contents=[
-                            types.Part.from_bytes(
-                                data=image_bytes,
-                                mime_type='image/jpeg',
-                            ),
-                            prompt
-                            ]
-                        )
-                        curr_text = response.text
-                        print("Generation is already done!")
-                        print("The raw response text is: ", curr_text)
-                        # pre-deal to ensure the json format
-                        return curr_text
-                    except Exception as e:
-                        time_retry += 1
-                        logger.error(f"gemini2_generate: Encountered error during generation with image: {e}, retry times: {time_retry}")
-                        continue
-            
-        curr_text = gemini2_generate(api_key=GEMINI_API_KEY, prompt=tag_generate_prompt, img_path=img_path)
+        def generate():
+            # 复用进程内唯一的客户端：带截止时间、退避重试、并发限制和熔断，失败返回 None
+            return llm_client.generate(tag_generate_prompt, img_path)
+
+        # 相同的标签 + 图片 + 模型先查缓存（内存 LRU -> SQLite），命中时不调用模型
+        curr_text = tag_cache.get_or_generate(llm_client.model, existing_tags, img_path, generate)
         # TODO: process the curr_text and existing_tags, and unique them, return the final tags, Maybe extract this function to a new number function in AI_interface class
         if curr_text is None:
-            logger.error("AI_interface: generate_tags failed to get response from gemini2_generate, returning existing tags.")
+            if tag_suggester.fallback:
+                logger.warning("AI_interface: generate_tags failed to get response from the LLM client, falling back to local suggestions.")
+                return AI_interface.local_generate_tags(existing_tags, title)
+            logger.error("AI_interface: generate_tags failed to get response from the LLM client, returning existing tags.")
             return existing_tags
         else:
-            logger.info("AI_interface: generate_tags successfully got response from gemini2_generate.")
+            logger.info("AI_interface: generate_tags successfully got response from the LLM client.")
             return existing_tags + ' ' + curr_text.strip()
     
+    @staticmethod
+    def local_generate_tags(existing_tags, title=''):
+        """本地推荐引擎（见 tag_suggest.py）：根据已有商品的标签共现和相似商品追加标签，不访问网络"""
+        suggested = tag_suggester.suggest(title, existing_tags)
+        if not suggested:
+            return existing_tags
+        return (existing_tags + ' ' + ' '.join(suggested)).strip()
+
+    @staticmethod
+    def fake_generate_tags(existing_tags, img_path=None, latency=0.0):
+        """
+        本地假后端（AI_TAG_BACKEND = 'fake'），用于测试和没有 GEMINI_API_KEY 的开发环境：
+        不访问网络，把已有标签的分词结果（中文按双字切分）去重后追加到末尾，结果是确定的。
+        latency 秒用于模拟慢接口。
+        """
+        from .search import tokenize
+
+        def generate():
+            if latency > 0:
+                import time
+                time.sleep(latency)
+            existing = existing_tags.split()
+            extra = []
+            for token in tokenize(existing_tags):
+                if token not in existing and token not in extra:
+                    extra.append(token)
+            return ' '.join(extra)
+
+        # 和 gemini 后端一样经过缓存，便于测试缓存命中
+        extra = tag_cache.get_or_generate('fake', existing_tags, img_path, generate)
+        if not extra:
+            return existing_tags
+        return (existing_tags + ' ' + extra).strip()
+
     def refine_tagstext2tags(self, tags):
         # Placeholder for future tag refinement logic
         # TODO: implement actual refinement logic, possibly using AI, temporarily just do nothing
@@ -0,0 +1,219 @@
+# app/presence.py
+# 在线状态：记录每个用户当前的 Socket.IO 连接。一个用户可以同时在多个标签页/设备上在线，
+# 所以是 user_id -> {sid}（正向）加 sid -> user_id（反向）两个索引，连接、断开都是 O(1)。
+# 本进程的连接总是记在内存里；PRESENCE_BACKEND = 'sqlite' 时同时登记到 presence 表
+# （见 0010_presence.sql），连接数和"谁在线"的查询走共享表，多个服务进程看到的是同一份在线状态。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import json
+import uuid
+import datetime
+import threading
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _now(offset_seconds=0):
+    return (datetime.datetime.now() + datetime.timedelta(seconds=offset_seconds)).strftime(TIME_FORMAT)
+
+
+class LocalPresence:
+    """本进程内的连接索引"""
+
+    def __init__(self):
+        self._sids_by_user = {}     # user_id -> set(sid)
+        self._user_by_sid = {}      # sid -> user_id
+        self._lock = threading.Lock()
+
+    def add(self, user_id, sid):
+        """登记连接，返回该用户在本进程的连接数"""
+        with self._lock:
+            previous = self._user_by_sid.get(sid)
+            if previous is not None and previous != user_id:
+                self._discard(previous, sid)
+            self._user_by_sid[sid] = user_id
+            sids = self._sids_by_user.setdefault(user_id, set())
+            sids.add(sid)
+            return len(sids)
+
+    def remove(self, sid):
+        """移除连接，返回 (user_id, 剩余连接数)；未登记的 sid 返回 (None, 0)"""
+        with self._lock:
+            user_id = self._user_by_sid.pop(sid, None)
+            if user_id is None:
+                return None, 0
+            return user_id, self._discard(user_id, sid)
+
+    def _discard(self, user_id, sid):
+        sids = self._sids_by_user.get(user_id)
+        if not sids:
+            return 0
+        sids.discard(sid)
+        if not sids:
+            del self._sids_by_user[user_id]
+            return 0
+        return len(sids)
+
+    def user_of(self, sid):
+        return self._user_by_sid.get(sid)
+
+    def sids(self, user_id):
+        return set(self._sids_by_user.get(user_id, ()))
+
+    def count(self, user_id):
+        return len(self._sids_by_user.get(user_id, ()))
+
+    def online(self, user_ids):
+        return {user_id for user_id in user_ids if user_id in self._sids_by_user}
+
+    def items(self):
+        with self._lock:
+            return list(self._user_by_sid.items())
+
+    def __len__(self):
+        return len(self._user_by_sid)
+
+    @property
+    def users(self):
+        return len(self._sids_by_user)
+
+
+class SQLitePresence:
+    """presence 表上的共享在线状态；所有方法都是 write(conn, ...) / read(conn, ...) 形式，由调用方提供连接"""
+
+    @staticmethod
+    def touch_server(conn, server_id):
+        conn.execute("""
+            INSERT INTO presence_servers (server_id, heartbeat_at) VALUES (?, ?)
+            ON CONFLICT(server_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+        """, (server_id, _now()))
+
+    @staticmethod
+    def add(conn, server_id, user_id, sid):
+        # 先登记心跳，否则第一次心跳之前这条连接可能被其他进程当作失联进程的连接清理掉
+        SQLitePresence.touch_server(conn, server_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO presence (sid, user_id, server_id, connected_at) VALUES (?, ?, ?, ?)",
+            (sid, user_id, server_id, _now())
+        )
+        return conn.execute("SELECT COUNT(*) FROM presence WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    @staticmethod
+    def remove(conn, sid, user_id):
+        conn.execute("DELETE FROM presence WHERE sid = ?", (sid,))
+        return conn.execute("SELECT COUNT(*) FROM presence WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    @staticmethod
+    def count(conn, user_id):
+        return conn.execute("SELECT COUNT(*) FROM presence WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    @staticmethod
+    def online(conn, user_ids):
+        # id 列表以 JSON 数组传入，不受绑定参数个数上限的影响
+        rows = conn.execute(
+            "SELECT DISTINCT user_id FROM presence WHERE user_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(user_ids)),)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    @staticmethod
+    def heartbeat(conn, server_id, local_connections, stale_after):
+        """
+        刷新本进程的心跳，补登本进程的连接（被误清理后自愈），并清理心跳超时的进程留下的连接。
+        返回清理掉的连接数。
+        """
+        SQLitePresence.touch_server(conn, server_id)
+        now = _now()
+        conn.executemany(
+            "INSERT OR IGNORE INTO presence (sid, user_id, server_id, connected_at) VALUES (?, ?, ?, ?)",
+            [(sid, user_id, server_id, now) for sid, user_id in local_connections]
+        )
+        cutoff = _now(-stale_after)
+        conn.execute("DELETE FROM presence_servers WHERE heartbeat_at < ?", (cutoff,))
+        return conn.execute(
+            "DELETE FROM presence WHERE server_id NOT IN (SELECT server_id FROM presence_servers)"
+        ).rowcount
+
+
+class PresenceRegistry:
+    def __init__(self, app=None, db=None):
+        self.local = LocalPresence()
+        self.shared = False
+        self._server_id = None
+        self._server_pid = None
+        self.connects = 0
+        self.disconnects = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        backend = app.config['PRESENCE_BACKEND']
+        if backend not in ('memory', 'sqlite'):
+            raise ValueError(f"Unknown PRESENCE_BACKEND: {backend}")
+        self.shared = backend == 'sqlite'
+        self.stale_after = int(app.config['PRESENCE_STALE_AFTER'])
+        self.local = LocalPresence()
+        if self.shared:
+            logger.info("Presence shared through SQLite (presence table)")
+
+    @property
+    def server_id(self):
+        # 按进程生成：fork 出的 worker 不能沿用父进程的 id
+        if self._server_pid != os.getpid():
+            self._server_id = uuid.uuid4().hex
+            self._server_pid = os.getpid()
+        return self._server_id
+
+    def connect(self, user_id, sid):
+        """登记连接，返回该用户的连接数（共享模式下是所有进程的总数）"""
+        count = self.local.add(user_id, sid)
+        self.connects += 1
+        if self.shared:
+            count = self.db.run_transaction(SQLitePresence.add, self.server_id, user_id, sid)
+        return count
+
+    def disconnect(self, sid):
+        """移除连接，返回 (user_id, 该用户剩余的连接数)"""
+        user_id, count = self.local.remove(sid)
+        if user_id is None:
+            return None, 0
+        self.disconnects += 1
+        if self.shared:
+            count = self.db.run_transaction(SQLitePresence.remove, sid, user_id)
+        return user_id, count
+
+    def user_of(self, sid):
+        return self.local.user_of(sid)
+
+    def connection_count(self, user_id):
+        if self.shared:
+            return SQLitePresence.count(self.db.get_db(), user_id)
+        return self.local.count(user_id)
+
+    def online(self, user_ids):
+        """批量查询：返回 user_ids 中当前在线的用户 id 集合（一次查询）"""
+        user_ids = {int(user_id) for user_id in user_ids}
+        if not user_ids:
+            return set()
+        if self.shared:
+            return SQLitePresence.online(self.db.get_db(), user_ids)
+        return self.local.online(user_ids)
+
+    def heartbeat(self):
+        """维护任务：共享模式下刷新心跳并清理失联进程的连接"""
+        if not self.shared:
+            return None
+        return self.db.run_transaction(SQLitePresence.heartbeat, self.server_id,
+                                       self.local.items(), self.stale_after)
+
+    def stats(self):
+        return {
+            'backend': 'sqlite' if self.shared else 'memory',
+            'local_connections': len(self.local),
+            'local_users': self.local.users,
+            'connects': self.connects,
+            'disconnects': self.disconnects
+        }
@@ -0,0 +1,116 @@
+# app/search.py
+import logging
+logger = logging.getLogger(__name__)
+
+import re
+
+# 商品全文检索索引（SQLite FTS5）
+# FTS5 自带的 unicode61 分词器会把一整段连续的中文当成一个词，无法按子串检索。
+# 所以写入索引前先在 Python 端把中文切成重叠的二元组(bigram)，英文/数字保持原词，
+# 查询时做同样的切分，再拼成 FTS5 的短语查询，中英文混排的 tags 都能命中。
+
+FTS_TABLE = 'items_fts'
+
+# CJK 统一表意文字 + 扩展A + 兼容表意文字，以及日文假名、韩文音节
+_CJK_RANGES = '㐀-䶿一-鿿豈-﫿぀-ヿ가-힯'
+_TOKEN_RE = re.compile(f'([{_CJK_RANGES}]+)|([^\\W_{_CJK_RANGES}]+)', re.UNICODE)
+
+
+def _cjk_bigrams(run):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text):
+    """把文本切成索引用的 token 列表：中文按 bigram，其他按单词（小写）"""
+    if not text:
+        return []
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text):
+        if cjk:
+            tokens.extend(_cjk_bigrams(cjk))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def segment(text):
+    """索引列的写入形式：token 之间用空格分开，交给 unicode61 分词"""
+    return ' '.join(tokenize(text))
+
+
+def build_match_query(query):
+    """
+    把用户输入转换成 FTS5 MATCH 表达式，各个词之间是 AND 关系。
+    - 中文片段 -> bigram 短语，例如 "笔记本" -> "笔记 记本"
+    - 英文/数字 -> 前缀匹配，例如 mac -> "mac"*
+    无法用索引表达的查询（比如只有单个汉字）返回 None，由调用方退回 LIKE 扫描。
+    """
+    clauses = []
+    for cjk, word in _TOKEN_RE.findall(query or ''):
+        if cjk:
+            if len(cjk) < 2:
+                return None
+            phrase = ' '.join(_cjk_bigrams(cjk))
+            clauses.append(f'"{phrase}"')
+        else:
+            clauses.append(f'"{word.lower()}"*')
+    if not clauses:
+        return None
+    return ' AND '.join(clauses)
+
+
+class ItemSearchIndex:
+    """维护 items_fts，rowid 与 items.id 一一对应；调用方负责 commit"""
+
+    @staticmethod
+    def ensure(conn):
+        """如果索引表不存在则创建并从 items 表回填，返回是否新建"""
+        row = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).fetchone()
+        if row:
+            return False
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE}
+            USING fts5(title, description, tags, tokenize = 'unicode61')
+        """)
+        ItemSearchIndex.rebuild(conn)
+        return True
+
+    @staticmethod
+    def upsert(conn, item_id, title, description, tags):
+        conn.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", (item_id,))
+        conn.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description, tags) VALUES (?, ?, ?, ?)",
+            (item_id, segment(title), segment(description), segment(tags))
+        )
+
+    @staticmethod
+    def remove(conn, item_id):
+        conn.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", (item_id,))
+
+    @staticmethod
+    def rebuild(conn, batch_size=1000):
+        """清空索引并按 id 分批从 items 表重建，返回写入的行数"""
+        conn.execute(f"DELETE FROM {FTS_TABLE}")
+        last_id = 0
+        total = 0
+        # 已删除（status = 'removed'，见 models.ITEM_STATUS_REMOVED）的商品不进入索引
+        while True:
+            rows = conn.execute(
+                "SELECT id, title, description, tags FROM items WHERE id > ? AND status != 'removed' ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, tags) VALUES (?, ?, ?, ?)",
+                [(r[0], segment(r[1]), segment(r[2]), segment(r[3])) for r in rows]
+            )
+            last_id = rows[-1][0]
+            total += len(rows)
+        conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        logger.info(f"Search index rebuilt: {total} items")
+        return total
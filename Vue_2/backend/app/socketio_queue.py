@@ -0,0 +1,122 @@
+# app/socketio_queue.py
+# Socket.IO 的跨进程消息队列。默认的 socketio 只能推送给本进程里的连接：HTTP 请求落在 A 进程，
+# 接收方的 socket 连在 B 进程，user_{id} 房间在 A 进程里不存在，消息就丢了，所以只能跑一个后端进程。
+# 配置 SOCKETIO_MESSAGE_QUEUE 后所有 emit 先进入消息队列，每个服务进程从队列读取，再推送给自己的连接：
+#   - 'sqlite'：使用本项目数据库里的 socketio_queue 表（见 0011_socketio_queue.sql），不需要额外的服务，
+#     适合同一台机器上的多个进程；各进程每 SOCKETIO_QUEUE_POLL_MS 毫秒按自增 id 轮询一次
+#   - 'redis://...'、'amqp://...' 等 URL：原样交给 Flask-SocketIO（需要安装对应的客户端库，
+#     并且 eventlet 需要 monkey patch socket）
+# 只发不收的进程（flask jobs-run 等）没有 socket 连接，不会启动读取线程，emit 只写入队列。
+# 和 python-socketio 自带的 RedisManager 等一样用 pickle 序列化，emit 的数据可以包含 bytes、datetime 等
+# （payload 列是 BLOB，见 0012_socketio_queue_blob.sql）。
+import logging
+logger = logging.getLogger(__name__)
+
+import pickle
+import time
+import threading
+
+import socketio
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """基于 SQLite 表的 python-socketio client manager"""
+    name = 'sqlite'
+
+    def __init__(self, db, executor=None, channel='flask-socketio', poll_interval=0.05,
+                 retention=60, batch=256, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.db = db
+        self.executor = executor
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.batch = batch
+        self._publish_conn = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+        self.purged = 0
+
+    def _run(self, func, *args):
+        # sqlite3 调用是阻塞的，开启 OFFLOAD_BLOCKING 时放到线程池执行
+        if self.executor is not None:
+            return self.executor.run(func, *args)
+        return func(*args)
+
+    def _insert(self, payload):
+        with self._lock:
+            if self._publish_conn is None:
+                self._publish_conn = self.db.connect()
+            self._publish_conn.execute(
+                "INSERT INTO socketio_queue (channel, payload, created_at) VALUES (?, ?, ?)",
+                (self.channel, payload, time.time())
+            )
+            self._publish_conn.commit()
+
+    def _publish(self, data):
+        self._run(self._insert, pickle.dumps(data))
+        self.published += 1
+
+    @staticmethod
+    def _last_id(conn):
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_queue").fetchone()[0]
+
+    def _fetch(self, conn, after_id):
+        return conn.execute(
+            "SELECT id, payload FROM socketio_queue WHERE channel = ? AND id > ? ORDER BY id LIMIT ?",
+            (self.channel, after_id, self.batch)
+        ).fetchall()
+
+    def _purge(self, conn):
+        deleted = conn.execute(
+            "DELETE FROM socketio_queue WHERE created_at < ?", (time.time() - self.retention,)
+        ).rowcount
+        conn.commit()
+        return deleted
+
+    def _listen(self):
+        conn = self.db.connect()
+        # 只处理启动之后的消息
+        last_id = self._run(self._last_id, conn)
+        next_purge = time.monotonic() + self.retention
+        while True:
+            try:
+                rows = self._run(self._fetch, conn, last_id)
+                if time.monotonic() >= next_purge:
+                    next_purge = time.monotonic() + self.retention
+                    self.purged += self._run(self._purge, conn)
+            except Exception:
+                # 数据库暂时被锁等情况，稍后重试，不能让读取线程退出
+                logger.exception("Socket.IO queue poll failed")
+                rows = []
+            for row in rows:
+                last_id = row['id']
+                self.received += 1
+                # bytes 由 PubSubManager._thread 按 pickle 解码
+                yield bytes(row['payload'])
+            if len(rows) < self.batch:
+                self.server.sleep(self.poll_interval)
+
+    def stats(self):
+        return {
+            'published': self.published,
+            'received': self.received,
+            'purged': self.purged
+        }
+
+
+def message_queue_options(app, db, executor):
+    """按 SOCKETIO_MESSAGE_QUEUE 生成传给 socketio.init_app 的参数，未配置时为空（只推送本进程的连接）"""
+    queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+    channel = app.config['SOCKETIO_CHANNEL']
+    if not queue:
+        return {}
+    if queue == 'sqlite':
+        logger.info(f"Socket.IO message queue: sqlite table socketio_queue, channel={channel}")
+        return {'client_manager': SQLiteQueueManager(
+            db, executor, channel=channel,
+            poll_interval=app.config['SOCKETIO_QUEUE_POLL_MS'] / 1000.0,
+            retention=app.config['SOCKETIO_QUEUE_RETENTION_S']
+        )}
+    logger.info(f"Socket.IO message queue: {queue.split('://')[0]}, channel={channel}")
+    return {'message_queue': queue, 'channel': channel}
@@ -0,0 +1,164 @@
+# app/tag_cache.py
+# AI 生成标签的缓存：重新发布、编辑后的商品，或者批量上传同一张商品图，输入完全相同，
+# 没有必要再付一次模型调用的延迟和费用。
+# 缓存键 = sha256(模型名 + 规范化后的已有标签 + 图片内容哈希)，分两层：
+#   - 内存 LRU（每个进程 AI_TAG_CACHE_SIZE 条）
+#   - SQLite 表 ai_tag_cache（进程间共享、重启后仍然有效），AI_TAG_CACHE_TTL 秒后过期
+# 调用方在线程池中执行（没有 app context），所以这里直接从连接池借连接，不使用 db.get_db()。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+_SHA256_RE = re.compile(r'[0-9a-f]{64}')
+
+
+def _now(offset_seconds=0):
+    return (datetime.datetime.now() + datetime.timedelta(seconds=offset_seconds)).strftime(TIME_FORMAT)
+
+
+def normalize_tags(tags):
+    """空白和逗号统一成单个空格、英文转小写；保留顺序（顺序会影响生成结果）"""
+    return ' '.join((tags or '').replace(',', ' ').replace('，', ' ').lower().split())
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """图片内容的 sha256，文件不存在时返回 None"""
+    if not path:
+        return None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _SHA256_RE.fullmatch(stem):
+        # 按内容寻址保存的图片（ImageStore），文件名就是内容哈希，不用再读一遍文件
+        return stem
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def make_key(model, existing_tags, image_hash=None):
+    raw = '\0'.join((model, normalize_tags(existing_tags), image_hash or ''))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class TagCache:
+    def __init__(self, app=None, db=None):
+        self.enabled = False
+        self.size = 0
+        self.ttl = 0
+        self._memory = OrderedDict()    # cache_key -> (tags, expires_at)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.size = max(0, int(app.config['AI_TAG_CACHE_SIZE']))
+        self.ttl = int(app.config['AI_TAG_CACHE_TTL'])
+        self.enabled = self.ttl > 0
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key, tags, expires_at):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (tags, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.size:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """返回缓存的标签，未命中或已过期返回 None"""
+        if not self.enabled:
+            return None
+        now = _now()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+        pool = self.db.get_pool()
+        conn = pool.acquire()
+        try:
+            row = conn.execute(
+                "SELECT tags, expires_at FROM ai_tag_cache WHERE cache_key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        finally:
+            pool.release(conn)
+        if row is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, row['tags'], row['expires_at'])
+        return row['tags']
+
+    def set(self, key, model, tags):
+        if not self.enabled:
+            return
+        expires_at = _now(self.ttl)
+        self._remember(key, tags, expires_at)
+        pool = self.db.get_pool()
+        conn = pool.acquire()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO ai_tag_cache (cache_key, model, tags, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, model, tags, _now(), expires_at))
+            conn.commit()
+        except Exception:
+            # 缓存写失败不影响本次生成结果
+            logger.exception("Failed to store AI tags in cache")
+        finally:
+            pool.release(conn)
+        self.stores += 1
+
+    def get_or_generate(self, model, existing_tags, img_path, generate):
+        """
+        先查缓存，未命中时调用 generate()（返回生成的标签文本，失败返回 None）并缓存结果。
+        失败的结果不缓存，下次会重新调用模型。
+        """
+        key = make_key(model, existing_tags, file_hash(img_path))
+        cached = self.get(key)
+        if cached is not None:
+            logger.debug(f"AI tag cache hit: model={model}, key={key[:12]}")
+            return cached
+        generated = generate()
+        if generated is not None:
+            self.set(key, model, generated)
+        return generated
+
+    @staticmethod
+    def purge_expired(conn):
+        """删除过期的磁盘缓存，不提交，返回删除的条数"""
+        return conn.execute("DELETE FROM ai_tag_cache WHERE expires_at <= ?", (_now(),)).rowcount
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'memory_entries': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,222 @@
+# app/tag_suggest.py
+# 本地标签推荐：不访问网络，在进程内用已有商品的 title / tags 推荐相关标签，单次耗时在毫秒级。
+# 没有 GEMINI_API_KEY、模型服务失败或熔断时作为 AI_interface 的兜底，也可以直接作为主引擎
+# （AI_TAG_BACKEND = 'local'）。推荐分数由两部分组成：
+#   - 相似商品投票：新商品的 TF-IDF 向量与已有商品做相似度（倒排表累加），取最相似的
+#     TAG_SUGGEST_NEIGHBOURS 个商品，按相似度给它们的标签投票
+#   - 标签共现：卖家已经填写的标签 e，其他标签 t 与它一起出现的条件概率 P(t | e)
+# 模型是只追加的倒排表，用标准库 array 存储（int32 / float32，紧凑，追加 O(1)），打分时转成 NumPy。
+# 发布商品时增量追加；修改/删除不回写，由维护任务定期整体重建。
+import logging
+logger = logging.getLogger(__name__)
+
+import math
+import time
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from .search import tokenize
+from .tag_cache import normalize_tags
+
+
+def split_tags(text):
+    """tags 列的标签列表（空白/逗号分隔，小写）"""
+    return normalize_tags(text).split()
+
+
+class TagModel:
+    """一次构建出的推荐模型；只追加，不删除"""
+
+    def __init__(self):
+        self.item_ids = array('i')          # 模型内下标 -> items.id
+        self.item_len = array('f')          # 每个商品的 token 数
+        self.term_index = {}                # token -> term id
+        self.term_postings = []             # term id -> array('i') 商品下标
+        self.term_tf = []                   # term id -> array('f') 对应商品中的词频
+        self.tag_index = {}                 # 标签 -> tag id
+        self.tag_names = []
+        self.tag_df = array('i')            # 标签出现在多少个商品中
+        self.item_tag_ptr = array('i', [0])  # CSR：商品 i 的标签为 item_tag_ids[ptr[i]:ptr[i+1]]
+        self.item_tag_ids = array('i')
+        self.cooc = []                      # tag id -> array('i') 与之共现的 tag id（重复出现即计数）
+
+    @property
+    def size(self):
+        return len(self.item_ids)
+
+    def _tag_id(self, tag):
+        tag_id = self.tag_index.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tag_names)
+            self.tag_index[tag] = tag_id
+            self.tag_names.append(tag)
+            self.tag_df.append(0)
+            self.cooc.append(array('i'))
+        return tag_id
+
+    def add(self, item_id, title, tags):
+        index = len(self.item_ids)
+        tag_list = list(dict.fromkeys(split_tags(tags)))
+        tokens = tokenize(f"{title or ''} {' '.join(tag_list)}")
+        self.item_ids.append(item_id)
+        self.item_len.append(max(1, len(tokens)))
+        for token, tf in Counter(tokens).items():
+            term_id = self.term_index.get(token)
+            if term_id is None:
+                term_id = len(self.term_postings)
+                self.term_index[token] = term_id
+                self.term_postings.append(array('i'))
+                self.term_tf.append(array('f'))
+            self.term_postings[term_id].append(index)
+            self.term_tf[term_id].append(tf)
+        tag_ids = [self._tag_id(tag) for tag in tag_list]
+        for tag_id in tag_ids:
+            self.tag_df[tag_id] += 1
+            self.cooc[tag_id].extend(other for other in tag_ids if other != tag_id)
+        self.item_tag_ids.extend(tag_ids)
+        self.item_tag_ptr.append(len(self.item_tag_ids))
+
+    def neighbour_votes(self, query_tokens, neighbours):
+        """TF-IDF 相似度最高的 neighbours 个商品按相似度给标签投票，返回归一化到 [0, 1] 的投票向量"""
+        votes = np.zeros(len(self.tag_names), dtype=np.float32)
+        n_items = self.size
+        if n_items == 0:
+            return votes
+        scores = np.zeros(n_items, dtype=np.float32)
+        lengths = np.sqrt(np.asarray(self.item_len, dtype=np.float32))
+        for token, query_tf in Counter(query_tokens).items():
+            term_id = self.term_index.get(token)
+            if term_id is None:
+                continue
+            postings = np.asarray(self.term_postings[term_id], dtype=np.int64)
+            idf = math.log((n_items + 1) / (len(postings) + 1)) + 1.0
+            # 同一个词在一个商品的倒排表里只出现一次，可以直接按下标累加
+            scores[postings] += query_tf * idf * idf * np.asarray(self.term_tf[term_id], dtype=np.float32)
+        scores /= lengths
+        k = min(neighbours, n_items)
+        top = np.argpartition(-scores, k - 1)[:k]
+        ptr = self.item_tag_ptr
+        for index in top:
+            score = scores[index]
+            if score <= 0:
+                continue
+            tag_ids = self.item_tag_ids[ptr[index]:ptr[index + 1]]
+            if tag_ids:
+                votes[np.asarray(tag_ids, dtype=np.int64)] += score
+        peak = votes.max() if len(votes) else 0
+        return votes / peak if peak > 0 else votes
+
+    def cooccurrence(self, existing_tag_ids):
+        """已有标签的平均条件概率 P(t | e)"""
+        total = np.zeros(len(self.tag_names), dtype=np.float32)
+        for tag_id in existing_tag_ids:
+            if self.cooc[tag_id]:
+                counts = np.bincount(np.asarray(self.cooc[tag_id], dtype=np.int64), minlength=len(self.tag_names))
+                total += counts / self.tag_df[tag_id]
+        return total / len(existing_tag_ids) if existing_tag_ids else total
+
+    def memory_bytes(self):
+        arrays = [self.item_ids, self.item_len, self.tag_df, self.item_tag_ptr, self.item_tag_ids]
+        arrays += self.term_postings + self.term_tf + self.cooc
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+class TagSuggester:
+    def __init__(self, app=None, db=None, executor=None):
+        self.model = None
+        self.built_at = None
+        self._lock = threading.Lock()
+        self.suggestions = 0
+        self.total_ms = 0.0
+        if app is not None:
+            self.init_app(app, db, executor)
+
+    def init_app(self, app, db, executor):
+        self.db = db
+        self.executor = executor
+        self.limit = int(app.config['TAG_SUGGEST_LIMIT'])
+        self.neighbours = int(app.config['TAG_SUGGEST_NEIGHBOURS'])
+        self.cooc_weight = float(app.config['TAG_SUGGEST_COOC_WEIGHT'])
+        # 其他 AI 后端失败时是否用本地推荐兜底
+        self.fallback = bool(app.config['AI_LOCAL_FALLBACK'])
+        self.model = None
+        self.built_at = None
+
+    def _build(self):
+        model = TagModel()
+        pool = self.db.get_pool()
+        conn = pool.acquire()
+        try:
+            started = time.perf_counter()
+            for row in conn.execute("SELECT id, title, tags FROM items ORDER BY id"):
+                model.add(row['id'], row['title'], row['tags'])
+        finally:
+            pool.release(conn)
+        logger.info(f"Tag suggester built: {model.size} items, {len(model.tag_names)} tags, "
+                    f"{len(model.term_postings)} terms, {model.memory_bytes() / 1024:.0f} KiB "
+                    f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return model
+
+    def rebuild(self):
+        """从 items 表重新构建模型（维护任务定期调用，修改/删除的商品在这时生效），返回商品数"""
+        model = self.executor.run(self._build) if self.executor is not None else self._build()
+        with self._lock:
+            self.model = model
+            self.built_at = time.time()
+        return model.size
+
+    def refresh(self):
+        """维护任务使用：只重建已经在用的模型，没用过本地推荐的进程不做无用功"""
+        return self.rebuild() if self.model is not None else None
+
+    def _ensure_model(self):
+        if self.model is None:
+            model = self._build()
+            with self._lock:
+                if self.model is None:
+                    self.model = model
+                    self.built_at = time.time()
+        return self.model
+
+    def add(self, item_id, title, tags):
+        """发布商品后增量追加；模型还没构建时跳过（第一次构建会包含它）"""
+        if self.model is None:
+            return
+        with self._lock:
+            self.model.add(item_id, title, tags)
+
+    def suggest(self, title, existing_tags, limit=None):
+        """推荐与 title / existing_tags 相关、且不在 existing_tags 中的标签，按分数降序"""
+        started = time.perf_counter()
+        model = self._ensure_model()
+        existing = split_tags(existing_tags)
+        limit = self.limit if limit is None else limit
+        # 追加和打分都在锁内进行，不会读到追加了一半的商品（打分期间不做 IO，不会让出 green thread）
+        with self._lock:
+            if not model.tag_names:
+                return []
+            scores = model.neighbour_votes(tokenize(f"{title or ''} {' '.join(existing)}"), self.neighbours)
+            known = [model.tag_index[tag] for tag in existing if tag in model.tag_index]
+            if known and self.cooc_weight > 0:
+                scores = (1 - self.cooc_weight) * scores + self.cooc_weight * model.cooccurrence(known)
+            scores[known] = 0
+            order = np.argsort(-scores)[:limit + len(existing)]
+            result = [model.tag_names[i] for i in order if scores[i] > 0 and model.tag_names[i] not in existing]
+        self.suggestions += 1
+        self.total_ms += (time.perf_counter() - started) * 1000
+        return result[:limit]
+
+    def stats(self):
+        model = self.model
+        return {
+            'built': model is not None,
+            'items': model.size if model else 0,
+            'tags': len(model.tag_names) if model else 0,
+            'terms': len(model.term_postings) if model else 0,
+            'memory_kb': round(model.memory_bytes() / 1024, 1) if model else 0,
+            'suggestions': self.suggestions,
+            'avg_ms': round(self.total_ms / self.suggestions, 2) if self.suggestions else 0.0
+        }
@@ -0,0 +1,81 @@
+# app/token_cache.py
+# 已验证 JWT 的进程内缓存：token_required 和 Socket.IO 连接认证共用。
+# 同一个 token 在有效期内会被反复使用（前端每个请求都带上），每次都做 jwt.decode（base64 + JSON +
+# HMAC-SHA256 + 声明检查）没有必要。第一次验证通过后记下 token 的 SHA-256 -> (user_id, exp)，
+# 之后只需计算一次 SHA-256 查表；到 exp 时按过期处理并移出缓存，与 jwt.decode 的结果一致。
+# 缓存只保存摘要，不保存 token 原文；容量 TOKEN_CACHE_SIZE，按 LRU 淘汰，0 表示关闭。
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import jwt
+
+
+class TokenCache:
+    def __init__(self, app=None):
+        self.size = 0
+        self.secret = None
+        self._entries = OrderedDict()   # sha256(token) -> (user_id, exp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.size = max(0, int(app.config['TOKEN_CACHE_SIZE']))
+        self.secret = app.config['SECRET_KEY']
+        with self._lock:
+            self._entries.clear()
+
+    def verify(self, token):
+        """
+        验证 token 并返回其中的 user_id（sub）。
+        过期时抛出 jwt.ExpiredSignatureError，其他无效情况抛出 jwt.InvalidTokenError（与 jwt.decode 相同）。
+        """
+        if not isinstance(token, str):
+            raise jwt.DecodeError('Invalid token type')
+        if self.size <= 0:
+            return jwt.decode(token, self.secret, algorithms=['HS256'])['sub']
+
+        digest = hashlib.sha256(token.encode('utf-8')).digest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                user_id, exp = entry
+                if exp is not None and exp <= time.time():
+                    del self._entries[digest]
+                    raise jwt.ExpiredSignatureError('Signature has expired')
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return user_id
+
+        payload = jwt.decode(token, self.secret, algorithms=['HS256'])
+        self.misses += 1
+        with self._lock:
+            self._entries[digest] = (payload['sub'], payload.get('exp'))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return payload['sub']
+
+    def discard(self, token):
+        """登出时移除缓存项（token 本身在 exp 之前仍然有效，下次使用时会重新验证）"""
+        with self._lock:
+            self._entries.pop(hashlib.sha256(token.encode('utf-8')).digest(), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.size > 0,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
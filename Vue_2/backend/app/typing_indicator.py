@@ -0,0 +1,133 @@
+# app/typing_indicator.py
+# "正在输入"状态的合并与限流。前端每次按键都可能发一个 typing 事件，原来直接转发给对方，
+# 打字快时每个会话每秒几十次推送。这里按 (发送方, 接收方, 商品) 记录状态：
+#   - 状态没变（一直在输入）的事件只刷新过期时间，不转发
+#   - 状态变化时，距上次转发不到 TYPING_INTERVAL_MS 就先记下，到时间后只转发最终状态
+#     （输入 -> 停止 -> 输入 在一个间隔内来回切换，对方什么都不会收到）
+#   - 超过 TYPING_TIMEOUT_S 没有新的 typing 事件，自动向对方发送"停止输入"（客户端断线、切走页面时）
+# 延迟转发和超时由一个后台 green thread 处理，没有活跃会话时自动退出。
+# 只在 eventlet 的 green thread 中使用（不加锁）：修改状态的代码之间没有让出点，推送放在最后。
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+
+
+class _TypingState:
+    __slots__ = ('sent', 'sent_at', 'wanted', 'expires_at')
+
+    def __init__(self):
+        self.sent = False           # 对方当前看到的状态
+        self.sent_at = 0.0          # 上次转发的时间
+        self.wanted = False         # 发送方最新的状态（可能还没转发）
+        self.expires_at = None      # 正在输入时，这个时间之后自动视为停止
+
+
+class TypingCoalescer:
+    def __init__(self, app=None, socketio=None):
+        self._states = {}           # (from_user_id, to_user_id, item_id) -> _TypingState
+        self._sweeper_running = False
+        self.received = 0
+        self.emitted = 0
+        self.dropped = 0            # 状态没变，直接丢弃
+        self.coalesced = 0          # 间隔内被后续事件覆盖，没有单独转发
+        self.expired = 0
+        if app is not None:
+            self.init_app(app, socketio)
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.interval = max(0.0, app.config['TYPING_INTERVAL_MS'] / 1000.0)
+        self.timeout = max(0.1, float(app.config['TYPING_TIMEOUT_S']))
+        self._states = {}
+
+    def update(self, from_user_id, to_user_id, item_id, is_typing):
+        """处理一个 typing 事件"""
+        self.received += 1
+        key = (from_user_id, to_user_id, item_id)
+        now = time.monotonic()
+        state = self._states.get(key)
+        if state is None:
+            if not is_typing:
+                # 对方本来就没有看到"正在输入"
+                self.dropped += 1
+                return
+            state = self._states[key] = _TypingState()
+
+        if is_typing:
+            state.expires_at = now + self.timeout
+        if state.wanted == is_typing:
+            self.dropped += 1
+            return
+        if state.wanted != state.sent:
+            # 上一个状态变化还没来得及转发，就被这一次覆盖了
+            self.coalesced += 1
+        state.wanted = is_typing
+
+        # 来回切换后回到了对方看到的状态时不需要转发
+        if state.wanted != state.sent and now - state.sent_at >= self.interval:
+            self._emit(key, state, now)
+        self._ensure_sweeper()
+
+    def clear_sender(self, from_user_id):
+        """发送方所有连接都断开时调用：对方看到的"正在输入"立即变为停止"""
+        for key, state in list(self._states.items()):
+            if key[0] == from_user_id:
+                state.wanted = False
+                if state.sent:
+                    self._emit(key, state, time.monotonic())
+                self._states.pop(key, None)
+
+    def _emit(self, key, state, now):
+        from_user_id, to_user_id, item_id = key
+        state.sent = state.wanted
+        state.sent_at = now
+        self.emitted += 1
+        self.socketio.emit('user_typing', {
+            'user_id': from_user_id,
+            'item_id': item_id,
+            'is_typing': state.sent
+        }, room=f"user_{to_user_id}")
+
+    def _ensure_sweeper(self):
+        if self._states and not self._sweeper_running:
+            self._sweeper_running = True
+            self.socketio.start_background_task(self._sweep_forever)
+
+    def _sweep_forever(self):
+        tick = max(0.05, min(self.interval or self.timeout, self.timeout) / 2)
+        try:
+            while self._states:
+                self.socketio.sleep(tick)
+                self.sweep()
+        finally:
+            self._sweeper_running = False
+
+    def sweep(self):
+        """转发到期的延迟状态，处理超时；返回处理的会话数"""
+        now = time.monotonic()
+        handled = 0
+        for key, state in list(self._states.items()):
+            if state.wanted and state.expires_at is not None and now >= state.expires_at:
+                state.wanted = False
+                self.expired += 1
+            if now - state.sent_at < self.interval:
+                continue
+            if state.wanted != state.sent:
+                self._emit(key, state, now)
+                handled += 1
+            elif not state.sent:
+                # 对方看到的是"停止输入"且已过了限流间隔，不需要再记住这个会话
+                del self._states[key]
+        return handled
+
+    def stats(self):
+        return {
+            'active': len(self._states),
+            'received': self.received,
+            'emitted': self.emitted,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'expired': self.expired,
+            'reduction': round(1 - self.emitted / self.received, 3) if self.received else 0.0
+        }
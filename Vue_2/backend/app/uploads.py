@@ -0,0 +1,194 @@
+# app/uploads.py
+# 流式接收上传文件：werkzeug 默认把小于 500KB 的文件放在内存（BytesIO）里，整个请求解析完之后
+# 视图才能检查文件，再由 ImageStore 重新读一遍计算哈希、写到图片目录。
+# UploadRequest 让表单解析器直接把每个文件分块写进图片目录下的临时文件，同时：
+#   - 计算 SHA-256（ImageStore 直接用它命名，文件只需要 rename，不再复制）
+#   - 根据开头的魔数识别图片格式，不是图片时立即中止解析（415）
+#   - 累计大小超过 UPLOAD_MAX_FILE_SIZE 时立即中止（413），不必等整个请求体收完
+# 每个请求占用的内存只有解析器的缓冲区（上限 UPLOAD_MAX_FORM_MEMORY）和普通表单字段（标题、描述等，
+# 总量受 MAX_CONTENT_LENGTH 限制），文件内容不进内存。
+# 请求结束时（request.close）没有被 ImageStore 使用的临时文件会被删除。
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import uuid
+import hashlib
+
+from flask import Request, current_app
+from werkzeug.formparser import FormDataParser
+
+from .exceptions import UploadRejected
+
+UPLOAD_TMP_PREFIX = '.upload-'
+
+# 魔数 -> 扩展名；WebP 是 RIFF 容器，需要再检查第 8~12 字节
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+SNIFF_BYTES = 12
+
+
+def _format_size(size):
+    return f"{size / (1024 * 1024):g}MB" if size >= 1024 * 1024 else f"{size // 1024}KB"
+
+
+def sniff_image_type(head):
+    """根据文件开头的字节判断图片格式，返回扩展名；不是支持的图片时返回 None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, ext in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+class StreamedUpload:
+    """
+    表单解析器写入的文件对象：写到 directory 下的临时文件，边写边计算哈希、检查大小和类型。
+    解析完成后作为 FileStorage.stream，提供 read / seek 等普通文件接口。
+    """
+
+    def __init__(self, directory, max_size, on_reject=None, filename=None):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{UPLOAD_TMP_PREFIX}{uuid.uuid4().hex}")
+        self.max_size = max_size
+        self.filename = filename
+        self.size = 0
+        self.ext = None
+        self._file = open(self.path, 'w+b')
+        self._sha256 = hashlib.sha256()
+        self._head = b''
+        self._claimed = False
+        self._on_reject = on_reject
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            self._reject(UploadRejected('FILE_TOO_LARGE', f"文件不能超过 {_format_size(self.max_size)}", 413))
+        if self.ext is None:
+            # 凑够开头的字节再判断类型；不是图片时剩下的请求体不再读取
+            self._head += data[:SNIFF_BYTES]
+            if len(self._head) >= SNIFF_BYTES:
+                self.ext = sniff_image_type(self._head)
+                if self.ext is None:
+                    self._reject_type()
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def _reject(self, error):
+        self.discard()
+        if self._on_reject is not None:
+            self._on_reject()
+        raise error
+
+    def _reject_type(self):
+        self._reject(UploadRejected('UNSUPPORTED_FILE_TYPE', "只支持 JPEG / PNG / GIF / WebP / BMP 图片", 415))
+
+    def seek(self, offset, whence=0):
+        # 不足 SNIFF_BYTES 的小文件在解析结束（seek(0)）时判断；有文件名的空文件同样拒绝。
+        # 没有文件名的空文件是表单里"未选择文件"的文件框，FileStorage 为假，视图不会保存它
+        if self.ext is None and (self.size or self.filename):
+            self.ext = sniff_image_type(self._head)
+            if self.ext is None:
+                self._reject_type()
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def claim(self):
+        """ImageStore 接管临时文件（随后 rename 到正式路径），返回临时文件路径"""
+        if self.ext is None:
+            # 没有识别出图片类型（例如空文件）时不能保存
+            self._reject_type()
+        self._file.close()
+        self._claimed = True
+        return self.path
+
+    def discard(self):
+        self._file.close()
+        if not self._claimed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        self.discard()
+
+
+class RejectableStream:
+    """
+    请求体的包装。werkzeug 的表单解析器在解析结束（包括出错）时调用 stream.exhaust() 读完剩余的请求体；
+    上传已被拒绝时不再读取，错误响应立即返回，剩下的数据随连接关闭丢弃。
+    """
+
+    def __init__(self, stream, is_rejected):
+        self._stream = stream
+        self._is_rejected = is_rejected
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def readline(self, size=-1):
+        return self._stream.readline(size)
+
+    def exhaust(self):
+        if self._is_rejected():
+            return
+        while self._stream.read(64 * 1024):
+            pass
+
+    def __iter__(self):
+        return iter(self._stream)
+
+
+class UploadFormDataParser(FormDataParser):
+    """把请求体包装成 RejectableStream 再交给 werkzeug 解析"""
+    is_rejected = staticmethod(lambda: False)
+
+    def parse(self, stream, mimetype, content_length, options=None):
+        return super().parse(RejectableStream(stream, self.is_rejected), mimetype, content_length, options)
+
+
+class UploadRequest(Request):
+    """上传文件直接流式写入图片目录（见 StreamedUpload）"""
+    form_data_parser_class = UploadFormDataParser
+    _upload_rejected = False
+
+    @property
+    def max_form_memory_size(self):
+        # multipart 解析器中尚未切分的缓冲数据上限（畸形请求不会在内存中无限堆积），超过时返回 413
+        return current_app.config['UPLOAD_MAX_FORM_MEMORY']
+
+    def make_form_data_parser(self):
+        parser = super().make_form_data_parser()
+        parser.is_rejected = lambda: self._upload_rejected
+        return parser
+
+    def _stop_reading(self):
+        # werkzeug 在解析出错后默认会读完剩余的请求体再返回；拒绝上传时跳过（见 RejectableStream），立即返回错误
+        self._upload_rejected = True
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return StreamedUpload(os.path.join(current_app.root_path, 'static', 'images'),
+                              current_app.config['UPLOAD_MAX_FILE_SIZE'], on_reject=self._stop_reading,
+                              filename=filename)
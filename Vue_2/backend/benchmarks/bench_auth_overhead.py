@@ -0,0 +1,95 @@
+# benchmarks/bench_auth_overhead.py
+# 认证本身给每个请求带来的开销（微秒/请求），用 test_client 在进程内调用只返回 {"ok": true} 的测试路由：
+#   none      不认证（基线）
+#   legacy    原来的 token_required：每次 jwt.decode，并写 session['user_id']（每个响应都重新签发 Set-Cookie）
+#   no-cache  TOKEN_CACHE_SIZE=0：每次 jwt.decode，身份放在 g 中
+#   cached    默认：token 验证过一次后走缓存，身份放在 g 中
+# 最后单独比较一次 jwt.decode 和一次缓存命中的耗时。
+#   cd Vue_2/backend && python benchmarks/bench_auth_overhead.py [--requests 20000]
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from flask import jsonify, request, session, current_app
+
+
+def legacy_token_required(f):
+    """token_required 加缓存之前的实现（只保留成功路径）"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers['Authorization'].split(' ')[1]
+        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        session['user_id'] = payload['sub']
+        return f(*args, **kwargs)
+    return decorated
+
+
+def ping():
+    return jsonify({"ok": True})
+
+
+def time_requests(client, path, headers, count):
+    client.get(path, headers=headers)
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get(path, headers=headers)
+    elapsed = time.perf_counter() - started
+    return elapsed / count * 1e6, 'Set-Cookie' in response.headers
+
+
+def time_calls(func, count):
+    func()
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    from app import create_app, token_cache
+    from app.auth import token_required, generate_token
+
+    app = create_app({'DATABASE': os.path.join(tempfile.mkdtemp(), 'bench.db'), 'TESTING': True})
+    app.add_url_rule('/bench/none', 'bench_none', ping)
+    app.add_url_rule('/bench/legacy', 'bench_legacy', legacy_token_required(ping))
+    app.add_url_rule('/bench/current', 'bench_current', token_required(ping))
+
+    with app.app_context():
+        token = generate_token(1)
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client(use_cookies=False)
+    cache_size = token_cache.size
+
+    rows = [('none', '/bench/none', {}, cache_size),
+            ('legacy', '/bench/legacy', headers, cache_size),
+            ('no-cache', '/bench/current', headers, 0),
+            ('cached', '/bench/current', headers, cache_size)]
+    results = {}
+    print(f"{'mode':>9} {'us/req':>8} {'auth us':>8}  set-cookie")
+    for name, path, request_headers, size in rows:
+        token_cache.size = size
+        per_request, set_cookie = time_requests(client, path, request_headers, args.requests)
+        results[name] = per_request
+        print(f"{name:>9} {per_request:>8.1f} {per_request - results['none']:>8.1f}  {'yes' if set_cookie else 'no'}")
+    token_cache.size = cache_size
+
+    count = args.requests * 5
+    decode = time_calls(lambda: jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256']), count)
+    hit = time_calls(lambda: token_cache.verify(token), count)
+    print(f"jwt.decode {decode:.2f} us, cache hit {hit:.2f} us ({decode / hit:.1f}x); {token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_image_serving.py
+# /images/<path> 的吞吐（请求/秒）：在子进程里用 eventlet.wsgi 启动真实服务，多个 keep-alive 连接并发请求同一张图片：
+#   legacy    IMAGE_CACHE_MAX_AGE=0，原来的 send_from_directory（no-cache，每次都传完整文件）
+#   full      缓存模式下第一次访问，200 + 完整文件
+#   304       浏览器带 If-None-Match 重新验证，只返回头
+#   range     Range: bytes=0-65535，206 分段
+# 缓存模式下 max-age 内的再次访问（immutable）浏览器根本不发请求，不在表里。
+#   cd Vue_2/backend && python benchmarks/bench_image_serving.py [--seconds 3] [--connections 8] [--size-kb 200]
+import os
+import sys
+import time
+import uuid
+import argparse
+import logging
+import tempfile
+import threading
+import http.client
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def serve(config, ready):
+    import eventlet
+    import eventlet.wsgi
+    from app import create_app
+
+    logging.disable(logging.CRITICAL)
+    app = create_app(dict(config, DATABASE=os.path.join(tempfile.mkdtemp(), 'bench.db'), TESTING=True))
+    listener = eventlet.listen(('127.0.0.1', 0))
+    ready.put(listener.getsockname()[1])
+    eventlet.wsgi.server(listener, app, log_output=False)
+
+
+def hammer(port, path, headers, seconds, connections):
+    counts = [0] * connections
+    statuses = set()
+    stop_at = time.perf_counter() + seconds
+
+    def worker(slot):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        while time.perf_counter() < stop_at:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            statuses.add(response.status)
+            counts[slot] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds, statuses
+
+
+def run_server(config):
+    ctx = multiprocessing.get_context('fork')
+    ready = ctx.Queue()
+    process = ctx.Process(target=serve, args=(config, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--size-kb', type=int, default=200)
+    args = parser.parse_args()
+
+    images_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'static', 'images')
+    os.makedirs(images_dir, exist_ok=True)
+    filename = f"bench-{uuid.uuid4().hex}.jpg"
+    image_path = os.path.join(images_dir, filename)
+    with open(image_path, 'wb') as f:
+        f.write(os.urandom(args.size_kb * 1024))
+    path = f"/images/{filename}"
+
+    try:
+        print(f"{'mode':>7} {'req/s':>9} {'MiB/s':>8} {'status':>7}  cache-control")
+        for mode, config in (('legacy', {'IMAGE_CACHE_MAX_AGE': 0}), ('cached', {})):
+            process, port = run_server(config)
+            try:
+                probe = http.client.HTTPConnection('127.0.0.1', port)
+                probe.request('GET', path)
+                response = probe.getresponse()
+                response.read()
+                etag, cache_control = response.getheader('ETag'), response.getheader('Cache-Control')
+                probe.close()
+
+                cases = [('legacy' if mode == 'legacy' else 'full', {}, args.size_kb * 1024)]
+                if mode == 'cached':
+                    cases += [('304', {'If-None-Match': etag}, 0),
+                              ('range', {'Range': 'bytes=0-65535'}, 65536)]
+                for name, headers, body in cases:
+                    rate, statuses = hammer(port, path, headers, args.seconds, args.connections)
+                    print(f"{name:>7} {rate:>9.0f} {rate * body / 2 ** 20:>8.1f} "
+                          f"{','.join(map(str, sorted(statuses))):>7}  {cache_control}")
+            finally:
+                process.terminate()
+                process.join()
+    finally:
+        os.remove(image_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_llm_client.py
+# 用本地桩服务（stub_llm_server.py）检验 LLMClient 在不同故障下的表现：
+#   healthy   正常响应
+#   flaky     30% 请求返回 503，靠退避重试恢复
+#   slow      响应慢于单次请求超时，受截止时间约束
+#   down      全部 503，熔断打开后直接失败，不再打到服务端
+#   cd Vue_2/backend && python benchmarks/bench_llm_client.py [--calls 40]
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.llm_client import LLMClient
+from stub_llm_server import StubState, start_stub_server
+
+SCENARIOS = {
+    'healthy': dict(latency_ms=50, fail_rate=0.0),
+    'flaky': dict(latency_ms=50, fail_rate=0.3),
+    'slow': dict(latency_ms=1500, fail_rate=0.0),
+    'down': dict(latency_ms=20, fail_rate=1.0),
+}
+
+
+def run_scenario(name, calls, concurrency):
+    state = StubState(**SCENARIOS[name])
+    server, base_url = start_stub_server(state)
+    app = create_app({
+        'DATABASE': os.path.join(tempfile.mkdtemp(), 'bench.db'),
+        'TESTING': True,
+        'AI_API_KEY': 'stub',
+        'AI_BASE_URL': base_url,
+        'AI_TIMEOUT_S': 1,
+        'AI_DEADLINE_S': 3,
+        'AI_BACKOFF_BASE_S': 0.05,
+        'AI_BACKOFF_MAX_S': 0.5,
+        'AI_MAX_CONCURRENCY': 4,
+        'AI_BREAKER_FAILURES': 5,
+        'AI_BREAKER_RESET_S': 30,
+    })
+    client = LLMClient(app)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda _: client.generate('tags please'), range(calls)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    ok = sum(r is not None for r in results)
+    return ok, elapsed, state.requests, client.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8, help='调用方线程数（客户端自身限制 4 个并发）')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'scenario':>9} {'ok':>5} {'wall s':>7} {'upstream':>9} {'retries':>8} {'timeouts':>9} "
+          f"{'fast-fail':>10} {'p50 ms':>7} {'breaker':>10}")
+    for name in SCENARIOS:
+        ok, elapsed, upstream, stats = run_scenario(name, args.calls, args.concurrency)
+        print(f"{name:>9} {ok:>5} {elapsed:>7.2f} {upstream:>9} {stats['retries']:>8} {stats['timeouts']:>9} "
+              f"{stats['short_circuited']:>10} {str(stats['latency_ms']['p50']):>7} {stats['breaker']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_login_chat_latency.py
+# 测量登录(pbkdf2)并发进行时，聊天消息发送的延迟。分别在 OFFLOAD_BLOCKING 关闭/开启两种模式下运行：
+#   cd Vue_2/backend && python benchmarks/bench_login_chat_latency.py [--logins 4] [--duration 5]
+# 关闭时 pbkdf2 和 sqlite3 在 hub 线程里执行，聊天请求要排在正在进行的登录后面；
+# 开启时这些调用进入线程池，聊天延迟基本不受登录影响。
+import os
+import sys
+import time
+import argparse
+import tempfile
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eventlet
+from app import create_app
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def run_scenario(offload, logins, duration, threads):
+    tmp = tempfile.mkdtemp()
+    app = create_app({
+        'DATABASE': os.path.join(tmp, 'bench.db'),
+        'TESTING': True,
+        'OFFLOAD_BLOCKING': offload,
+        'OFFLOAD_THREADS': threads,
+        'MAINTENANCE_LOCK_SWEEP_INTERVAL': 0,
+    })
+    from run import init_db
+    init_db(app)
+    client = app.test_client()
+
+    for name in ('seller', 'buyer'):
+        client.post('/api/auth/register', json={'username': name, 'password': 'pw', 'email': f'{name}@bench'})
+    seller = client.post('/api/auth/login', json={'username': 'seller', 'password': 'pw'}).json['data']
+    buyer = client.post('/api/auth/login', json={'username': 'buyer', 'password': 'pw'}).json['data']
+    seller_headers = {'Authorization': f"Bearer {seller['access_token']}"}
+    buyer_headers = {'Authorization': f"Bearer {buyer['access_token']}"}
+    item_id = client.post('/api/items', data={'title': 'bench item', 'tags': 'bench'},
+                          headers=seller_headers).json['data']['id']
+
+    deadline = time.monotonic() + duration
+    login_count = [0]
+    latencies = []
+
+    def login_loop():
+        c = app.test_client()
+        while time.monotonic() < deadline:
+            c.post('/api/auth/login', json={'username': 'seller', 'password': 'pw'})
+            login_count[0] += 1
+            eventlet.sleep(0)
+
+    def chat_loop():
+        c = app.test_client()
+        while time.monotonic() < deadline:
+            # 模拟聊天请求到达：先让出 hub，等轮到自己执行时再算完成时间
+            start = time.perf_counter()
+            eventlet.sleep(0)
+            c.post('/api/messages', json={'to_user_id': seller['user']['id'], 'item_id': item_id,
+                                          'content': 'ping'}, headers=buyer_headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            eventlet.sleep(0.02)
+
+    pool = eventlet.GreenPool()
+    for _ in range(logins):
+        pool.spawn(login_loop)
+    pool.spawn(chat_loop)
+    pool.waitall()
+
+    return {
+        'offload': offload,
+        'logins': login_count[0],
+        'messages': len(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'max': max(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=4, help='并发登录的 green thread 数')
+    parser.add_argument('--duration', type=float, default=5.0, help='每种模式的运行秒数')
+    parser.add_argument('--threads', type=int, default=8, help='OFFLOAD_THREADS')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'offload':>8} {'logins':>7} {'msgs':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for offload in (False, True):
+        r = run_scenario(offload, args.logins, args.duration, args.threads)
+        print(f"{str(r['offload']):>8} {r['logins']:>7} {r['messages']:>6} "
+              f"{r['p50']:>9.1f} {r['p95']:>9.1f} {r['max']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/bench_message_throughput.py
+# 聊天消息写入吞吐（条/秒），对比三种持久化方式：
+#   legacy        旧实现：get_or_create / INSERT / update_on_new_message 各提交一次（每条 3 次提交）
+#   single-tx     Message.send：UPSERT ... RETURNING，每条消息一个事务
+#   group-commit  Message.send + 组提交：窗口内的并发消息合并为一个事务
+#   cd Vue_2/backend && python benchmarks/bench_message_throughput.py [--senders 50] [--messages 40]
+import os
+import sys
+import time
+import argparse
+import datetime
+import sqlite3
+import tempfile
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eventlet
+from app import create_app, db
+from app.models import Message
+
+
+def legacy_send(from_user_id, to_user_id, item_id, content):
+    """重现旧版 Message.send 的写入方式，仅用于对比"""
+    conn = db.get_db()
+    user1_id, user2_id = sorted((from_user_id, to_user_id))
+    row = conn.execute("SELECT id FROM conversations WHERE user1_id = ? AND user2_id = ? AND item_id = ?",
+                       (user1_id, user2_id, item_id)).fetchone()
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if row:
+        conversation_id = row['id']
+    else:
+        conversation_id = conn.execute(
+            "INSERT INTO conversations (user1_id, user2_id, item_id, last_updated) VALUES (?, ?, ?, ?)",
+            (user1_id, user2_id, item_id, now)).lastrowid
+        conn.commit()
+    message_id = conn.execute(
+        "INSERT INTO messages (conversation_id, from_user_id, to_user_id, item_id, content, is_read, created_at) "
+        "VALUES (?, ?, ?, ?, ?, 0, ?)", (conversation_id, from_user_id, to_user_id, item_id, content, now)).lastrowid
+    conn.commit()
+    conv = conn.execute("SELECT user1_id, user2_id FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    counter = 'unread_count_user2' if from_user_id == conv['user1_id'] else 'unread_count_user1'
+    conn.execute(f"UPDATE conversations SET last_message_id = ?, last_updated = ?, {counter} = {counter} + 1 "
+                 f"WHERE id = ?", (message_id, now, conversation_id))
+    conn.commit()
+
+
+def run_scenario(name, senders, messages, synchronous, window_ms):
+    tmp = tempfile.mkdtemp()
+    app = create_app({
+        'DATABASE': os.path.join(tmp, 'bench.db'),
+        'TESTING': True,
+        'OFFLOAD_BLOCKING': True,
+        'DB_SYNCHRONOUS': synchronous,
+        'MESSAGE_GROUP_COMMIT_WINDOW_MS': window_ms,
+        'MAINTENANCE_LOCK_SWEEP_INTERVAL': 0,
+    })
+    from run import init_db
+    init_db(app)
+    with app.app_context():
+        conn = db.get_db()
+        for i in range(senders + 1):
+            conn.execute("INSERT INTO users (username, password) VALUES (?, 'x')", (f'user{i}',))
+        item_id = conn.execute("INSERT INTO items (seller_id, seller_name, title) VALUES (1, 'user0', 'bench')").lastrowid
+        conn.commit()
+
+    send = legacy_send if name == 'legacy' else Message.send
+
+    failures = []
+
+    def sender(user_id):
+        for n in range(messages):
+            with app.app_context():
+                try:
+                    send(user_id, 1, item_id, f'message {n}')
+                except sqlite3.OperationalError:
+                    # 旧实现先读后写，并发时锁升级失败会直接报 database is locked
+                    failures.append(user_id)
+
+    start = time.perf_counter()
+    pool = eventlet.GreenPool(senders)
+    for user_id in range(2, senders + 2):
+        pool.spawn(sender, user_id)
+    pool.waitall()
+    elapsed = time.perf_counter() - start
+
+    from app import group_commit
+    stats = group_commit.stats()
+    sent = senders * messages - len(failures)
+    return sent / elapsed, len(failures), stats['avg_batch'] if stats['enabled'] else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--senders', type=int, default=50, help='并发发送的 green thread 数')
+    parser.add_argument('--messages', type=int, default=40, help='每个 green thread 发送的消息数')
+    parser.add_argument('--synchronous', default='NORMAL', help='PRAGMA synchronous（FULL 时每次提交都 fsync）')
+    parser.add_argument('--window-ms', type=float, default=2.0, help='组提交窗口')
+    parser.add_argument('--skip-legacy', action='store_true', help='跳过旧实现（并发下会等满 busy_timeout，很慢）')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"senders={args.senders} messages/sender={args.messages} synchronous={args.synchronous}")
+    print(f"{'mode':>14} {'msg/s':>10} {'failed':>8} {'avg batch':>10}")
+    for name, window in (('legacy', 0), ('single-tx', 0), ('group-commit', args.window_ms)):
+        if name == 'legacy' and args.skip_legacy:
+            continue
+        rate, failed, batch = run_scenario(name, args.senders, args.messages, args.synchronous, window)
+        print(f"{name:>14} {rate:>10.0f} {failed:>8} {batch:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
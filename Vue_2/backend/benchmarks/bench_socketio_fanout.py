@@ -0,0 +1,135 @@
+# benchmarks/bench_socketio_fanout.py
+# 多进程部署下 new_message 的送达率和延迟：在子进程里用 eventlet.wsgi 启动 --servers 个后端进程（共用一个数据库），
+# --clients 个 Socket.IO 客户端（polling 传输）轮流连到各个进程，发送方轮流向各个进程 POST /api/messages，
+# 统计接收方实际收到的消息数和从发送到收到的延迟：
+#   none      不配置消息队列，只有接收方恰好连在处理这次 HTTP 请求的进程上时才能收到（约 1/servers）
+#   sqlite    SOCKETIO_MESSAGE_QUEUE='sqlite'，经 socketio_queue 表转发给所有进程
+#   cd Vue_2/backend && python benchmarks/bench_socketio_fanout.py [--servers 3] [--clients 24] [--messages 240]
+# serve / login 也被 tests/test_socketio_queue.py 使用。
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import socketio
+
+
+def serve(config, ready):
+    import eventlet
+    import eventlet.wsgi
+    from app import create_app, socketio as server_socketio
+    from app.chat import register_socketio_events
+
+    logging.disable(logging.CRITICAL)
+    app = create_app(dict(config, TESTING=True, AI_TAG_BACKEND='off', IMAGE_VARIANTS_ENABLED=False))
+    register_socketio_events(server_socketio)
+    listener = eventlet.listen(('127.0.0.1', 0))
+    ready.put(listener.getsockname()[1])
+    eventlet.wsgi.server(listener, app, log_output=False)
+
+
+def start_servers(count, config):
+    ctx = multiprocessing.get_context('fork')
+    ready = ctx.Queue()
+    processes = []
+    for _ in range(count):
+        process = ctx.Process(target=serve, args=(config, ready), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes, [ready.get(timeout=30) for _ in processes]
+
+
+def login(base, username):
+    requests.post(f"{base}/api/auth/register", json={'username': username, 'password': 'pw', 'email': f'{username}@bench'})
+    data = requests.post(f"{base}/api/auth/login", json={'username': username, 'password': 'pw'}).json()['data']
+    return data['user']['id'], data['access_token']
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def run_mode(name, queue, args):
+    from app import create_app
+    from run import init_db
+
+    # 先在本进程完成建表/迁移，避免多个后端进程同时迁移
+    database = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    logging.disable(logging.CRITICAL)
+    init_db(create_app({'DATABASE': database, 'TESTING': True}))
+
+    processes, ports = start_servers(args.servers, {'DATABASE': database, 'SOCKETIO_MESSAGE_QUEUE': queue})
+    bases = [f"http://127.0.0.1:{port}" for port in ports]
+    clients = []
+    try:
+        sender_id, sender_token = login(bases[0], 'sender')
+        sender_headers = {'Authorization': f"Bearer {sender_token}"}
+        item_id = requests.post(f"{bases[0]}/api/items", data={'title': 'bench item'},
+                                headers=sender_headers).json()['data']['id']
+
+        latencies = []
+        lock = threading.Lock()
+        receivers = []
+        for index in range(args.clients):
+            user_id, token = login(bases[0], f"receiver{index}")
+            client = socketio.Client(reconnection=False)
+
+            def on_message(data):
+                received_at = time.perf_counter()
+                with lock:
+                    latencies.append(received_at - float(data['content']))
+
+            client.on('new_message', on_message)
+            client.connect(bases[index % args.servers], auth={'token': token}, transports=['polling'])
+            clients.append(client)
+            receivers.append(user_id)
+        time.sleep(0.5)
+
+        session = requests.Session()
+        started = time.perf_counter()
+        for k in range(args.messages):
+            # 每一轮（所有接收方各一条）换一个进程处理 HTTP 请求，接收方均匀分布在各个进程上；
+            # content 里放发送时刻，接收方据此计算延迟（同一台机器上的 perf_counter）
+            base = bases[(k // len(receivers)) % args.servers]
+            session.post(f"{base}/api/messages", headers=sender_headers,
+                         json={'to_user_id': receivers[k % len(receivers)], 'item_id': item_id,
+                               'content': repr(time.perf_counter())})
+        send_rate = args.messages / (time.perf_counter() - started)
+        deadline = time.monotonic() + 3
+        while len(latencies) < args.messages and time.monotonic() < deadline:
+            time.sleep(0.05)
+        delivered = len(latencies)
+        print(f"{name:>7} {args.servers:>7} {send_rate:>9.0f} {delivered:>5}/{args.messages:<5} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f}")
+    finally:
+        for client in clients:
+            client.disconnect()
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--servers', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=24)
+    parser.add_argument('--messages', type=int, default=240)
+    args = parser.parse_args()
+
+    print(f"{'mode':>7} {'servers':>7} {'sent/s':>9} {'delivered':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    run_mode('none', None, args)
+    run_mode('sqlite', 'sqlite', args)
+
+
+if __name__ == '__main__':
+    main()
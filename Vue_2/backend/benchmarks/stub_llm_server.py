@@ -0,0 +1,98 @@
+# benchmarks/stub_llm_server.py
+# 本地 LLM 桩服务：模拟 Gemini REST 接口 POST /v1beta/models/<model>:generateContent，
+# 可配置延迟和失败率，用于在没有 API key / 网络的情况下测试 app/llm_client.py 的超时、重试和熔断
+# （tests/test_llm_client.py 和 bench_llm_client.py 都使用它）。
+#   cd Vue_2/backend && python benchmarks/stub_llm_server.py --port 8765 --latency-ms 200 --fail-rate 0.3
+# 然后在配置中设置 ai.base_url: http://127.0.0.1:8765，并设置任意 GEMINI_API_KEY。
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, latency_ms=0, fail_rate=0.0, fail_status=503, reply='二手 好物 used', fail_first=0):
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.reply = reply
+        self.fail_first = fail_first     # 前 fail_first 个请求一定失败，之后按 fail_rate
+        self.requests = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0          # 同时处理的请求数峰值，用于检查客户端的并发限制
+        self._lock = threading.Lock()
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            with state._lock:
+                state.requests += 1
+                fail = state.requests <= state.fail_first or random.random() < state.fail_rate
+                if fail:
+                    state.failed += 1
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            if state.latency_ms:
+                time.sleep(state.latency_ms / 1000.0)
+            with state._lock:
+                state.in_flight -= 1
+            if fail:
+                body = {'error': {'code': state.fail_status, 'message': 'stub failure', 'status': 'UNAVAILABLE'}}
+                status = state.fail_status
+            elif ':generateContent' in self.path:
+                body = {
+                    'candidates': [{
+                        'content': {'role': 'model', 'parts': [{'text': state.reply}]},
+                        'finishReason': 'STOP'
+                    }]
+                }
+                status = 200
+            else:
+                body = {'error': {'code': 404, 'message': f'unknown path {self.path}', 'status': 'NOT_FOUND'}}
+                status = 404
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端已超时断开
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(state, host='127.0.0.1', port=0):
+    """在后台线程启动桩服务，返回 (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--fail-status', type=int, default=503)
+    args = parser.parse_args()
+    state = StubState(args.latency_ms, args.fail_rate, args.fail_status)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Stub LLM server on http://{args.host}:{args.port} (latency={args.latency_ms}ms, fail_rate={args.fail_rate})")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
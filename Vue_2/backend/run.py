@@ -4,48 +4,145 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
-import re
 
 from omegaconf import DictConfig
 
 
-from app import create_app, db, socketio
+from app import create_app, db, socketio, scheduler, jobs
 from app.chat import register_socketio_events
+from app.migrate import upgrade, current_version
 def init_db(app):
-    """初始化数据库，创建所有必要的表"""
+    """初始化/升级数据库：按顺序执行 app/migrations 中尚未执行的迁移，不会删除已有数据"""
     # 确保实例文件夹存在
     os.makedirs(app.instance_path, exist_ok=True)
     
     db_path = app.config['DATABASE']
     logger.info(f"初始化数据库: {db_path}")
     
-    # 读取并执行 schema.sql
-    schema_path = 'app/schema.sql'
-    if not os.path.exists(schema_path):
-        logger.error(f"Schema文件不存在: {schema_path}")
-        return False
-    
+    conn = db.connect()
     try:
-        with open(schema_path, 'r', encoding='utf-8') as f:
-            schema = f.read()
-        
-        # 在应用上下文中使用 BoyaDatabase 执行 SQL
-        with app.app_context():
-            conn = db.get_db()
-            conn.executescript(schema)
-            conn.commit()
-            logger.info("数据库表创建成功")
-            
-            # 验证表是否创建成功
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            logger.debug(f"数据库中的表: {[table[0] for table in tables]}")
+        applied = upgrade(conn)
+        logger.info(f"数据库已是最新版本: {current_version(conn)}（本次执行 {len(applied)} 个迁移）")
         
+        # 验证表是否创建成功
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+        logger.debug(f"数据库中的表: {[table[0] for table in tables]}")
         return True
     except Exception as e:
         logger.error(f"初始化数据库时出错: {e}")
         return False
+    finally:
+        conn.close()
+
+def build_app_config(cfg):
+    """把 Hydra 配置中的各个分组转换成 Flask app.config 的覆盖项"""
+    overrides = {}
+    database = cfg.get('database')
+    if database:
+        overrides.update(
+            DB_POOL_SIZE=database.get('pool_size', 8),
+            DB_JOURNAL_MODE=database.get('journal_mode', 'WAL'),
+            DB_SYNCHRONOUS=database.get('synchronous', 'NORMAL'),
+            DB_FOREIGN_KEYS=database.get('foreign_keys', True),
+            DB_BUSY_TIMEOUT_MS=database.get('busy_timeout_ms', 5000),
+            DB_CACHE_SIZE_KB=database.get('cache_size_kb', 16384),
+            DB_MMAP_SIZE_MB=database.get('mmap_size_mb', 256),
+        )
+    auth = cfg.get('auth')
+    if auth:
+        overrides.update(
+            TOKEN_CACHE_SIZE=auth.get('token_cache_size', 4096),
+        )
+    entity_cache = cfg.get('entity_cache')
+    if entity_cache:
+        overrides.update(
+            ENTITY_CACHE_SIZE=entity_cache.get('size', 2048),
+            ENTITY_CACHE_TTL=entity_cache.get('ttl', 30),
+        )
+    executor = cfg.get('executor')
+    if executor:
+        overrides.update(
+            OFFLOAD_BLOCKING=executor.get('offload_blocking', True),
+            OFFLOAD_THREADS=executor.get('threads', 8),
+        )
+    chat = cfg.get('chat')
+    if chat:
+        overrides.update(
+            MESSAGE_GROUP_COMMIT_WINDOW_MS=chat.get('group_commit_window_ms', 0),
+            MESSAGE_GROUP_COMMIT_MAX_BATCH=chat.get('group_commit_max_batch', 64),
+            PRESENCE_BACKEND=chat.get('presence_backend', 'memory'),
+            PRESENCE_HEARTBEAT_INTERVAL=chat.get('presence_heartbeat_interval', 30),
+            PRESENCE_STALE_AFTER=chat.get('presence_stale_after', 120),
+            SOCKETIO_MESSAGE_QUEUE=chat.get('message_queue', None),
+            SOCKETIO_CHANNEL=chat.get('message_queue_channel', 'boya-market'),
+            SOCKETIO_QUEUE_POLL_MS=chat.get('message_queue_poll_ms', 50),
+            SOCKETIO_QUEUE_RETENTION_S=chat.get('message_queue_retention_s', 60),
+            TYPING_INTERVAL_MS=chat.get('typing_interval_ms', 500),
+            TYPING_TIMEOUT_S=chat.get('typing_timeout_s', 5),
+            SYNC_BATCH_SIZE=chat.get('sync_batch_size', 100),
+            SYNC_MAX_BATCHES=chat.get('sync_max_batches', 10),
+        )
+    maintenance = cfg.get('maintenance')
+    if maintenance:
+        overrides.update(
+            MAINTENANCE_LOCK_SWEEP_INTERVAL=maintenance.get('lock_sweep_interval', 60),
+            ITEM_LOCK_EXPIRY_HOURS=maintenance.get('item_lock_expiry_hours', 24),
+            MAINTENANCE_JOB_SWEEP_INTERVAL=maintenance.get('job_sweep_interval', 60),
+            MAINTENANCE_CACHE_SWEEP_INTERVAL=maintenance.get('cache_sweep_interval', 3600),
+            MAINTENANCE_TAG_MODEL_REBUILD_INTERVAL=maintenance.get('tag_model_rebuild_interval', 3600),
+            MAINTENANCE_IMAGE_GC_INTERVAL=maintenance.get('image_gc_interval', 300),
+            MAINTENANCE_CACHE_STATS_INTERVAL=maintenance.get('cache_stats_interval', 600),
+        )
+    job_queue = cfg.get('jobs')
+    if job_queue:
+        overrides.update(
+            JOB_WORKERS=job_queue.get('workers', 2),
+            JOB_POLL_INTERVAL=job_queue.get('poll_interval', 1.0),
+            JOB_MAX_ATTEMPTS=job_queue.get('max_attempts', 3),
+            JOB_RETRY_BACKOFF=job_queue.get('retry_backoff', 30),
+            JOB_STALE_AFTER=job_queue.get('stale_after', 600),
+            JOB_RETENTION_DAYS=job_queue.get('retention_days', 7),
+        )
+    images = cfg.get('images')
+    if images:
+        overrides.update(
+            IMAGE_VARIANTS_ENABLED=images.get('variants_enabled', True),
+            UPLOAD_MAX_FILE_SIZE=images.get('max_upload_size', 10 * 1024 * 1024),
+            UPLOAD_MAX_FORM_MEMORY=images.get('max_form_memory', 512 * 1024),
+            IMAGE_THUMB_SIZE=images.get('thumb_size', 320),
+            IMAGE_MEDIUM_SIZE=images.get('medium_size', 1024),
+            IMAGE_VARIANT_FORMAT=images.get('format', 'WEBP'),
+            IMAGE_VARIANT_QUALITY=images.get('quality', 80),
+            IMAGE_CACHE_MAX_AGE=images.get('cache_max_age', 365 * 24 * 3600),
+            IMAGE_SEND_BLOCK_SIZE=images.get('send_block_size', 256 * 1024),
+            IMAGE_SENDFILE=images.get('sendfile', None),
+            IMAGE_ACCEL_REDIRECT_PREFIX=images.get('accel_redirect_prefix', '/internal-images/'),
+            IMAGE_GC_GRACE_S=images.get('gc_grace_seconds', 3600),
+            IMAGE_GC_BATCH=images.get('gc_batch', 100),
+        )
+    ai = cfg.get('ai')
+    if ai:
+        overrides.update(
+            AI_TAG_BACKEND=ai.get('tag_backend', 'gemini'),
+            AI_FAKE_LATENCY_MS=ai.get('fake_latency_ms', 0),
+            AI_LOCAL_FALLBACK=ai.get('local_fallback', True),
+            TAG_SUGGEST_LIMIT=ai.get('suggest_limit', 8),
+            TAG_SUGGEST_NEIGHBOURS=ai.get('suggest_neighbours', 20),
+            TAG_SUGGEST_COOC_WEIGHT=ai.get('suggest_cooc_weight', 0.5),
+            AI_MODEL_NAME=ai.get('model', 'gemini-2.5-flash'),
+            AI_BASE_URL=ai.get('base_url', None),
+            AI_TIMEOUT_S=ai.get('timeout_s', 20),
+            AI_DEADLINE_S=ai.get('deadline_s', 60),
+            AI_MAX_RETRIES=ai.get('max_retries', 3),
+            AI_BACKOFF_BASE_S=ai.get('backoff_base_s', 0.5),
+            AI_BACKOFF_MAX_S=ai.get('backoff_max_s', 8),
+            AI_MAX_CONCURRENCY=ai.get('max_concurrency', 4),
+            AI_BREAKER_FAILURES=ai.get('breaker_failures', 5),
+            AI_BREAKER_RESET_S=ai.get('breaker_reset_s', 60),
+            AI_TAG_CACHE_SIZE=ai.get('tag_cache_size', 1024),
+            AI_TAG_CACHE_TTL=ai.get('tag_cache_ttl', 7 * 24 * 3600),
+        )
+    return overrides
 
 @hydra.main(version_base=None, config_path="conf", config_name="config1_wzy")
 def main(cfg: DictConfig):
@@ -58,53 +155,22 @@ def main(cfg: DictConfig):
     # Init Database
 
     # 创建Flask应用
-    app = create_app()
+    app = create_app(config_overrides=build_app_config(cfg))
     
-    # Init database(use instance/market.db), if not exist or not correct according to schema.sql, recreate it
-    # Init database(use instance/market.db), if not exist or not correct according to schema.sql, recreate it
-    db_path = app.config.get('DATABASE')
-    logger.info(f"Checking database at: {db_path}")
-
-    need_init = False
-    if not db_path or not os.path.exists(db_path):
-        logger.info("Database file missing -> will initialize.")
-        need_init = True
-    else:
-        try:
-            schema_path = 'app/schema.sql'
-            with open(schema_path, 'r', encoding='utf-8') as f:
-                schema = f.read()
-            # extract table names from CREATE TABLE statements
-            table_names = re.findall(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?["`]?([A-Za-z0-9_]+)["`]?', schema, flags=re.I)
-            with app.app_context():
-                conn = db.get_db()
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                existing = {row[0] for row in cursor.fetchall()}
-            missing = [t for t in table_names if t not in existing]
-            if missing:
-                logger.warning(f"Missing tables {missing} -> will reinitialize database.")
-                need_init = True
-            else:
-                logger.info("Database schema OK.")
-        except Exception as e:
-            logger.error(f"Error while verifying database schema: {e}. Will reinitialize.")
-            need_init = True
-
-    if need_init:
-        try:
-            if db_path and os.path.exists(db_path):
-                os.remove(db_path)
-                logger.info("Removed existing corrupted/old database file.")
-        except Exception as e:
-            logger.error(f"Failed to remove existing database file: {e}")
-        if not init_db(app):
-            logger.error("Database initialization failed. Exiting.")
-            return
+    # 数据库迁移：新库从头建表，旧库只执行缺少的迁移（加表、加索引），不再删库重建
+    if not init_db(app):
+        logger.error("Database initialization failed. Exiting.")
+        return
 
     # 注册SocketIO事件处理器
     register_socketio_events(socketio)
     logger.info("SocketIO事件处理器已注册")
+
+    # 启动后台维护任务（过期锁定释放等）
+    scheduler.start(socketio)
+
+    # 启动后台任务 worker（AI 标签生成等）
+    jobs.start(socketio)
     
     # 使用socketio.run启动（支持WebSocket）
     port = cfg.get('port', 5001)
@@ -0,0 +1,59 @@
+# tests/conftest.py
+# pytest 公共夹具：每个测试使用 tmp_path 下的新数据库（init_db 执行全部迁移），
+# AI 标签使用 fake 后端，不访问网络；不启动 worker / 调度器，由测试显式驱动。
+#   cd Vue_2/backend && python -m pytest -q
+import os
+import sys
+import logging
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# 本地 LLM 桩服务在 benchmarks/ 下，测试和基准共用
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from app import create_app, socketio
+from app.chat import register_socketio_events
+from run import init_db
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """按覆盖的配置创建 app，同一个测试里多次调用共用一个数据库文件"""
+    def factory(**overrides):
+        config = {
+            'DATABASE': str(tmp_path / 'test.db'),
+            'TESTING': True,
+            'AI_TAG_BACKEND': 'fake',
+            'IMAGE_VARIANTS_ENABLED': False,
+        }
+        config.update(overrides)
+        app = create_app(config)
+        init_db(app)
+        register_socketio_events(socketio)
+        return app
+
+    logging.disable(logging.WARNING)
+    yield factory
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """注册并登录，返回 (user_id, token)"""
+    def do_login(username, password='pw'):
+        client.post('/api/auth/register', json={'username': username, 'password': password, 'email': f'{username}@test'})
+        data = client.post('/api/auth/login', json={'username': username, 'password': password}).json['data']
+        return data['user']['id'], data['access_token']
+    return do_login
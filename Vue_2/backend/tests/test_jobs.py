@@ -0,0 +1,161 @@
+# tests/test_jobs.py
+# 后台任务队列（app/jobs.py）和 AI 标签任务（Item.generate_tags_job，fake 后端）
+import json
+import datetime
+
+from app import db, jobs, socketio
+from app.models import Item, AI_interface
+from app.search import FTS_TABLE, segment
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def job_rows(kind=None):
+    sql = "SELECT * FROM jobs" + (" WHERE kind = ?" if kind else "") + " ORDER BY id"
+    return db.get_db().execute(sql, (kind,) if kind else ()).fetchall()
+
+
+def publish(client, token, title='Road Bike', tags='Mountain-Bike'):
+    response = client.post('/api/items', data={'title': title, 'tags': tags}, headers=bearer(token))
+    assert response.status_code == 201
+    return response.json['data']['id']
+
+
+def test_publish_enqueues_tag_job(app, client, login):
+    seller_id, token = login('seller')
+    item_id = publish(client, token)
+    with app.app_context():
+        rows = job_rows(Item.TAG_JOB_KIND)
+    assert len(rows) == 1
+    assert rows[0]['status'] == 'pending'
+    assert json.loads(rows[0]['payload']) == {'item_id': item_id, 'seller_id': seller_id}
+
+
+def test_enqueue_rolls_back_with_business_data(app):
+    with app.app_context():
+        conn = db.get_db()
+        jobs.enqueue(conn, 'noop', {'n': 1})
+        conn.rollback()
+        assert job_rows('noop') == []
+
+
+def test_worker_writes_back_tags_reindexes_and_notifies(app, client, login):
+    seller_id, token = login('seller')
+    seller_socket = socketio.test_client(app, auth={'token': token})
+    seller_socket.get_received()
+    item_id = publish(client, token, tags='Mountain-Bike')
+
+    assert jobs.run_pending() == 1
+
+    expected = AI_interface.fake_generate_tags('Mountain-Bike')
+    assert expected == 'Mountain-Bike mountain bike'
+    assert client.get(f'/api/items/{item_id}').json['data']['tags'] == expected
+    with app.app_context():
+        job = job_rows(Item.TAG_JOB_KIND)[0]
+        fts_tags = db.get_db().execute(f"SELECT tags FROM {FTS_TABLE} WHERE rowid = ?", (item_id,)).fetchone()[0]
+    assert job['status'] == 'done' and job['attempts'] == 1
+    assert fts_tags == segment(expected)
+    events = [e for e in seller_socket.get_received() if e['name'] == 'item_tags_updated']
+    assert events and events[0]['args'][0] == {'item_id': item_id, 'tags': expected}
+    seller_socket.disconnect()
+
+
+def test_tag_job_keeps_tags_edited_meanwhile(app, client, login, monkeypatch):
+    seller_id, token = login('seller')
+    item_id = publish(client, token, tags='Mountain-Bike')
+    original = AI_interface.fake_generate_tags
+
+    def edit_then_generate(existing_tags, img_path=None, latency=0.0):
+        # 模拟生成期间卖家修改了标签（在线程池中执行，使用独立连接）
+        conn = db.connect()
+        conn.execute("UPDATE items SET tags = ? WHERE id = ?", ('seller edit', item_id))
+        conn.commit()
+        conn.close()
+        return original(existing_tags, img_path, latency)
+
+    monkeypatch.setattr(AI_interface, 'fake_generate_tags', staticmethod(edit_then_generate))
+    with app.app_context():
+        assert Item.generate_tags_job({'item_id': item_id}) == 'tags edited meanwhile'
+        tags = db.get_db().execute("SELECT tags FROM items WHERE id = ?", (item_id,)).fetchone()[0]
+    assert tags == 'seller edit'
+
+
+def test_tag_job_skips_removed_item(app, client, login):
+    seller_id, token = login('seller')
+    item_id = publish(client, token)
+    client.delete(f'/api/items/{item_id}', headers=bearer(token))
+    assert jobs.run_pending() == 1
+    with app.app_context():
+        assert Item.generate_tags_job({'item_id': item_id}) == 'item deleted'
+        assert db.get_db().execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE rowid = ?", (item_id,)).fetchone()[0] == 0
+
+
+def test_claim_is_exclusive(app):
+    with app.app_context():
+        conn = db.get_db()
+        jobs.enqueue(conn, 'noop', {})
+        conn.commit()
+        first, second = jobs.claim(), jobs.claim()
+    assert first is not None and first.kind == 'noop'
+    assert second is None
+
+
+def test_failed_job_backs_off_then_fails(make_app):
+    app = make_app(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=30)
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        raise RuntimeError('boom')
+
+    jobs.register('flaky', flaky)
+    with app.app_context():
+        conn = db.get_db()
+        jobs.enqueue(conn, 'flaky', {'n': 1})
+        conn.commit()
+
+    assert jobs.run_pending() == 1
+    with app.app_context():
+        job = job_rows('flaky')[0]
+    assert job['status'] == 'pending' and job['attempts'] == 1 and job['last_error'] == 'boom'
+    run_after = datetime.datetime.strptime(job['run_after'], '%Y-%m-%d %H:%M:%S')
+    assert run_after - datetime.datetime.now() > datetime.timedelta(seconds=25)
+
+    # 退避期间不会被取出
+    assert jobs.run_pending() == 0
+
+    with app.app_context():
+        conn = db.get_db()
+        conn.execute("UPDATE jobs SET run_after = ? WHERE id = ?", ('2000-01-01 00:00:00', job['id']))
+        conn.commit()
+    assert jobs.run_pending() == 1
+    with app.app_context():
+        job = job_rows('flaky')[0]
+    assert job['status'] == 'failed' and job['attempts'] == 2
+    assert len(calls) == 2
+
+
+def test_unknown_kind_fails_without_retry(app):
+    with app.app_context():
+        conn = db.get_db()
+        jobs.enqueue(conn, 'no-such-kind', {})
+        conn.commit()
+    assert jobs.run_pending() == 1
+    with app.app_context():
+        job = job_rows('no-such-kind')[0]
+    assert job['status'] == 'failed' and job['attempts'] == 1
+
+
+def test_requeue_stale_running_job(app):
+    with app.app_context():
+        conn = db.get_db()
+        jobs.enqueue(conn, 'noop', {})
+        conn.commit()
+        job = jobs.claim()
+        conn.execute("UPDATE jobs SET locked_at = ? WHERE id = ?", ('2000-01-01 00:00:00', job.id))
+        conn.commit()
+        assert db.run_transaction(jobs.requeue_stale, 600) == 1
+        row = job_rows('noop')[0]
+    assert row['status'] == 'pending' and row['last_error'] == 'worker lost'
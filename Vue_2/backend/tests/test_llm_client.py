@@ -0,0 +1,168 @@
+# tests/test_llm_client.py
+# LLMClient（app/llm_client.py）对本地桩服务（benchmarks/stub_llm_server.py）的调用：
+# 截止时间、带抖动的退避重试、并发限制、熔断的打开/半开/关闭，以及失败时回退到已有标签
+import time
+import threading
+
+import pytest
+
+pytest.importorskip('google.genai')
+
+from app import llm_client
+from app.llm_client import LLMClient, CircuitBreaker
+from app.models import AI_interface
+from stub_llm_server import StubState, start_stub_server
+
+
+@pytest.fixture
+def stub():
+    state = StubState()
+    server, base_url = start_stub_server(state)
+    yield state, base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_client(make_app, stub):
+    state, base_url = stub
+
+    def factory(**overrides):
+        config = {
+            'AI_API_KEY': 'stub',
+            'AI_BASE_URL': base_url,
+            'AI_TIMEOUT_S': 2,
+            'AI_DEADLINE_S': 5,
+            'AI_MAX_RETRIES': 3,
+            'AI_BACKOFF_BASE_S': 0.01,
+            'AI_BACKOFF_MAX_S': 0.05,
+            'AI_MAX_CONCURRENCY': 4,
+            'AI_BREAKER_FAILURES': 5,
+            'AI_BREAKER_RESET_S': 60,
+        }
+        config.update(overrides)
+        return LLMClient(make_app(**config))
+    return factory
+
+
+def test_success_reuses_one_client(make_client, stub):
+    state, _ = stub
+    client = make_client()
+    assert client.generate('tags') == state.reply
+    sdk_client = client._client
+    assert client.generate('tags') == state.reply
+    assert client._client is sdk_client
+    assert client.stats()['successes'] == 2 and state.requests == 2
+
+
+def test_retries_server_errors_then_succeeds(make_client, stub):
+    state, _ = stub
+    state.fail_first = 2
+    client = make_client()
+    assert client.generate('tags') == state.reply
+    assert state.requests == 3
+    assert client.retries == 2 and client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_gives_up_after_max_retries(make_client, stub):
+    state, _ = stub
+    state.fail_rate = 1.0
+    client = make_client(AI_MAX_RETRIES=2)
+    assert client.generate('tags') is None
+    assert state.requests == 3 and client.failures == 1
+
+
+def test_client_errors_are_not_retried_and_do_not_trip_breaker(make_client, stub):
+    state, _ = stub
+    state.fail_rate, state.fail_status = 1.0, 400
+    client = make_client(AI_BREAKER_FAILURES=1)
+    assert client.generate('tags') is None
+    assert state.requests == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_bounds_slow_calls(make_client, stub):
+    state, _ = stub
+    state.latency_ms = 1500
+    client = make_client(AI_TIMEOUT_S=0.3, AI_DEADLINE_S=0.8, AI_MAX_RETRIES=10)
+    started = time.monotonic()
+    assert client.generate('tags') is None
+    # 截止时间 0.8s：不会等到桩服务的 1.5s 响应，也不会把 10 次重试做完
+    assert time.monotonic() - started < 1.5
+    assert client.timeouts >= 1 and client.failures == 1
+
+
+def test_backoff_is_jittered_and_bounded(make_client):
+    client = make_client(AI_BACKOFF_BASE_S=0.1, AI_BACKOFF_MAX_S=0.5)
+    for attempt in range(6):
+        cap = min(0.5, 0.1 * 2 ** attempt)
+        delays = [client._backoff(attempt, remaining=10) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        assert len(set(delays)) > 1
+    # 不超过剩余时间
+    assert all(client._backoff(5, remaining=0.01) <= 0.01 for _ in range(50))
+
+
+def test_concurrency_limit(make_client, stub):
+    state, _ = stub
+    state.latency_ms = 100
+    client = make_client(AI_MAX_CONCURRENCY=2)
+    client.generate('warm up')     # 先创建 SDK 客户端，避免并发创建
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.generate('tags'))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [state.reply] * 6
+    assert state.max_in_flight <= 2
+
+
+def test_circuit_breaker_open_half_open_close(make_client, stub):
+    state, _ = stub
+    state.fail_rate = 1.0
+    client = make_client(AI_MAX_RETRIES=0, AI_BREAKER_FAILURES=2, AI_BREAKER_RESET_S=0.3)
+
+    assert client.generate('tags') is None
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.generate('tags') is None
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 打开期间直接失败，不发请求
+    requests = state.requests
+    assert client.generate('tags') is None
+    assert state.requests == requests and client.short_circuited == 1
+
+    # 过了重置时间放行一个试探请求；试探失败立即重新打开
+    time.sleep(0.35)
+    assert client.generate('tags') is None
+    assert state.requests == requests + 1
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 再次试探成功后关闭
+    time.sleep(0.35)
+    state.fail_rate = 0.0
+    assert client.generate('tags') == state.reply
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is False
+    breaker.release_trial()
+    assert breaker.allow() is True
+
+
+def test_generate_tags_falls_back_to_existing_tags(make_app, stub):
+    state, base_url = stub
+    state.fail_rate = 1.0
+    app = make_app(AI_TAG_BACKEND='gemini', AI_LOCAL_FALLBACK=False, AI_API_KEY='stub', AI_BASE_URL=base_url,
+                   AI_MAX_RETRIES=0, AI_BACKOFF_BASE_S=0.01)
+    with app.app_context():
+        assert AI_interface.generate_tags('二手 自行车') == '二手 自行车'
+        state.fail_rate = 0.0
+        assert AI_interface.generate_tags('二手 自行车') == '二手 自行车 ' + state.reply
+    assert llm_client.stats()['failures'] == 1
@@ -0,0 +1,115 @@
+# tests/test_socketio_queue.py
+# Socket.IO 的 sqlite 消息队列（app/socketio_queue.py）：两个后端进程共用一个数据库文件，
+# 在 A 进程上发送的 new_message / user_typing 推送到连在 B 进程上的客户端。
+# Flask-SocketIO 的 test_client 不支持消息队列，这里和 bench_socketio_fanout.py 一样启动真实的服务进程，
+# 用 python-socketio 客户端（polling 传输）连接。
+import time
+import pickle
+import datetime
+import threading
+import multiprocessing
+
+import pytest
+import requests
+import socketio as socketio_client
+
+from app import db
+from app.socketio_queue import SQLiteQueueManager
+from bench_socketio_fanout import serve, login
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def servers(app):
+    """两个服务进程 A、B，使用 conftest 已经迁移好的同一个数据库文件"""
+    # 测试进程里已经有 tpool 线程，fork 出来的子进程不可用，使用 spawn
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    config = {'DATABASE': app.config['DATABASE'], 'SOCKETIO_MESSAGE_QUEUE': 'sqlite', 'SOCKETIO_QUEUE_POLL_MS': 10}
+    processes = [ctx.Process(target=serve, args=(config, ready), daemon=True) for _ in range(2)]
+    for process in processes:
+        process.start()
+    try:
+        yield [f"http://127.0.0.1:{ready.get(timeout=60)}" for _ in processes]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+class Listener:
+    """连到某个服务进程的 Socket.IO 客户端，记录收到的事件"""
+
+    def __init__(self, base, token, events):
+        self.received = {name: [] for name in events}
+        self.arrived = threading.Event()
+        self.client = socketio_client.Client(reconnection=False)
+        for name in events:
+            self.client.on(name, self._recorder(name))
+        self.client.connect(base, auth={'token': token}, transports=['polling'])
+
+    def _recorder(self, name):
+        def record(data):
+            self.received[name].append(data)
+            self.arrived.set()
+        return record
+
+    def wait_for(self, name, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not self.received[name] and time.monotonic() < deadline:
+            self.arrived.wait(0.05)
+        assert self.received[name], f"{name} not received"
+        return self.received[name]
+
+    def close(self):
+        self.client.disconnect()
+
+
+def test_new_message_reaches_client_on_other_process(servers):
+    server_a, server_b = servers
+    seller_id, seller_token = login(server_a, 'seller')
+    buyer_id, buyer_token = login(server_a, 'buyer')
+    item_id = requests.post(f"{server_a}/api/items", data={'title': 'Road Bike'},
+                            headers=bearer(seller_token)).json()['data']['id']
+    buyer = Listener(server_b, buyer_token, ['new_message'])
+    try:
+        # B 进程的读取线程从连接之后的队列位置开始
+        time.sleep(0.2)
+        response = requests.post(f"{server_a}/api/messages", headers=bearer(seller_token),
+                                 json={'to_user_id': buyer_id, 'item_id': item_id, 'content': 'hello'})
+        assert response.status_code == 201
+        assert buyer.wait_for('new_message') == [response.json()['data']]
+    finally:
+        buyer.close()
+
+
+def test_user_typing_reaches_client_on_other_process(servers):
+    server_a, server_b = servers
+    seller_id, seller_token = login(server_a, 'seller')
+    buyer_id, buyer_token = login(server_a, 'buyer')
+    buyer = Listener(server_b, buyer_token, ['user_typing'])
+    seller = Listener(server_a, seller_token, [])
+    try:
+        time.sleep(0.2)
+        seller.client.emit('typing', {'to_user_id': buyer_id, 'item_id': 7, 'is_typing': True})
+        assert buyer.wait_for('user_typing') == [{'user_id': seller_id, 'item_id': 7, 'is_typing': True}]
+    finally:
+        seller.close()
+        buyer.close()
+
+
+def test_queue_payload_is_not_limited_to_json(app):
+    # 队列和 python-socketio 自带的 manager 一样用 pickle，emit 的数据里可以有 bytes / datetime
+    data = {'method': 'emit', 'event': 'raw', 'data': {'raw': b'\x00\xff', 'sent_at': datetime.datetime(2025, 11, 1, 12, 30)},
+            'namespace': '/', 'room': 'user_1', 'skip_sid': None, 'callback': None, 'host_id': 'a'}
+    with app.app_context():
+        publisher = SQLiteQueueManager(db, channel='test')
+        publisher._publish(data)
+        conn = db.connect()
+        rows = SQLiteQueueManager(db, channel='test')._fetch(conn, 0)
+        conn.close()
+    assert len(rows) == 1 and publisher.stats()['published'] == 1
+    assert pickle.loads(rows[0]['payload']) == data
@@ -1,5 +1,7 @@
 import os
 import uuid
+import json
+import base64
 from flask import jsonify
 from datetime import datetime
 
@@ -48,4 +50,20 @@ def save_uploaded_file(file, upload_folder):
 
 # 获取当前时间的 ISO 格式字符串
 def isoformat_now():
-    return datetime.utcnow().isoformat() + 'Z'
\ No newline at end of file
+    return datetime.utcnow().isoformat() + 'Z'
+
+# 分页游标：把排序键 (例如 [created_at, id]) 编码成不透明的字符串，前端原样回传即可
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+# 解码失败时抛出 ValueError
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return values